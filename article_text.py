@@ -0,0 +1,182 @@
+#!/usr/bin/env python3
+"""
+Full article text for feeds that only carry a teaser
+Linked pages are fetched in the background, reduced to their main text and cached on disk
+"""
+
+import hashlib
+import threading
+import urllib.parse
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from html.parser import HTMLParser
+
+from disk_cache import DiskCache
+
+FETCH_TIMEOUT = 15
+MAX_PAGE_BYTES = 2 * 1024 * 1024
+MIN_PARAGRAPH_LENGTH = 25
+
+SKIP_TAGS = {'script', 'style', 'noscript', 'template', 'nav', 'header', 'footer', 'aside',
+             'form', 'button', 'figure', 'figcaption', 'svg', 'iframe', 'select'}
+VOID_TAGS = {'area', 'base', 'br', 'col', 'embed', 'hr', 'img', 'input', 'link', 'meta',
+             'source', 'track', 'wbr'}
+UNLIKELY_HINTS = ('comment', 'share', 'social', 'related', 'promo', 'newsletter', 'sidebar',
+                  'advert', 'cookie', 'subscribe', 'footer', 'byline')
+CONTENT_TAGS = {'article', 'main'}
+
+class ReadabilityParser(HTMLParser):
+    """Scores the containers of <p> elements and keeps the best one's paragraphs
+
+    Every paragraph credits its parent fully and its grandparent by half, as in
+    Arc90 readability; <article> and <main> containers get a bonus.
+    """
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.stack = []          # (tag, node id, skipped)
+        self.tags = {}           # node id -> tag
+        self.node_count = 0
+        self.parts = None        # text pieces of the open paragraph
+        self.paragraphs = []     # (text, parent, grandparent) in document order
+        self.scores = {}
+
+    def skipped(self):
+        return bool(self.stack) and self.stack[-1][2]
+
+    def handle_starttag(self, tag, attrs):
+        if tag in VOID_TAGS:
+            if tag == 'br' and self.parts is not None:
+                self.parts.append(' ')
+            return
+        if tag == 'p':
+            self.close_paragraph()
+
+        hints = ' '.join(value or '' for name, value in attrs if name in ('class', 'id')).lower()
+        skipped = (self.skipped() or tag in SKIP_TAGS
+                   or any(hint in hints for hint in UNLIKELY_HINTS))
+        node = self.node_count
+        self.node_count += 1
+        self.tags[node] = tag
+        self.stack.append((tag, node, skipped))
+
+        if tag == 'p' and not skipped:
+            self.parts = []
+
+    def handle_endtag(self, tag):
+        if not any(open_tag == tag for open_tag, _, _ in self.stack):
+            return
+        while self.stack:
+            open_tag, _, _ = self.stack[-1]
+            if open_tag == 'p':
+                self.close_paragraph()
+            self.stack.pop()
+            if open_tag == tag:
+                return
+
+    def handle_data(self, data):
+        if self.parts is not None and not self.skipped():
+            self.parts.append(data)
+
+    def close_paragraph(self):
+        if self.parts is None:
+            return
+        text = ' '.join(''.join(self.parts).split())
+        self.parts = None
+        if len(text) < MIN_PARAGRAPH_LENGTH:
+            return
+
+        # The open <p> is on top of the stack, its containers below it
+        ancestors = [node for _, node, _ in self.stack[-3:-1]]
+        parent = ancestors[-1] if ancestors else None
+        grandparent = ancestors[0] if len(ancestors) == 2 else None
+        self.paragraphs.append((text, parent, grandparent))
+
+        score = 1 + text.count(',') + min(len(text) / 100, 3)
+        for node, share in ((parent, 1.0), (grandparent, 0.5)):
+            if node is not None:
+                self.scores[node] = self.scores.get(node, 0.0) + score * share
+
+    def text(self):
+        self.close_paragraph()
+        if not self.scores:
+            return ""
+        best = max(self.scores, key=lambda node: self.scores[node] * (1.25 if self.tags[node] in CONTENT_TAGS else 1.0))
+        return '\n\n'.join(text for text, parent, grandparent in self.paragraphs
+                           if best in (parent, grandparent))
+
+def extract_text(page):
+    """Main body text of an HTML page, paragraphs separated by blank lines"""
+    parser = ReadabilityParser()
+    parser.feed(page)
+    parser.close()
+    return parser.text()
+
+class ArticleTextCache:
+    """Background full-text fetcher backed by a size-capped disk cache
+
+    Entries are keyed by sha256 of the URL. Pages that yield no text are cached as
+    empty entries so they are not fetched again; each host gets at most
+    per_host concurrent downloads.
+    """
+
+    def __init__(self, directory, max_bytes, workers=4, per_host=2, log=print):
+        self.cache = DiskCache(directory, max_bytes)
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="fulltext")
+        self.per_host = per_host
+        self.log = log
+        self.host_limits = {}
+        self.pending = set()
+        self.failed = set()
+        self.lock = threading.Lock()
+
+    def key(self, url):
+        return hashlib.sha256(url.encode('utf-8')).hexdigest() + '.txt'
+
+    def get(self, url):
+        """Cached text for url, or None if it has not been extracted yet"""
+        data = self.cache.get(self.key(url))
+        return data.decode('utf-8') if data is not None else None
+
+    def request(self, url):
+        """Schedule extraction unless the url is cached, in flight or failed before"""
+        if not url:
+            return
+        with self.lock:
+            if url in self.pending or url in self.failed or self.key(url) in self.cache:
+                return
+            self.pending.add(url)
+        self.executor.submit(self.fetch, url)
+
+    def host_limit(self, url):
+        host = urllib.parse.urlsplit(url).netloc
+        with self.lock:
+            if host not in self.host_limits:
+                self.host_limits[host] = threading.Semaphore(self.per_host)
+            return self.host_limits[host]
+
+    def fetch(self, url):
+        try:
+            with self.host_limit(url):
+                request = urllib.request.Request(url, headers={'User-Agent': 'rss-mqtt-publisher/1.0'})
+                with urllib.request.urlopen(request, timeout=FETCH_TIMEOUT) as response:
+                    charset = response.headers.get_content_charset() or 'utf-8'
+                    page = response.read(MAX_PAGE_BYTES).decode(charset, 'replace')
+            text = extract_text(page)
+            self.cache.put(self.key(url), text.encode('utf-8'))
+        except Exception as e:
+            with self.lock:
+                self.failed.add(url)
+            self.log(f"Error extracting article text from {url}: {e}")
+        finally:
+            with self.lock:
+                self.pending.discard(url)
+
+    def stats(self):
+        stats = self.cache.stats()
+        stats['pending'] = len(self.pending)
+        stats['failed'] = len(self.failed)
+        return stats
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,256 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Several calendars behind one calendar/* view
+Every source (iCal URL, CalDAV collection, Google Calendar API) is fetched on its
+own schedule into its own cache; their start-sorted events are combined with a
+k-way heap merge and an event shared by several calendars is kept once
+
+~/.gcal_sources.json lists the sources, e.g.
+[
+  {"name": "work", "kind": "ical", "url": "https://.../basic.ics", "auth": "user:app-password"},
+  {"name": "personal", "kind": "caldav", "url": "https://.../events/",
+   "username": "me@example.com", "password": "app-password", "interval": 60},
+  {"name": "team", "kind": "google", "calendar_id": "team@group.calendar.google.com"}
+]
+"""
+
+import os
+import json
+import heapq
+import time
+from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from requests.auth import HTTPBasicAuth
+
+from ical_parser import ParsedCalendar, lines_from_chunks, validators_from, local_zone, READ_CHUNK_SIZE
+from recurrence import RecurrenceExpander
+
+SOURCES_FILE = os.path.expanduser("~/.gcal_sources.json")
+DEFAULT_INTERVAL = 300  # seconds between fetches of a source without its own "interval"
+RETRY_INTERVAL = 60  # seconds before a failed source is fetched again
+FETCH_TIMEOUT = 30
+MAX_WORKERS = 4  # sources fetched at the same time
+
+def default_log(message):
+    timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    print(f"[{timestamp}] {message}", flush=True)
+
+class CalendarSource:
+    """One calendar: its schedule, its raw events and its recurrence cache
+
+    Subclasses implement load(now, session), returning (events, changed) with events
+    shaped like ical_parser's, or raises on failure. Failures keep the events of
+    the last good fetch.
+    """
+
+    kind = None
+
+    def __init__(self, config, look_back_days, look_ahead_days, log):
+        self.name = config.get('name') or config.get('url') or config.get('calendar_id') or self.kind
+        self.interval = config.get('interval', DEFAULT_INTERVAL)
+        self.look_back_days = look_back_days
+        self.look_ahead_days = look_ahead_days
+        self.log = log
+        self.raw = []
+        self.recurrences = RecurrenceExpander()
+        self.next_fetch = None  # due at once
+        self.ok = False
+        self.failures = 0
+        self.last_error = ""
+        self.last_seconds = 0.0
+
+    def due(self, now):
+        return self.next_fetch is None or now >= self.next_fetch
+
+    def refresh(self, now, session):
+        """Fetch this source, returns True if its events changed"""
+        started = time.perf_counter()
+        try:
+            events, changed = self.load(now, session)
+        except Exception as e:
+            self.ok = False
+            self.failures += 1
+            self.last_error = str(e)
+            self.next_fetch = now + timedelta(seconds=RETRY_INTERVAL)
+            self.log(f"Calendar source {self.name}: fetch failed ({e})")
+            return False
+        finally:
+            self.last_seconds = time.perf_counter() - started
+
+        self.ok = True
+        self.failures = 0
+        self.raw = events
+        self.next_fetch = now + timedelta(seconds=self.interval)
+        return changed
+
+    def events(self, window_start, window_end):
+        """Events of the window sorted by start, recurring masters expanded"""
+        return self.recurrences.expand(self.raw, window_start, window_end)
+
+    def load(self, now, session):
+        raise NotImplementedError
+
+class IcalSource(CalendarSource):
+    """An iCal feed, fetched conditionally and parsed while it downloads"""
+
+    kind = 'ical'
+
+    def __init__(self, config, look_back_days, look_ahead_days, log):
+        super().__init__(config, look_back_days, look_ahead_days, log)
+        self.url = config['url']
+        auth = config.get('auth', '')
+        self.auth = HTTPBasicAuth(*auth.split(':', 1)) if ':' in auth else None
+        self.calendar = ParsedCalendar(look_back_days, look_ahead_days)
+
+    def load(self, now, session):
+        response = session.get(self.url, auth=self.auth, timeout=FETCH_TIMEOUT, stream=True,
+                               headers=self.calendar.conditional_headers(now))
+        with response:
+            if response.status_code == 304:
+                return self.calendar.not_modified()
+            response.raise_for_status()
+            encoding = response.encoding if 'charset' in response.headers.get('Content-Type', '').lower() else 'utf-8'
+            lines = lines_from_chunks(response.iter_content(READ_CHUNK_SIZE), encoding)
+            return self.calendar.update_stream(lines, now, validators_from(response.headers))
+
+class CaldavSource(CalendarSource):
+    """A CalDAV collection kept current with sync-collection reports (caldav package)"""
+
+    kind = 'caldav'
+
+    def __init__(self, config, look_back_days, look_ahead_days, log):
+        super().__init__(config, look_back_days, look_ahead_days, log)
+        self.config = config
+        self.store = None
+
+    def connect(self):
+        import caldav
+        from gcal_caldav_connector import EventStore
+
+        client = caldav.DAVClient(url=self.config['url'], username=self.config.get('username'),
+                                  password=self.config.get('password'))
+        return EventStore(client.calendar(url=self.config['url']))
+
+    def load(self, now, session):
+        if self.store is None:
+            self.store = self.connect()
+        changed = self.store.sync()
+        return [event for events in self.store.resources.values() for event in events], bool(changed)
+
+class GoogleSource(CalendarSource):
+    """One Google Calendar API calendar, synced incrementally with the gcal_authenticate token"""
+
+    kind = 'google'
+
+    def __init__(self, config, look_back_days, look_ahead_days, log):
+        super().__init__(config, look_back_days, look_ahead_days, log)
+        self.calendar_id = config.get('calendar_id', 'primary')
+        self.store = None
+
+    def load(self, now, session):
+        if self.store is None:
+            from gcal_mqtt_connector import GoogleEventStore, get_calendar_service
+            service = get_calendar_service()
+            if service is None:
+                raise RuntimeError("Google Calendar authentication required")
+            self.store = GoogleEventStore(service, self.calendar_id, self.look_back_days or 0,
+                                          self.look_ahead_days or 365)
+        changed = self.store.sync(now)
+        return [google_event(item) for item in self.store.items.values()], bool(changed)
+
+def google_timestamp(moment):
+    """RFC 3339 timestamp of a naive local datetime, as timeMin and timeMax expect it"""
+    zone = local_zone()
+    return (moment.replace(tzinfo=zone) if zone else moment.astimezone()).isoformat()
+
+def google_time(value):
+    """Naive local datetime of a Google start/end, all-day dates at midnight"""
+    if 'dateTime' in value:
+        moment = datetime.fromisoformat(value['dateTime'].replace('Z', '+00:00'))
+        return moment.astimezone(local_zone()).replace(tzinfo=None)
+    return datetime.strptime(value['date'], "%Y-%m-%d")
+
+def google_event(item):
+    """A Google Calendar API event in ical_parser's shape"""
+    return {
+        'summary': item.get('summary', ''),
+        'location': item.get('location', ''),
+        'description': item.get('description', ''),
+        'uid': item.get('iCalUID', item.get('id', '')),
+        'status': item.get('status', '').upper(),
+        'dtstart': google_time(item['start']),
+        'dtend': google_time(item['end']) if item.get('end') else None,
+        'all_day': 'date' in item['start'],
+    }
+
+SOURCE_KINDS = {source.kind: source for source in (IcalSource, CaldavSource, GoogleSource)}
+
+def merge_events(streams):
+    """k-way merge of start-sorted event lists
+
+    An event with the same UID and start in several calendars (a meeting in both
+    the work and the team calendar) is kept once. Duplicates share their start,
+    so only the UIDs seen at the current start are remembered.
+    """
+    start = None
+    seen = set()
+    for event in heapq.merge(*streams, key=lambda event: event['dtstart']):
+        if event['dtstart'] != start:
+            start = event['dtstart']
+            seen = set()
+        uid = event.get('uid')
+        if uid:
+            if uid in seen:
+                continue
+            seen.add(uid)
+        yield event
+
+class CalendarSources:
+    """All configured sources, fetched concurrently whenever any of them is due"""
+
+    def __init__(self, configs, look_back_days=None, look_ahead_days=None, log=None):
+        self.log = log or default_log
+        self.sources = []
+        for config in configs:
+            kind = SOURCE_KINDS.get(config.get('kind', 'ical'))
+            if kind is None:
+                self.log(f"Unknown calendar source kind {config.get('kind')!r} - skipped")
+                continue
+            self.sources.append(kind(config, look_back_days, look_ahead_days, self.log))
+        self.executor = ThreadPoolExecutor(max_workers=MAX_WORKERS, thread_name_prefix="calendar")
+
+    def __len__(self):
+        return len(self.sources)
+
+    def refresh(self, now, session=requests):
+        """Fetch every due source at the same time, returns True if any of them changed"""
+        due = [source for source in self.sources if source.due(now)]
+        results = list(self.executor.map(lambda source: source.refresh(now, session), due))
+        return any(results)
+
+    def next_fetch(self):
+        return min(source.next_fetch for source in self.sources)
+
+    def failing(self):
+        return [source.name for source in self.sources if not source.ok]
+
+    def events(self, window_start, window_end):
+        """Events of all sources in start order, shared events once"""
+        return list(merge_events(source.events(window_start, window_end) for source in self.sources))
+
+    def report(self):
+        return ", ".join(f"{source.name} {len(source.raw)} events {source.last_seconds * 1000:.0f} ms"
+                         + ("" if source.ok else f" FAILING ({source.last_error})")
+                         for source in self.sources)
+
+def load_sources(path=SOURCES_FILE, look_back_days=None, look_ahead_days=None, log=None):
+    """CalendarSources from the sources file, None without one (single-calendar mode)"""
+    if not os.path.exists(path):
+        return None
+    with open(path, encoding='utf-8') as f:
+        configs = json.load(f)
+    sources = CalendarSources(configs, look_back_days, look_ahead_days, log)
+    return sources if len(sources) else None
@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Start-sorted event index for the calendar publishers
+Next, ongoing and per-day queries are bisect lookups instead of list scans
+"""
+
+from bisect import bisect_left, bisect_right
+from datetime import datetime
+
+class EventIndex:
+    """Events sorted by start with a max-end segment tree over the same order
+
+    starts answers "next" and "events in a day" by bisection. The tree stores the
+    latest end of every range of events, so the first event that started by now
+    and has not ended yet is found by descending only into ranges whose max end
+    is still in the future.
+    """
+
+    def __init__(self, events):
+        self.events = sorted((event for event in events if event.get('dtstart')),
+                             key=lambda event: event['dtstart'])
+        self.starts = [event['dtstart'] for event in self.events]
+
+        self.size = 1
+        while self.size < len(self.events):
+            self.size *= 2
+        self.tree = [datetime.min] * (2 * self.size)
+        for position, event in enumerate(self.events):
+            end = event.get('dtend')
+            if isinstance(end, datetime) and isinstance(event['dtstart'], datetime):
+                self.tree[self.size + position] = end
+        for node in range(self.size - 1, 0, -1):
+            self.tree[node] = max(self.tree[2 * node], self.tree[2 * node + 1])
+
+    def __len__(self):
+        return len(self.events)
+
+    def next_after(self, moment):
+        """First event starting after moment"""
+        position = bisect_right(self.starts, moment)
+        return self.events[position] if position < len(self.events) else None
+
+    def ongoing(self, moment):
+        """First event (by start) with start <= moment < end"""
+        limit = bisect_right(self.starts, moment)
+        if limit == 0 or self.tree[1] <= moment:
+            return None
+        position = self.first_ending_after(1, 0, self.size, limit, moment)
+        return self.events[position] if position is not None else None
+
+    def first_ending_after(self, node, low, high, limit, moment):
+        if low >= limit or self.tree[node] <= moment:
+            return None
+        if high - low == 1:
+            return low
+        middle = (low + high) // 2
+        found = self.first_ending_after(2 * node, low, middle, limit, moment)
+        if found is None:
+            found = self.first_ending_after(2 * node + 1, middle, high, limit, moment)
+        return found
+
+    def current(self, moment):
+        """The event to show: the first ongoing one, else the next one"""
+        return self.ongoing(moment) or self.next_after(moment)
+
+    def starting_between(self, first, last):
+        """Events starting in [first, last]"""
+        return self.events[bisect_left(self.starts, first):bisect_right(self.starts, last)]
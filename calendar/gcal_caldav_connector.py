@@ -7,15 +7,21 @@ Uses CalDAV protocol with OAuth2 (same as third-party calendar apps)
 
 import sys
 import time
-import paho.mqtt.client as mqtt
 from datetime import datetime, timedelta
 import caldav
 from caldav.elements import dav
+from caldav.lib import error as caldav_error
 import requests
 from requests.auth import HTTPBasicAuth
 import json
 import os
 
+# mqtt_fanout.py lives in the project root (installed next to this script)
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from mqtt_fanout import MQTTFanout
+from ical_parser import parse_events
+from recurrence import RecurrenceExpander
+
 # Force unbuffered output
 sys.stdout.reconfigure(line_buffering=True)
 sys.stderr.reconfigure(line_buffering=True)
@@ -23,6 +29,10 @@ sys.stderr.reconfigure(line_buffering=True)
 # MQTT Configuration
 MQTT_BROKER = "localhost"
 MQTT_PORT = 1883
+MQTT_BROKERS = [
+    {"host": MQTT_BROKER, "port": MQTT_PORT},
+    # {"host": "office-pi.local", "port": 1883},
+]
 MQTT_TOPIC_NEXT_EVENT = "calendar/next/title"
 MQTT_TOPIC_NEXT_START = "calendar/next/start"
 MQTT_TOPIC_NEXT_END = "calendar/next/end"
@@ -37,8 +47,8 @@ MQTT_TOPIC_STATUS = "calendar/status"
 CALDAV_URL = "https://apidata.googleusercontent.com/caldav/v2/"
 CREDENTIALS_FILE = os.path.expanduser("~/.gcal_caldav_auth.json")
 
-# Update interval (seconds)
-UPDATE_INTERVAL = 300  # 5 minutes
+# Update interval (seconds) - a sync-collection poll only transfers what changed
+UPDATE_INTERVAL = 60
 
 def log(message):
     """Print log message with timestamp"""
@@ -143,55 +153,84 @@ def connect_caldav():
         log("Go to: https://myaccount.google.com/apppasswords")
         return None
 
-def get_events(calendar, start_date, end_date):
-    """Get events from calendar"""
-    try:
-        events = calendar.date_search(
-            start=start_date,
-            end=end_date,
-            expand=True
-        )
-
-        event_list = []
-        for event in events:
+def event_start(value):
+    """Start as a datetime, all-day dates at midnight"""
+    if isinstance(value, datetime):
+        return value
+    return datetime.combine(value, datetime.min.time())
+
+class EventStore:
+    """In-memory copy of the calendar, kept current with RFC 6578 sync-collection reports
+
+    The first sync loads every resource; later ones send the sync token and only
+    transfer resources that were added, changed or deleted since. A token the
+    server no longer accepts starts a full sync again.
+    """
+
+    def __init__(self, calendar):
+        self.calendar = calendar
+        self.collection = None
+        self.resources = {}  # url -> parsed events
+        self.recurrences = RecurrenceExpander()
+        self.full_syncs = 0
+        self.incremental_syncs = 0
+
+    def sync(self):
+        """Apply changes from the server, returns the number of changed resources"""
+        if self.collection is not None:
             try:
-                vevent = event.vobject_instance.vevent
-
-                # Extract event details
-                event_data = {
-                    'summary': getattr(vevent, 'summary', None),
-                    'dtstart': getattr(vevent, 'dtstart', None),
-                    'dtend': getattr(vevent, 'dtend', None),
-                    'location': getattr(vevent, 'location', None),
-                    'description': getattr(vevent, 'description', None),
-                }
-
-                # Get values
-                if event_data['summary']:
-                    event_data['summary'] = event_data['summary'].value
-                if event_data['dtstart']:
-                    event_data['dtstart'] = event_data['dtstart'].value
-                if event_data['dtend']:
-                    event_data['dtend'] = event_data['dtend'].value
-                if event_data['location']:
-                    event_data['location'] = event_data['location'].value
-                if event_data['description']:
-                    event_data['description'] = event_data['description'].value
-
-                event_list.append(event_data)
-
-            except Exception as e:
-                log(f"Error parsing event: {e}")
-                continue
-
-        # Sort by start time
-        event_list.sort(key=lambda x: x['dtstart'] if x['dtstart'] else datetime.max)
-
-        return event_list
+                updated, deleted = self.collection.sync()
+            except caldav_error.DAVError as e:
+                log(f"Sync token rejected ({e}) - starting a full sync")
+                self.collection = None
+            else:
+                for obj in updated:
+                    self.store(obj)
+                for obj in deleted:
+                    self.resources.pop(str(obj.url.canonical()), None)
+                self.incremental_syncs += 1
+                return len(updated) + len(deleted)
+
+        self.collection = self.calendar.objects_by_sync_token(load_objects=True)
+        self.resources = {}
+        for obj in self.collection:
+            self.store(obj)
+        self.full_syncs += 1
+        log(f"Full sync: {len(self.resources)} calendar resources")
+        return len(self.resources)
+
+    def store(self, obj):
+        if not obj.data:
+            return  # deleted between the report and the download
+        try:
+            self.resources[str(obj.url.canonical())] = parse_events(obj.data)
+        except Exception as e:
+            log(f"Error parsing event: {e}")
+
+    def events(self, start_date, end_date):
+        """Events overlapping the range, recurring ones expanded into their occurrences"""
+        events = [event for events in self.resources.values() for event in events]
+        for event in self.recurrences.expand(events, start_date, end_date):
+            end = event.get('dtend') or event['dtstart']
+            if end >= start_date and event['dtstart'] <= end_date:
+                yield event
+
+def get_events(store, start_date, end_date):
+    """Get events from the synced calendar"""
+    event_list = []
+    for event in store.events(start_date, end_date):
+        event_data = dict(event)
+        if event_data['all_day']:
+            # All-day events are dates, as vobject returned them
+            event_data['dtstart'] = event_data['dtstart'].date()
+            if event_data.get('dtend'):
+                event_data['dtend'] = event_data['dtend'].date()
+        event_list.append(event_data)
 
-    except Exception as e:
-        log(f"Error fetching events: {e}")
-        return []
+    # Sort by start time
+    event_list.sort(key=lambda x: event_start(x['dtstart']))
+
+    return event_list
 
 def publish_next_event(client, event):
     """Publish next upcoming event to MQTT"""
@@ -245,16 +284,8 @@ def main():
     log("Starting Google Calendar CalDAV MQTT Connector")
 
     # Connect to MQTT
-    mqtt_client = mqtt.Client()
-
-    try:
-        mqtt_client.connect(MQTT_BROKER, MQTT_PORT, 60)
-        log(f"Connected to MQTT broker at {MQTT_BROKER}:{MQTT_PORT}")
-    except Exception as e:
-        log(f"Failed to connect to MQTT broker: {e}")
-        sys.exit(1)
-
-    mqtt_client.loop_start()
+    mqtt_client = MQTTFanout(MQTT_BROKERS, log=log)
+    mqtt_client.start()
     mqtt_client.publish(MQTT_TOPIC_STATUS, "initializing", retain=True)
 
     # Connect to CalDAV
@@ -268,25 +299,32 @@ def main():
     mqtt_client.publish(MQTT_TOPIC_STATUS, "running", retain=True)
     log("CalDAV connection established")
 
+    store = EventStore(calendar)
+
     # Main loop
     while True:
         try:
-            # Get upcoming events (next 30 days)
+            changed = store.sync()
+            if changed and store.full_syncs + store.incremental_syncs > 1:
+                log(f"Synced {changed} changed calendar resources")
+
+            # One search from the start of today to 30 days ahead covers both views
             now = datetime.now()
-            future = now + timedelta(days=30)
+            today_start = now.replace(hour=0, minute=0, second=0, microsecond=0)
+            today_end = now.replace(hour=23, minute=59, second=59, microsecond=999999)
+            future = today_start + timedelta(days=30)  # day-aligned, so expansions stay cached all day
 
-            events = get_events(calendar, now, future)
+            all_events = get_events(store, today_start, future)
 
+            # Still running events come first, as the date search returned them
+            events = [e for e in all_events if event_start(e.get('dtend') or e['dtstart']) > now]
             if events:
                 publish_next_event(mqtt_client, events[0])
             else:
                 publish_next_event(mqtt_client, None)
 
             # Get today's events
-            today_start = now.replace(hour=0, minute=0, second=0, microsecond=0)
-            today_end = now.replace(hour=23, minute=59, second=59, microsecond=999999)
-
-            today_events = get_events(calendar, today_start, today_end)
+            today_events = [e for e in all_events if event_start(e['dtstart']) <= today_end]
             publish_today_events(mqtt_client, today_events)
 
             mqtt_client.publish(MQTT_TOPIC_STATUS, "running", retain=True)
@@ -6,24 +6,41 @@ Fetches iCal feed via CalDAV with authentication and publishes to MQTT
 """
 
 import sys
+import json
+import math
 import time
-import paho.mqtt.client as mqtt
+import threading
 from datetime import datetime, timedelta
-import re
 import os
+import argparse
 import requests
 from requests.auth import HTTPBasicAuth
 
+# mqtt_fanout.py lives in the project root (installed next to this script)
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from mqtt_fanout import MQTTFanout
+from ical_parser import ParsedCalendar, lines_from_chunks, validators_from, READ_CHUNK_SIZE
+from recurrence import RecurrenceExpander
+from event_index import EventIndex
+from calendar_sources import load_sources
+
 sys.stdout.reconfigure(line_buffering=True)
 sys.stderr.reconfigure(line_buffering=True)
 
 # Živý obraz API Configuration
 ZIVYOBRAZ_API_URL = "https://in.zivyobraz.eu/"
 ZIVYOBRAZ_IMPORT_KEY = "I5A4PqadNLn3gTiS"
+ZIVYOBRAZ_TIMEOUT = 5
+ZIVYOBRAZ_RETRY_MIN = 5  # seconds before a failed push is retried, doubled per failure
+ZIVYOBRAZ_RETRY_MAX = 300  # ... up to this
 
 # MQTT Configuration
 MQTT_BROKER = "localhost"
 MQTT_PORT = 1883
+MQTT_BROKERS = [
+    {"host": MQTT_BROKER, "port": MQTT_PORT},
+    # {"host": "office-pi.local", "port": 1883},
+]
 MQTT_TOPIC_NEXT_EVENT = "calendar/next/title"
 MQTT_TOPIC_NEXT_START = "calendar/next/start"
 MQTT_TOPIC_NEXT_END = "calendar/next/end"
@@ -36,29 +53,163 @@ MQTT_TOPIC_TODAY_LIST = "calendar/today/list"
 MQTT_TOPIC_TOMORROW_COUNT = "calendar/tomorrow/count"
 MQTT_TOPIC_TOMORROW_LIST = "calendar/tomorrow/list"
 MQTT_TOPIC_STATUS = "calendar/status"
+MQTT_TOPIC_PUSH_STATS = "calendar/zivyobraz/stats"  # retained JSON: push latency and failures
+
+# MQTT 5 mode: topic aliases for the per-minute topics, expiry for time_until
+MQTT_PROTOCOL = 4  # 5 enables MQTT v5
+MQTT_USER_PROPERTIES = [("publisher", "gcal-caldav")]
+MQTT_ALIAS_TOPICS = [MQTT_TOPIC_NEXT_TIME_UNTIL, MQTT_TOPIC_APPT]
+TIME_UNTIL_EXPIRY = 180  # seconds past its next possible change - gone soon if the connector stops
 
 UPDATE_INTERVAL = 300  # 5 minutes - calendar fetch interval
-MINUTE_CHECK_INTERVAL = 1  # 1 second - check for minute changes
+FETCH_RETRY_INTERVAL = 60  # seconds before a failed fetch is retried
+CHANGE_SETTLE = 0.01  # seconds past a change instant before values are recomputed
+STREAM_PARSE = True  # parse the calendar while it downloads instead of reading it whole
+LOOK_BACK_DAYS = 1  # events that ended earlier than this are dropped while parsing
+LOOK_AHEAD_DAYS = 60  # ... and so are events starting later than this
+
+ZIVYOBRAZ_ENABLED = True
+logging_enabled = True
+http = requests  # HTTP client for all requests - the unified runtime swaps in its shared Session
+
+NOT_MODIFIED = "not modified"  # fetch_ical() result for a 304 answer
+
+class Clock:
+    """Wall clock used by the scheduler and by get_time_until()"""
+
+    def now(self):
+        return datetime.now()
+
+    def sleep(self, seconds):
+        time.sleep(seconds)
+
+class SimulatedClock(Clock):
+    """Virtual clock - sleep() advances time instantly"""
+
+    def __init__(self, start):
+        self.current = start
+
+    def now(self):
+        return self.current
+
+    def sleep(self, seconds):
+        self.current += timedelta(seconds=seconds)
+
+clock = Clock()
 
 def log(message):
-    timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    if not logging_enabled:
+        return
+    timestamp = clock.now().strftime("%Y-%m-%d %H:%M:%S")
     print(f"[{timestamp}] {message}", flush=True)
 
-def push_to_zivyobraz(data):
-    """Push calendar data to Živý obraz API"""
-    try:
+class ZivyObrazPusher:
+    """Background pushes to the Živý obraz API
+
+    push() only records the latest values and returns at once. A worker thread
+    sends the keys that differ from what the API last acknowledged, so values
+    that change while a request is in flight are coalesced into the next one
+    and a failed push is retried, with backoff, with whatever is current then.
+    """
+
+    def __init__(self):
+        self.wanted = {}  # key -> latest value
+        self.acked = {}  # key -> value the API last accepted
+        self.condition = threading.Condition()
+        self.worker = None
+        self.session = None
+
+        self.pushes = 0
+        self.failures = 0
+        self.consecutive_failures = 0
+        self.total_seconds = 0.0
+        self.last_seconds = 0.0
+        self.max_seconds = 0.0
+        self.last_ok = None
+        self.last_error = ""
+
+    def push(self, data):
+        if not ZIVYOBRAZ_ENABLED:
+            return
+        with self.condition:
+            self.wanted.update(data)
+            if self.worker is None:
+                self.worker = threading.Thread(target=self.run, name="zivyobraz", daemon=True)
+                self.worker.start()
+            self.condition.notify()
+
+    def changes(self):
+        return {key: value for key, value in self.wanted.items() if self.acked.get(key) != value}
+
+    def run(self):
+        delay = ZIVYOBRAZ_RETRY_MIN
+        while True:
+            with self.condition:
+                while not self.changes():
+                    self.condition.wait()
+                batch = self.changes()
+
+            if self.send(batch):
+                with self.condition:
+                    self.acked.update(batch)
+                delay = ZIVYOBRAZ_RETRY_MIN
+            else:
+                # Nothing was acknowledged, the next attempt sends the then-current diff
+                time.sleep(delay)
+                delay = min(delay * 2, ZIVYOBRAZ_RETRY_MAX)
+
+    def send(self, batch):
+        # The unified runtime's shared session, else one kept for this worker
+        session = http if isinstance(http, requests.Session) else self.session
+        if session is None:
+            session = self.session = requests.Session()
+        if 'next_title' in batch:
+            log(f"Pushing next_title='{batch['next_title']}'")
+
         params = {'import_key': ZIVYOBRAZ_IMPORT_KEY}
-        params.update(data)
-        # Log what we're sending
-        if 'next_title' in data:
-            log(f"Pushing next_title='{data['next_title']}'")
-        response = requests.get(ZIVYOBRAZ_API_URL, params=params, timeout=5)
-        if response.status_code == 200:
-            log(f"Pushed {len(data)} values to Živý obraz")
-        else:
-            log(f"Živý obraz API returned status {response.status_code}")
-    except Exception as e:
-        log(f"Error pushing to Živý obraz: {e}")
+        params.update(batch)
+        started = time.perf_counter()
+        try:
+            response = session.get(ZIVYOBRAZ_API_URL, params=params, timeout=ZIVYOBRAZ_TIMEOUT)
+            error = "" if response.status_code == 200 else f"status {response.status_code}"
+        except requests.RequestException as e:
+            error = str(e)
+        seconds = time.perf_counter() - started
+
+        self.last_seconds = seconds
+        self.max_seconds = max(self.max_seconds, seconds)
+        if error:
+            self.failures += 1
+            self.consecutive_failures += 1
+            self.last_error = error
+            log(f"Error pushing to Živý obraz ({self.consecutive_failures} in a row): {error}")
+            return False
+
+        self.pushes += 1
+        self.total_seconds += seconds
+        self.last_ok = time.time()
+        if self.consecutive_failures:
+            log(f"Živý obraz push recovered after {self.consecutive_failures} failures")
+        self.consecutive_failures = 0
+        log(f"Pushed {len(batch)} values to Živý obraz in {seconds * 1000:.0f} ms")
+        return True
+
+    def stats(self):
+        with self.condition:
+            pending = len(self.changes())
+        return {
+            'pushes': self.pushes,
+            'failures': self.failures,
+            'consecutive_failures': self.consecutive_failures,
+            'pending': pending,
+            'last_ms': round(self.last_seconds * 1000, 1),
+            'avg_ms': round(self.total_seconds * 1000 / self.pushes, 1) if self.pushes else 0.0,
+            'max_ms': round(self.max_seconds * 1000, 1),
+            'last_ok': self.last_ok,
+            'last_error': self.last_error
+        }
+
+zivyobraz = ZivyObrazPusher()
 
 def load_auth():
     """Load CalDAV URL and authentication"""
@@ -79,94 +230,42 @@ def load_auth():
 
     return None, None
 
-def fetch_ical():
-    """Fetch iCal feed with authentication"""
+def stream_lines(response):
+    """Lines of a streamed response, read in chunks; the connection is closed at the end"""
+    with response:
+        encoding = 'utf-8'
+        if 'charset' in response.headers.get('Content-Type', '').lower():
+            encoding = response.encoding
+        yield from lines_from_chunks(response.iter_content(READ_CHUNK_SIZE), encoding)
+
+def fetch_ical(calendar):
+    """Fetch iCal feed with authentication, conditionally on what calendar holds
+
+    Returns (document, validators) where document is the text, or with
+    STREAM_PARSE an iterator over its lines that reads the response as it is
+    consumed. NOT_MODIFIED if the server says nothing changed, None on errors.
+    """
     url, auth = load_auth()
     if not url or not auth:
         log("ERROR: No authentication configured")
         return None
 
     try:
-        response = requests.get(url, auth=HTTPBasicAuth(*auth), timeout=30)
+        response = http.get(url, auth=HTTPBasicAuth(*auth), timeout=30, stream=STREAM_PARSE,
+                            headers=calendar.conditional_headers(clock.now()))
+        if response.status_code == 304:
+            response.close()
+            return NOT_MODIFIED
         if response.status_code == 200:
-            return response.text
-        else:
-            log(f"Error fetching calendar: HTTP {response.status_code}")
-            return None
+            document = stream_lines(response) if STREAM_PARSE else response.text
+            return document, validators_from(response.headers)
+        response.close()
+        log(f"Error fetching calendar: HTTP {response.status_code}")
+        return None
     except Exception as e:
         log(f"Error fetching calendar: {e}")
         return None
 
-def parse_datetime(dt_str):
-    """Parse iCal datetime string"""
-    try:
-        # Remove timezone info for simplicity
-        dt_str = dt_str.split(';')[0].replace('TZID=', '').split(':')[-1]
-
-        if 'T' in dt_str:
-            # DateTime
-            if 'Z' in dt_str:
-                return datetime.strptime(dt_str, "%Y%m%dT%H%M%SZ")
-            else:
-                return datetime.strptime(dt_str, "%Y%m%dT%H%M%S")
-        else:
-            # Date only
-            return datetime.strptime(dt_str, "%Y%m%d")
-    except:
-        return None
-
-def parse_ical_events(ical_data):
-    """Parse events from iCal data"""
-    events = []
-
-    # Split into individual events
-    vevent_pattern = r'BEGIN:VEVENT(.*?)END:VEVENT'
-    vevents = re.findall(vevent_pattern, ical_data, re.DOTALL)
-
-    for vevent in vevents:
-        try:
-            event = {}
-
-            # Extract fields
-            summary_match = re.search(r'SUMMARY:(.*?)$', vevent, re.MULTILINE)
-            if summary_match:
-                event['summary'] = summary_match.group(1).strip()
-
-            dtstart_match = re.search(r'DTSTART[;:]([^\r\n]+)', vevent)
-            if dtstart_match:
-                event['dtstart'] = parse_datetime(dtstart_match.group(1))
-
-            dtend_match = re.search(r'DTEND[;:]([^\r\n]+)', vevent)
-            if dtend_match:
-                event['dtend'] = parse_datetime(dtend_match.group(1))
-
-            location_match = re.search(r'LOCATION:(.*?)$', vevent, re.MULTILINE)
-            if location_match:
-                event['location'] = location_match.group(1).strip()
-
-            # Extract description (can span multiple lines with continuation)
-            description_match = re.search(r'DESCRIPTION:(.*?)(?=\r?\n[A-Z]|\r?\nEND:VEVENT)', vevent, re.DOTALL)
-            if description_match:
-                desc = description_match.group(1)
-                # Remove line continuations (lines starting with space)
-                desc = re.sub(r'\r?\n ', '', desc)
-                # Unescape iCal sequences
-                desc = desc.replace('\\n', '\n').replace('\\,', ',').replace('\\;', ';').replace('\\\\', '\\')
-                # Limit to 700 characters
-                if len(desc) > 700:
-                    desc = desc[:700] + '...'
-                event['description'] = desc.strip()
-
-            if event.get('dtstart'):
-                events.append(event)
-
-        except Exception as e:
-            continue
-
-    # Sort by start time
-    events.sort(key=lambda x: x.get('dtstart', datetime.max))
-    return events
-
 def format_datetime(dt):
     if isinstance(dt, datetime):
         return dt.strftime("%d.%m.%Y %H:%M")
@@ -186,7 +285,7 @@ def get_time_until(start_dt, end_dt=None):
     if not isinstance(start_dt, datetime):
         return ""
 
-    now = datetime.now()
+    now = clock.now()
     delta = start_dt - now
     total_seconds = delta.total_seconds()
 
@@ -247,77 +346,108 @@ def get_time_until(start_dt, end_dt=None):
     else:
         return f"{time_str}on {day_name}"
 
-def publish_events(client, all_events):
-    """Publish events to MQTT"""
-    now = datetime.now()
-
-    # First check for ongoing events (started but not ended)
-    ongoing = [e for e in all_events if e.get('dtstart') and e.get('dtend') and
-               isinstance(e['dtstart'], datetime) and isinstance(e['dtend'], datetime) and
-               e['dtstart'] <= now < e['dtend']]
-
-    # Get upcoming events
-    upcoming = [e for e in all_events if e.get('dtstart') and e['dtstart'] > now]
+def time_until_boundary(event, now):
+    """Next instant get_time_until() output for event changes, None if only at midnight"""
+    start, end = event['dtstart'], event.get('dtend')
+    if not isinstance(start, datetime):
+        return None
+    if start <= now:
+        # Ongoing: "over in ..." counts down by the minute
+        anchor, step = end, 60
+    elif start.date() == now.date():
+        # "in 3h" changes hourly, "in 1h 59m" and "in 5m" every minute
+        anchor, step = start, 3600 if (start - now).total_seconds() >= 7200 else 60
+    else:
+        return None  # "tomorrow" / "on Friday" only change at midnight
+    # The shown count is int(remaining / step); it drops as remaining passes below a multiple
+    steps = math.floor((anchor - now).total_seconds() / step)
+    return anchor - timedelta(seconds=steps * step)
+
+def next_change(index, now):
+    """Earliest instant at which any published calendar value can change"""
+    candidates = [datetime.combine(now.date() + timedelta(days=1), datetime.min.time())]
+    event = index.current(now)
+    if event:
+        candidates.append(time_until_boundary(event, now))
+    upcoming = index.next_after(now)
+    if upcoming:
+        candidates.append(upcoming['dtstart'])
+    return min(candidate for candidate in candidates if candidate)
+
+def publish_changed(client, state, topic, payload, **kwargs):
+    """Publish a retained value only when it differs from the last one sent"""
+    if state.published.get(topic) == payload:
+        return False
+    client.publish(topic, payload, retain=True, **kwargs)
+    state.published[topic] = payload
+    return True
+
+def publish_events(client, state):
+    """Publish the calendar values that changed and schedule the next change"""
+    now = clock.now()
+    index = state.index
+    state.next_change = next_change(index, now)
 
     # Prioritize ongoing events, then upcoming
-    event = None
-    if ongoing:
-        event = ongoing[0]  # Show the first ongoing event
-    elif upcoming:
-        event = upcoming[0]
+    event = index.current(now)
 
     # Publish next event
     if event:
         time_until = get_time_until(event.get('dtstart'), event.get('dtend'))
 
-        client.publish(MQTT_TOPIC_NEXT_EVENT, event.get('summary', ''), retain=True)
-        client.publish(MQTT_TOPIC_NEXT_START, format_datetime(event.get('dtstart')), retain=True)
-        client.publish(MQTT_TOPIC_NEXT_END, format_datetime(event.get('dtend')), retain=True)
-        client.publish(MQTT_TOPIC_NEXT_LOCATION, event.get('location', ''), retain=True)
-        client.publish(MQTT_TOPIC_NEXT_DESCRIPTION, event.get('description', '')[:500], retain=True)
-        client.publish(MQTT_TOPIC_NEXT_TIME_UNTIL, time_until, retain=True)
+        if publish_changed(client, state, MQTT_TOPIC_NEXT_EVENT, event.get('summary', '')):
+            log(f"Published next event: {event.get('summary', 'Unknown')}")
+        publish_changed(client, state, MQTT_TOPIC_NEXT_START, format_datetime(event.get('dtstart')))
+        publish_changed(client, state, MQTT_TOPIC_NEXT_END, format_datetime(event.get('dtend')))
+        publish_changed(client, state, MQTT_TOPIC_NEXT_LOCATION, event.get('location', ''))
+        publish_changed(client, state, MQTT_TOPIC_NEXT_DESCRIPTION, event.get('description', '')[:500])
+
+        # The value may now stay put for hours, so it expires TIME_UNTIL_EXPIRY after
+        # the next instant it could change rather than a fixed time after publishing
+        if time_until != state.published.get(MQTT_TOPIC_NEXT_TIME_UNTIL) or state.time_until_valid <= state.next_change:
+            expiry = (state.next_change - now).total_seconds() + TIME_UNTIL_EXPIRY
+            client.publish(MQTT_TOPIC_NEXT_TIME_UNTIL, time_until, retain=True, expiry=math.ceil(expiry))
+            state.published[MQTT_TOPIC_NEXT_TIME_UNTIL] = time_until
+            state.time_until_valid = now + timedelta(seconds=expiry)
 
         # Publish combined appt topic
         appt_text = event.get('summary', '') + " " + time_until
-        client.publish(MQTT_TOPIC_APPT, appt_text, retain=True)
-
-        log(f"Published next event: {event.get('summary', 'Unknown')}")
+        publish_changed(client, state, MQTT_TOPIC_APPT, appt_text)
     else:
-        client.publish(MQTT_TOPIC_NEXT_EVENT, "", retain=True)
-        client.publish(MQTT_TOPIC_APPT, "", retain=True)
-        log("No upcoming events")
+        if publish_changed(client, state, MQTT_TOPIC_NEXT_EVENT, ""):
+            log("No upcoming events")
+        publish_changed(client, state, MQTT_TOPIC_APPT, "")
 
     # Get today's events
     today_start = now.replace(hour=0, minute=0, second=0, microsecond=0)
     today_end = now.replace(hour=23, minute=59, second=59)
-    today_events = [e for e in all_events if e.get('dtstart') and today_start <= e['dtstart'] <= today_end]
-
-    client.publish(MQTT_TOPIC_TODAY_COUNT, str(len(today_events)), retain=True)
+    today_events = index.starting_between(today_start, today_end)
 
     today_list = []
     for today_event in today_events:
         time_range = format_time_range(today_event.get('dtstart'), today_event.get('dtend'))
         today_list.append(f"{time_range}  {today_event.get('summary', '')}")
 
-    client.publish(MQTT_TOPIC_TODAY_LIST, '\n'.join(today_list) if today_list else "No appointments", retain=True)
-    log(f"Published {len(today_events)} events for today")
+    publish_changed(client, state, MQTT_TOPIC_TODAY_COUNT, str(len(today_events)))
+    if publish_changed(client, state, MQTT_TOPIC_TODAY_LIST, '\n'.join(today_list) if today_list else "No appointments"):
+        log(f"Published {len(today_events)} events for today")
 
     # Get tomorrow's events
     tomorrow_start = (now + timedelta(days=1)).replace(hour=0, minute=0, second=0, microsecond=0)
     tomorrow_end = (now + timedelta(days=1)).replace(hour=23, minute=59, second=59)
-    tomorrow_events = [e for e in all_events if e.get('dtstart') and tomorrow_start <= e['dtstart'] <= tomorrow_end]
-
-    client.publish(MQTT_TOPIC_TOMORROW_COUNT, str(len(tomorrow_events)), retain=True)
+    tomorrow_events = index.starting_between(tomorrow_start, tomorrow_end)
 
     tomorrow_list = []
     for tomorrow_event in tomorrow_events:
         time_range = format_time_range(tomorrow_event.get('dtstart'), tomorrow_event.get('dtend'))
         tomorrow_list.append(f"{time_range}  {tomorrow_event.get('summary', '')}")
 
-    client.publish(MQTT_TOPIC_TOMORROW_LIST, '\n'.join(tomorrow_list) if tomorrow_list else "No appointments", retain=True)
-    log(f"Published {len(tomorrow_events)} events for tomorrow")
+    publish_changed(client, state, MQTT_TOPIC_TOMORROW_COUNT, str(len(tomorrow_events)))
+    if publish_changed(client, state, MQTT_TOPIC_TOMORROW_LIST,
+                       '\n'.join(tomorrow_list) if tomorrow_list else "No appointments"):
+        log(f"Published {len(tomorrow_events)} events for tomorrow")
 
-    # Push to Živý obraz API
+    # Push to Živý obraz API - the worker sends only what changed since the last acknowledged push
     zivyobraz_data = {
         'next_title': event.get('summary', '') if event else '',
         'next_start': format_datetime(event.get('dtstart')) if event else '',
@@ -331,91 +461,206 @@ def publish_events(client, all_events):
         'tomorrow_count': str(len(tomorrow_events)),
         'tomorrow_list': '\n'.join(tomorrow_list) if tomorrow_list else "No appointments"
     }
-    push_to_zivyobraz(zivyobraz_data)
-
-def update_time_sensitive_topics(client, all_events):
-    """Update only time_until and appt topics (called every minute)"""
-    now = datetime.now()
-
-    # First check for ongoing events (started but not ended)
-    ongoing = [e for e in all_events if e.get('dtstart') and e.get('dtend') and
-               isinstance(e['dtstart'], datetime) and isinstance(e['dtend'], datetime) and
-               e['dtstart'] <= now < e['dtend']]
-
-    # Get upcoming events
-    upcoming = [e for e in all_events if e.get('dtstart') and e['dtstart'] > now]
-
-    # Prioritize ongoing events, then upcoming
-    event = None
-    if ongoing:
-        event = ongoing[0]
-    elif upcoming:
-        event = upcoming[0]
-
-    if event:
-        time_until = get_time_until(event.get('dtstart'), event.get('dtend'))
-
-        client.publish(MQTT_TOPIC_NEXT_TIME_UNTIL, time_until, retain=True)
-
-        appt_text = event.get('summary', '') + " " + time_until
-        client.publish(MQTT_TOPIC_APPT, appt_text, retain=True)
-
-        # Push time-sensitive updates to Živý obraz API (only time_until and appt)
-        zivyobraz_data = {
-            'next_time_until': time_until,
-            'appt': appt_text
-        }
-        push_to_zivyobraz(zivyobraz_data)
+    zivyobraz.push(zivyobraz_data)
+
+class CalendarState:
+    """Scheduling state of the main loop"""
+
+    def __init__(self, sources=None):
+        self.index = EventIndex([])  # Events of the last fetch
+        self.sources = sources  # CalendarSources, None for the single calendar of load_auth()
+        self.calendar = ParsedCalendar(LOOK_BACK_DAYS, LOOK_AHEAD_DAYS)
+        self.recurrences = RecurrenceExpander()
+        self.next_fetch = clock.now()  # Force immediate fetch
+        self.next_change = None  # when a published value can change next
+        self.published = {}  # topic -> last retained payload
+        self.time_until_valid = clock.now()  # when the retained time_until expires
+        # Held while the index is swapped and topics are published: the unified runtime runs
+        # fetches and change checks on different executor threads
+        self.lock = threading.Lock()
+
+def tick(client, state, fetch=None):
+    """One iteration of the main loop, returns the seconds until the next one is due"""
+    if clock.now() >= state.next_fetch:
+        fetch_calendar(client, state, fetch)
+
+    check_changes(client, state)
+    return seconds_until_due(state)
+
+def seconds_until_due(state):
+    """Sleep until the next fetch or the next change, whichever comes first"""
+    due = min(state.next_fetch, state.next_change or state.next_fetch)
+    # Values flip just after a boundary instant, not exactly on it
+    return max(0.0, (due - clock.now()).total_seconds()) + CHANGE_SETTLE
+
+def load_calendar_sources():
+    """Sources from calendar_sources.SOURCES_FILE, None to use the single calendar"""
+    sources = load_sources(look_back_days=LOOK_BACK_DAYS, look_ahead_days=LOOK_AHEAD_DAYS, log=log)
+    if sources:
+        log(f"Merging {len(sources)} calendar sources")
+    return sources
+
+def fetch_calendar(client, state, fetch=None):
+    """Fetch the calendar, or every source that is due, and publish the result"""
+    if state.sources:
+        refresh_sources(client, state)
+    else:
+        refresh_calendar(client, state, (fetch or fetch_ical)(state.calendar))
+
+def refresh_sources(client, state):
+    """Fetch the due sources concurrently and publish the merge of all of them"""
+    sources = state.sources
+    if sources.refresh(clock.now(), http):
+        log(f"Calendar sources updated: {sources.report()}")
+    today_start = clock.now().replace(hour=0, minute=0, second=0, microsecond=0)
+    index = EventIndex(sources.events(today_start, today_start + timedelta(days=2)))
+
+    failing = sources.failing()
+    if len(failing) == len(sources):
+        status = "error: fetch failed"
+    elif failing:
+        status = f"running ({', '.join(failing)} failing)"
+    else:
+        status = "running"
+    with state.lock:
+        state.index = index
+        publish_events(client, state)
+        publish_changed(client, state, MQTT_TOPIC_STATUS, status)
+        if ZIVYOBRAZ_ENABLED:
+            publish_changed(client, state, MQTT_TOPIC_PUSH_STATS, json.dumps(zivyobraz.stats()))
+        state.next_fetch = sources.next_fetch()
+
+def refresh_calendar(client, state, fetched):
+    """Parse freshly fetched calendar data and publish all event topics"""
+    if fetched:
+        try:
+            if fetched is NOT_MODIFIED:
+                events, changed = state.calendar.not_modified()
+            else:
+                document, validators = fetched
+                update = state.calendar.update if isinstance(document, str) else state.calendar.update_stream
+                events, changed = update(document, clock.now(), validators)
+        except Exception as e:
+            # A dropped connection mid-stream leaves the previous events in place
+            log(f"Error reading calendar: {e}")
+            with state.lock:
+                publish_changed(client, state, MQTT_TOPIC_STATUS, "error: fetch failed")
+                state.next_fetch = clock.now() + timedelta(seconds=FETCH_RETRY_INTERVAL)
+            return
+        log(f"Calendar {'updated' if changed else 'unchanged'}: {state.calendar.report()}")
+        # Recurring events only need today and tomorrow (plus their next occurrence)
+        today_start = clock.now().replace(hour=0, minute=0, second=0, microsecond=0)
+        index = EventIndex(state.recurrences.expand(events, today_start, today_start + timedelta(days=2)))
+        with state.lock:
+            state.index = index
+            publish_events(client, state)
+            publish_changed(client, state, MQTT_TOPIC_STATUS, "running")
+            state.next_fetch = clock.now() + timedelta(seconds=UPDATE_INTERVAL)
+            if ZIVYOBRAZ_ENABLED:
+                publish_changed(client, state, MQTT_TOPIC_PUSH_STATS, json.dumps(zivyobraz.stats()))
+    else:
+        log("Failed to fetch calendar data")
+        with state.lock:
+            publish_changed(client, state, MQTT_TOPIC_STATUS, "error: fetch failed")
+            state.next_fetch = clock.now() + timedelta(seconds=FETCH_RETRY_INTERVAL)
+
+def check_changes(client, state):
+    """Republish once the next change instant has passed"""
+    with state.lock:
+        if state.next_change and clock.now() >= state.next_change:
+            publish_events(client, state)
+
+class SimulatedBroker:
+    """Stand-in for the MQTT broker, records what would have been published"""
+
+    def __init__(self):
+        self.message_count = 0
+        self.topic_counts = {}
+        self.retained = {}
+
+    def publish(self, topic, payload=None, qos=0, retain=False, expiry=None):
+        self.message_count += 1
+        self.topic_counts[topic] = self.topic_counts.get(topic, 0) + 1
+        if retain:
+            self.retained[topic] = payload
+
+def simulate(days, ics_file, start=None, verbose=False):
+    """Fast-forward virtual time over a local .ics file and report the publish volume"""
+    global clock, logging_enabled, ZIVYOBRAZ_ENABLED
+
+    with open(ics_file, encoding='utf-8') as f:
+        ical_data = f.read()
+
+    clock = SimulatedClock(start or datetime.now().replace(microsecond=0))
+    logging_enabled = verbose
+    ZIVYOBRAZ_ENABLED = False
+    broker = SimulatedBroker()
+    state = CalendarState()
+
+    virtual_start = clock.now()
+    virtual_end = virtual_start + timedelta(days=days)
+    cpu_start = time.process_time()
+    wall_start = time.perf_counter()
+
+    wakeups = 0
+    while clock.now() < virtual_end:
+        clock.sleep(tick(broker, state, fetch=lambda calendar: (ical_data, {})))
+        wakeups += 1
+
+    cpu_seconds = time.process_time() - cpu_start
+    wall_seconds = time.perf_counter() - wall_start
+    virtual_hours = (clock.now() - virtual_start).total_seconds() / 3600
+
+    logging_enabled = True
+    log(f"Simulated {virtual_hours:.0f} virtual hours in {wall_seconds:.1f}s, "
+        f"{wakeups} wakeups ({wakeups / virtual_hours:.0f} per virtual hour)")
+    log(f"Messages that would be published: {broker.message_count} "
+        f"({broker.message_count / virtual_hours:.0f} per virtual hour)")
+    for topic, count in sorted(broker.topic_counts.items(), key=lambda item: -item[1]):
+        log(f"  {topic}: {count}")
+    log(f"Compute cost: {cpu_seconds * 1000 / virtual_hours:.2f} ms CPU per virtual hour")
+
+    return broker
 
 def main():
     log("Starting Google Calendar CalDAV MQTT Connector (enhanced time format)")
 
     # Connect to MQTT
-    client = mqtt.Client()
-    try:
-        client.connect(MQTT_BROKER, MQTT_PORT, 60)
-        log(f"Connected to MQTT broker at {MQTT_BROKER}:{MQTT_PORT}")
-    except Exception as e:
-        log(f"Failed to connect to MQTT broker: {e}")
-        sys.exit(1)
-
-    client.loop_start()
-    client.publish(MQTT_TOPIC_STATUS, "running", retain=True)
+    client = MQTTFanout(MQTT_BROKERS, log=log, protocol=MQTT_PROTOCOL,
+                        user_properties=MQTT_USER_PROPERTIES, alias_topics=MQTT_ALIAS_TOPICS)
+    client.start()
 
-    all_events = []  # Store events for minute updates
-    last_fetch_time = datetime.now() - timedelta(seconds=UPDATE_INTERVAL)  # Force immediate fetch
-    last_minute = datetime.now().minute
+    state = CalendarState(load_calendar_sources())
+    publish_changed(client, state, MQTT_TOPIC_STATUS, "running")
 
     # Main loop
     while True:
         try:
-            current_time = datetime.now()
-
-            # Check if we need to fetch calendar data (every 5 minutes)
-            if (current_time - last_fetch_time).total_seconds() >= UPDATE_INTERVAL:
-                ical_data = fetch_ical()
-                if ical_data:
-                    all_events = parse_ical_events(ical_data)
-                    log(f"Parsed {len(all_events)} events from calendar")
-                    publish_events(client, all_events)
-                    client.publish(MQTT_TOPIC_STATUS, "running", retain=True)
-                    last_fetch_time = current_time
-                else:
-                    log("Failed to fetch calendar data")
-                    client.publish(MQTT_TOPIC_STATUS, "error: fetch failed", retain=True)
-
-            # Check if minute changed - update time_until and appt
-            if current_time.minute != last_minute:
-                if all_events:
-                    update_time_sensitive_topics(client, all_events)
-                last_minute = current_time.minute
-
-            time.sleep(MINUTE_CHECK_INTERVAL)
+            clock.sleep(tick(client, state))
 
         except Exception as e:
             log(f"Error in main loop: {e}")
-            client.publish(MQTT_TOPIC_STATUS, f"error: {str(e)}", retain=True)
-            time.sleep(60)  # Wait a bit before retrying on error
+            publish_changed(client, state, MQTT_TOPIC_STATUS, f"error: {str(e)}")
+            clock.sleep(60)  # Wait a bit before retrying on error
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Google Calendar CalDAV to MQTT")
+    parser.add_argument("--simulate", type=float, metavar="DAYS",
+                        help="replay DAYS of virtual time against a broker stand-in and report")
+    parser.add_argument("--ics", metavar="FILE",
+                        help="calendar file used instead of fetching in --simulate mode")
+    parser.add_argument("--start", metavar="'YYYY-MM-DD HH:MM:SS'",
+                        help="virtual start time for --simulate (default: now)")
+    parser.add_argument("--verbose", action="store_true", help="log every simulated publish")
+    return parser.parse_args()
 
 if __name__ == "__main__":
-    main()
+    args = parse_args()
+    if args.simulate:
+        if not args.ics:
+            print("--simulate requires --ics FILE", file=sys.stderr)
+            sys.exit(2)
+        start = datetime.strptime(args.start, "%Y-%m-%d %H:%M:%S") if args.start else None
+        simulate(args.simulate, args.ics, start, args.verbose)
+    else:
+        main()
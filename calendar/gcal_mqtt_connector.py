@@ -8,7 +8,6 @@ Publishes upcoming calendar events to MQTT topics
 import sys
 import time
 import json
-import paho.mqtt.client as mqtt
 from datetime import datetime, timedelta
 from google.oauth2.credentials import Credentials
 from google.auth.transport.requests import Request
@@ -17,6 +16,11 @@ from googleapiclient.errors import HttpError
 import os.path
 import pickle
 
+# mqtt_fanout.py lives in the project root (installed next to this script)
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from mqtt_fanout import MQTTFanout
+from calendar_sources import google_time, google_timestamp
+
 # Force unbuffered output
 sys.stdout.reconfigure(line_buffering=True)
 sys.stderr.reconfigure(line_buffering=True)
@@ -24,6 +28,10 @@ sys.stderr.reconfigure(line_buffering=True)
 # MQTT Configuration
 MQTT_BROKER = "localhost"
 MQTT_PORT = 1883
+MQTT_BROKERS = [
+    {"host": MQTT_BROKER, "port": MQTT_PORT},
+    # {"host": "office-pi.local", "port": 1883},
+]
 MQTT_TOPIC_NEXT_EVENT = "calendar/next/title"
 MQTT_TOPIC_NEXT_START = "calendar/next/start"
 MQTT_TOPIC_NEXT_END = "calendar/next/end"
@@ -40,8 +48,15 @@ SCOPES = ['https://www.googleapis.com/auth/calendar.readonly']
 TOKEN_FILE = '/home/admin/.gcal_token.pickle'
 CREDENTIALS_FILE = '/home/admin/gcal_credentials.json'
 
-# Update interval (seconds)
-UPDATE_INTERVAL = 300  # 5 minutes
+# Update interval (seconds) - an incremental sync only transfers what changed
+UPDATE_INTERVAL = 60
+
+# Window of the listing - recurring series are expanded only this far ahead
+LOOK_AHEAD_DAYS = 60
+
+# Only the event fields the topics use, for full and incremental syncs alike
+SYNC_FIELDS = ("nextPageToken,nextSyncToken,"
+               "items(id,status,iCalUID,summary,location,description,start,end,attendees(email))")
 
 def log(message):
     """Print log message with timestamp"""
@@ -138,53 +153,90 @@ def clean_text(text):
     text = ' '.join(text.split())
     return text.strip()
 
-def get_upcoming_events(service, max_results=10):
-    """Get upcoming calendar events"""
-    try:
-        now = datetime.utcnow().isoformat() + 'Z'
-
-        # Get events from primary calendar
-        events_result = service.events().list(
-            calendarId='primary',
-            timeMin=now,
-            maxResults=max_results,
-            singleEvents=True,
-            orderBy='startTime'
-        ).execute()
-
-        events = events_result.get('items', [])
-        return events
-    except HttpError as error:
-        log(f"Google Calendar API error: {error}")
-        return []
-    except Exception as e:
-        log(f"Error fetching events: {e}")
-        return []
-
-def get_today_events(service):
-    """Get events for today"""
-    try:
-        # Start and end of today
-        now = datetime.now()
-        start_of_day = now.replace(hour=0, minute=0, second=0, microsecond=0)
-        end_of_day = now.replace(hour=23, minute=59, second=59, microsecond=999999)
-
-        time_min = start_of_day.isoformat() + 'Z'
-        time_max = end_of_day.isoformat() + 'Z'
-
-        events_result = service.events().list(
-            calendarId='primary',
-            timeMin=time_min,
-            timeMax=time_max,
-            singleEvents=True,
-            orderBy='startTime'
-        ).execute()
-
-        events = events_result.get('items', [])
-        return events
-    except Exception as e:
-        log(f"Error fetching today's events: {e}")
-        return []
+class GoogleEventStore:
+    """Local copy of one calendar, kept current with incremental syncToken syncs
+
+    The first sync lists the single events of one window, from the start of today
+    to look_ahead_days later, and ends with a sync token; later syncs send the
+    token and only receive events added, changed or cancelled since. The token
+    keeps the window it was issued for, so a new day or a token the API has
+    invalidated (HTTP 410) starts a full sync again. Both views are served from
+    the one copy.
+    """
+
+    def __init__(self, service, calendar_id='primary', look_back_days=0, look_ahead_days=LOOK_AHEAD_DAYS):
+        self.service = service
+        self.calendar_id = calendar_id
+        self.look_back_days = look_back_days
+        self.look_ahead_days = look_ahead_days
+        self.window_start = None  # of the full sync the token belongs to
+        self.sync_token = None
+        self.items = {}  # event id -> API event
+        self.full_syncs = 0
+        self.incremental_syncs = 0
+
+    def sync(self, now=None):
+        """Apply changes from the API, returns the number of changed events"""
+        now = now or datetime.now()
+        window_start = now.replace(hour=0, minute=0, second=0, microsecond=0) - timedelta(days=self.look_back_days)
+
+        if self.sync_token and window_start != self.window_start:
+            self.sync_token = None  # the window moved on, events past its end are missing
+        if self.sync_token:
+            try:
+                changed = self.apply(syncToken=self.sync_token)
+            except HttpError as error:
+                if error.resp.status != 410:
+                    raise
+                log("Sync token invalidated - starting a full sync")
+                self.sync_token = None
+            else:
+                self.incremental_syncs += 1
+                self.prune(window_start)
+                return changed
+
+        self.items = {}
+        # syncToken requests must not repeat the window, the token remembers it
+        changed = self.apply(timeMin=google_timestamp(window_start),
+                             timeMax=google_timestamp(window_start + timedelta(days=self.look_ahead_days)))
+        self.window_start = window_start
+        self.full_syncs += 1
+        log(f"Full sync: {len(self.items)} events")
+        return changed
+
+    def apply(self, **query):
+        changed = 0
+        page = None
+        while True:
+            result = self.service.events().list(calendarId=self.calendar_id, singleEvents=True,
+                                                fields=SYNC_FIELDS, pageToken=page, **query).execute()
+            for item in result.get('items', []):
+                if item.get('status') == 'cancelled':
+                    self.items.pop(item['id'], None)
+                else:
+                    self.items[item['id']] = item
+                changed += 1
+            page = result.get('nextPageToken')
+            if not page:
+                break
+        self.sync_token = result.get('nextSyncToken')
+        return changed
+
+    def prune(self, window_start):
+        """Forget events that ended before the window, incremental syncs never remove them"""
+        for event_id in [event_id for event_id, item in self.items.items()
+                         if google_time(item['end']) <= window_start]:
+            del self.items[event_id]
+
+    def between(self, start, end):
+        """Events overlapping [start, end] in start order"""
+        events = [item for item in self.items.values()
+                  if google_time(item['start']) <= end and google_time(item['end']) > start]
+        return sorted(events, key=lambda item: google_time(item['start']))
+
+    def upcoming(self, now, max_results=10):
+        """Events that have not ended yet in start order, as a timeMin=now listing returns them"""
+        return self.between(now, datetime.max)[:max_results]
 
 def publish_next_event(client, event):
     """Publish next upcoming event to MQTT"""
@@ -257,16 +309,8 @@ def main():
         sys.exit(1)
 
     # Connect to MQTT
-    client = mqtt.Client()
-
-    try:
-        client.connect(MQTT_BROKER, MQTT_PORT, 60)
-        log(f"Connected to MQTT broker at {MQTT_BROKER}:{MQTT_PORT}")
-    except Exception as e:
-        log(f"Failed to connect to MQTT broker: {e}")
-        sys.exit(1)
-
-    client.loop_start()
+    client = MQTTFanout(MQTT_BROKERS, log=log)
+    client.start()
 
     # Publish status
     client.publish(MQTT_TOPIC_STATUS, "initializing", retain=True)
@@ -282,11 +326,17 @@ def main():
     client.publish(MQTT_TOPIC_STATUS, "running", retain=True)
     log("Calendar service authenticated successfully")
 
+    store = GoogleEventStore(service)
+
     # Main loop
     while True:
         try:
-            # Get upcoming events
-            events = get_upcoming_events(service, max_results=10)
+            changed = store.sync()
+            if changed and store.full_syncs + store.incremental_syncs > 1:
+                log(f"Synced {changed} changed events")
+
+            now = datetime.now()
+            events = store.upcoming(now, max_results=10)
 
             if events:
                 # Publish next event
@@ -295,8 +345,9 @@ def main():
                 publish_next_event(client, None)
 
             # Get today's events
-            today_events = get_today_events(service)
-            publish_today_events(client, today_events)
+            start_of_day = now.replace(hour=0, minute=0, second=0, microsecond=0)
+            end_of_day = now.replace(hour=23, minute=59, second=59, microsecond=999999)
+            publish_today_events(client, store.between(start_of_day, end_of_day))
 
             client.publish(MQTT_TOPIC_STATUS, "running", retain=True)
 
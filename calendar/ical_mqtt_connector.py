@@ -6,11 +6,17 @@ Uses public/private iCal feed URLs (no API required)
 """
 
 import sys
+import os
 import time
-import paho.mqtt.client as mqtt
 from datetime import datetime, timedelta
+import urllib.error
 import urllib.request
-import re
+
+# mqtt_fanout.py lives in the project root (installed next to this script)
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from mqtt_fanout import MQTTFanout
+from ical_parser import ParsedCalendar, lines_from_chunks, validators_from, READ_CHUNK_SIZE
+from recurrence import RecurrenceExpander
 
 # Force unbuffered output
 sys.stdout.reconfigure(line_buffering=True)
@@ -19,6 +25,10 @@ sys.stderr.reconfigure(line_buffering=True)
 # MQTT Configuration
 MQTT_BROKER = "localhost"
 MQTT_PORT = 1883
+MQTT_BROKERS = [
+    {"host": MQTT_BROKER, "port": MQTT_PORT},
+    # {"host": "office-pi.local", "port": 1883},
+]
 MQTT_TOPIC_NEXT_EVENT = "calendar/next/title"
 MQTT_TOPIC_NEXT_START = "calendar/next/start"
 MQTT_TOPIC_NEXT_END = "calendar/next/end"
@@ -35,115 +45,52 @@ ICAL_URL_FILE = '/home/admin/.gcal_ical_url.txt'
 # Update interval (seconds)
 UPDATE_INTERVAL = 300  # 5 minutes
 
+# Only events in this window around now are kept while the feed is parsed
+LOOK_BACK_DAYS = 1
+LOOK_AHEAD_DAYS = 60
+
 def log(message):
     """Print log message with timestamp"""
     timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
     print(f"[{timestamp}] {message}", flush=True)
 
-def parse_ical_datetime(dt_str):
-    """Parse iCal datetime format"""
-    # Remove TZID if present
-    dt_str = re.sub(r'TZID=[^:]+:', '', dt_str)
+def fetch_ical_feed(url, calendar):
+    """Fetch the iCal feed and parse it as it downloads, returns (events, changed) or None
 
+    The request is conditional on the ETag/Last-Modified of the last document,
+    so an unchanged calendar costs one empty 304 response.
+    """
+    request = urllib.request.Request(url, headers=calendar.conditional_headers())
     try:
-        # Try datetime format
-        if 'T' in dt_str:
-            dt_str = dt_str.rstrip('Z')
-            return datetime.strptime(dt_str, "%Y%m%dT%H%M%S")
-        else:
-            # Date only (all-day event)
-            return datetime.strptime(dt_str, "%Y%m%d")
-    except Exception as e:
-        log(f"Error parsing datetime {dt_str}: {e}")
+        with urllib.request.urlopen(request, timeout=10) as response:
+            encoding = response.headers.get_content_charset() or 'utf-8'
+            chunks = iter(lambda: response.read(READ_CHUNK_SIZE), b"")
+            return calendar.update_stream(lines_from_chunks(chunks, encoding),
+                                          validators=validators_from(response.headers))
+    except urllib.error.HTTPError as e:
+        if e.code == 304:
+            return calendar.not_modified()
+        log(f"Error fetching iCal feed: {e}")
         return None
-
-def parse_ical_content(ical_data):
-    """Parse iCal/ICS content and extract events"""
-    events = []
-    current_event = {}
-    in_event = False
-
-    for line in ical_data.split('\n'):
-        line = line.strip()
-
-        if line == 'BEGIN:VEVENT':
-            in_event = True
-            current_event = {}
-        elif line == 'END:VEVENT':
-            if current_event:
-                events.append(current_event)
-            in_event = False
-            current_event = {}
-        elif in_event:
-            if ':' in line:
-                # Handle multi-line values
-                if line.startswith(' '):
-                    # Continuation of previous line
-                    continue
-
-                key_val = line.split(':', 1)
-                if len(key_val) == 2:
-                    key = key_val[0].split(';')[0]  # Remove parameters
-                    value = key_val[1]
-
-                    # Unescape special characters
-                    value = value.replace('\\n', '\n').replace('\\,', ',')
-
-                    if key == 'SUMMARY':
-                        current_event['title'] = value
-                    elif key == 'DTSTART':
-                        current_event['start'] = parse_ical_datetime(value)
-                    elif key == 'DTEND':
-                        current_event['end'] = parse_ical_datetime(value)
-                    elif key == 'LOCATION':
-                        current_event['location'] = value
-                    elif key == 'DESCRIPTION':
-                        current_event['description'] = value
-
-    return events
-
-def fetch_ical_feed(url):
-    """Fetch iCal feed from URL"""
-    try:
-        with urllib.request.urlopen(url, timeout=10) as response:
-            return response.read().decode('utf-8')
     except Exception as e:
         log(f"Error fetching iCal feed: {e}")
         return None
 
-def get_upcoming_events(ical_data):
-    """Get upcoming events from iCal data"""
-    events = parse_ical_content(ical_data)
-
-    # Filter future events
+def get_upcoming_events(events):
+    """Get upcoming events from the parsed calendar (sorted by start time)"""
     now = datetime.now()
-    future_events = [e for e in events if e.get('start') and e['start'] > now]
-
-    # Sort by start time
-    future_events.sort(key=lambda x: x['start'])
-
+    future_events = [e for e in events if e['dtstart'] > now]
     return future_events[:10]
 
-def get_today_events(ical_data):
-    """Get today's events from iCal data"""
-    events = parse_ical_content(ical_data)
-
+def get_today_events(events):
+    """Get today's events from the parsed calendar"""
     # Get today's date range
     now = datetime.now()
     start_of_day = now.replace(hour=0, minute=0, second=0, microsecond=0)
     end_of_day = now.replace(hour=23, minute=59, second=59, microsecond=999999)
 
     # Filter today's events
-    today_events = []
-    for e in events:
-        if e.get('start'):
-            if start_of_day <= e['start'] <= end_of_day:
-                today_events.append(e)
-
-    # Sort by start time
-    today_events.sort(key=lambda x: x['start'])
-
-    return today_events
+    return [e for e in events if start_of_day <= e['dtstart'] <= end_of_day]
 
 def format_datetime(dt):
     """Format datetime to readable format"""
@@ -192,9 +139,9 @@ def publish_next_event(client, event):
         return
 
     # Extract event details
-    title = event.get('title', 'No title')
-    start = event.get('start')
-    end = event.get('end')
+    title = event.get('summary', 'No title')
+    start = event.get('dtstart')
+    end = event.get('dtend')
     location = event.get('location', '')
     description = event.get('description', '')
 
@@ -221,8 +168,8 @@ def publish_today_events(client, events):
     # Create event list
     event_list = []
     for event in events:
-        title = event.get('title', 'No title')
-        start = event.get('start')
+        title = event.get('summary', 'No title')
+        start = event.get('dtstart')
         start_formatted = format_datetime(start) if start else ""
         event_list.append(f"{start_formatted} - {title}")
 
@@ -249,29 +196,31 @@ def main():
         sys.exit(1)
 
     # Connect to MQTT
-    client = mqtt.Client()
-
-    try:
-        client.connect(MQTT_BROKER, MQTT_PORT, 60)
-        log(f"Connected to MQTT broker at {MQTT_BROKER}:{MQTT_PORT}")
-    except Exception as e:
-        log(f"Failed to connect to MQTT broker: {e}")
-        sys.exit(1)
-
-    client.loop_start()
+    client = MQTTFanout(MQTT_BROKERS, log=log)
+    client.start()
 
     # Publish status
     client.publish(MQTT_TOPIC_STATUS, "running", retain=True)
 
+    calendar = ParsedCalendar(LOOK_BACK_DAYS, LOOK_AHEAD_DAYS)
+    recurrences = RecurrenceExpander()
+
     # Main loop
     while True:
         try:
-            # Fetch iCal feed
-            ical_data = fetch_ical_feed(ical_url)
+            # Fetch and parse the iCal feed in one pass
+            result = fetch_ical_feed(ical_url, calendar)
+
+            if result:
+                parsed_events, changed = result
+                log(f"Calendar {'updated' if changed else 'unchanged'}: {calendar.report()}")
+
+                # Recurring events only need today and tomorrow (plus their next occurrence)
+                today_start = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+                all_events = recurrences.expand(parsed_events, today_start, today_start + timedelta(days=2))
 
-            if ical_data:
                 # Get upcoming events
-                events = get_upcoming_events(ical_data)
+                events = get_upcoming_events(all_events)
 
                 if events:
                     publish_next_event(client, events[0])
@@ -279,7 +228,7 @@ def main():
                     publish_next_event(client, None)
 
                 # Get today's events
-                today_events = get_today_events(ical_data)
+                today_events = get_today_events(all_events)
                 publish_today_events(client, today_events)
 
                 client.publish(MQTT_TOPIC_STATUS, "running", retain=True)
@@ -0,0 +1,424 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+RFC 5545 iCalendar parsing shared by the calendar connectors
+Lines are unfolded and text values unescaped once; every VEVENT becomes a plain dict.
+Documents can be parsed from a line iterator as they download, keeping only the
+events inside a look-back/look-ahead window. Zoned times (TZID or UTC) are
+converted to naive local times.
+"""
+
+import re
+import time
+import codecs
+import hashlib
+from functools import lru_cache
+from datetime import datetime, timedelta, timezone, tzinfo
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+READ_CHUNK_SIZE = 64 * 1024
+LOCAL_TIMEZONE = None  # IANA name events are converted to, e.g. "Europe/Bratislava"; None = system zone
+
+UNESCAPE = re.compile(r'\\([\\;,nN])')
+
+def unescape_text(value):
+    """Undo TEXT escaping: \\n, \\N, \\, \\; and \\\\"""
+    return UNESCAPE.sub(lambda match: '\n' if match.group(1) in 'nN' else match.group(1), value)
+
+def lines_from_chunks(chunks, encoding='utf-8'):
+    """Decode a byte stream incrementally and yield its lines without line endings"""
+    decoder = codecs.getincrementaldecoder(encoding)('replace')
+    pending = ""
+    for chunk in chunks:
+        pending += decoder.decode(chunk)
+        *lines, pending = pending.split('\n')
+        yield from lines
+    pending += decoder.decode(b"", final=True)
+    if pending:
+        yield pending
+
+def unfold_lines(lines):
+    """Join folded continuation lines (leading space or tab) onto the line before"""
+    current = None
+    for line in lines:
+        line = line.rstrip('\r\n')
+        if line[:1] in (' ', '\t') and current is not None:
+            current += line[1:]
+            continue
+        if current is not None:
+            yield current
+        current = line
+    if current is not None:
+        yield current
+
+def parse_content_line(line):
+    """Split 'NAME;PARAM=a;PARAM="b:c":value' into (NAME, {PARAM: value}, value)"""
+    head, colon, value = line.partition(':')
+    if not colon:
+        return None, {}, ""
+    if '"' not in head:
+        if ';' not in head:
+            return head.upper(), {}, value
+        return split_head(head, value)
+
+    in_quotes = False
+    for index, char in enumerate(line):
+        if char == '"':
+            in_quotes = not in_quotes
+        elif char == ':' and not in_quotes:
+            head, value = line[:index], line[index + 1:]
+            break
+    else:
+        return None, {}, ""
+    return split_head(head, value)
+
+def split_head(head, value):
+    name, *raw_params = head.split(';')
+    params = {}
+    for raw in raw_params:
+        key, _, param_value = raw.partition('=')
+        params[key.upper()] = param_value.strip('"')
+    return name.upper(), params, value
+
+@lru_cache(maxsize=None)
+def local_zone():
+    return ZoneInfo(LOCAL_TIMEZONE) if LOCAL_TIMEZONE else None
+
+@lru_cache(maxsize=None)
+def iana_zone(tzid):
+    """zoneinfo zone for a TZID, also for prefixed ids like /mozilla.org/20050126_1/Europe/Berlin"""
+    parts = tzid.strip('"/').split('/')
+    for start in range(len(parts)):
+        try:
+            return ZoneInfo('/'.join(parts[start:]))
+        except (ZoneInfoNotFoundError, ValueError):
+            continue
+    return None
+
+def find_zone(tzid, zones=None):
+    """IANA zone first; otherwise the VTIMEZONE the document defined (e.g. Windows names)"""
+    return iana_zone(tzid) or (zones or {}).get(tzid)
+
+@lru_cache(maxsize=16384)
+def to_local(wall_time, zone):
+    """Wall time in zone as a naive local time"""
+    return wall_time.replace(tzinfo=zone).astimezone(local_zone()).replace(tzinfo=None)
+
+@lru_cache(maxsize=16384)
+def from_local(local_time, zone):
+    """Naive local time as wall time in zone"""
+    # With no configured zone the naive time stays naive, which astimezone() reads as system time
+    return local_time.replace(tzinfo=local_zone()).astimezone(zone).replace(tzinfo=None)
+
+def value_zone(value, params=None, zones=None):
+    """Zone of a DATE-TIME value: UTC for ...Z, the TZID zone, or None for floating times"""
+    if value.strip().endswith('Z'):
+        return timezone.utc
+    tzid = (params or {}).get('TZID')
+    return find_zone(tzid, zones) if tzid else None
+
+def parse_datetime(value, params=None, zones=None):
+    """DATE or DATE-TIME value as a naive local datetime; all-day dates start at midnight"""
+    value = value.strip()
+    try:
+        if (params or {}).get('VALUE') == 'DATE' or 'T' not in value:
+            return datetime.strptime(value[:8], "%Y%m%d")
+        wall_time = datetime.strptime(value.rstrip('Z')[:15], "%Y%m%dT%H%M%S")
+    except ValueError:
+        return None
+    zone = value_zone(value, params, zones)
+    return to_local(wall_time, zone) if zone else wall_time
+
+def parse_offset(value):
+    """UTC offset like +0100 or -053000 as a timedelta"""
+    value = value.strip()
+    sign = -1 if value.startswith('-') else 1
+    digits = value.lstrip('+-')
+    seconds = int(digits[0:2]) * 3600 + int(digits[2:4]) * 60 + int(digits[4:6] or 0)
+    return timedelta(seconds=sign * seconds)
+
+class VTimezone(tzinfo):
+    """tzinfo from a VTIMEZONE block: STANDARD/DAYLIGHT onsets with yearly BYMONTH/BYDAY rules"""
+
+    def __init__(self, tzid, observances):
+        self.tzid = tzid
+        self.observances = observances  # dicts with start, offset_to, offset_from, rule
+        self.onset_cache = {}
+
+    def onsets(self, year):
+        """(wall time, offset) of every transition in a year"""
+        if year not in self.onset_cache:
+            onsets = []
+            for observance in self.observances:
+                start = observance['start']
+                rule = observance['rule']
+                if year < start.year:
+                    continue
+                if not rule:
+                    if year == start.year:
+                        onsets.append((start, observance['offset_to']))
+                    continue
+                month = int(rule.get('BYMONTH', start.month))
+                byday = rule.get('BYDAY', '')
+                weekday = ['MO', 'TU', 'WE', 'TH', 'FR', 'SA', 'SU'].index(byday[-2:]) if byday[-2:] else None
+                if weekday is None:
+                    day = datetime(year, month, start.day)
+                else:
+                    ordinal = int(byday[:-2] or 1)
+                    first = datetime(year, month, 1)
+                    days = [first + timedelta(days=offset) for offset in range(31)
+                            if (first + timedelta(days=offset)).month == month
+                            and (first + timedelta(days=offset)).weekday() == weekday]
+                    day = days[ordinal - 1 if ordinal > 0 else ordinal]
+                onsets.append((datetime.combine(day.date(), start.time()), observance['offset_to']))
+            self.onset_cache[year] = sorted(onsets)
+        return self.onset_cache[year]
+
+    def utcoffset(self, dt):
+        wall_time = dt.replace(tzinfo=None)
+        current = None
+        for year in (wall_time.year - 1, wall_time.year):
+            for onset, offset in self.onsets(year):
+                if onset <= wall_time:
+                    current = offset
+        if current is None:
+            return self.observances[0]['offset_from'] if self.observances else timedelta(0)
+        return current
+
+    def dst(self, dt):
+        return timedelta(0)
+
+    def tzname(self, dt):
+        return self.tzid
+
+    def fromutc(self, dt):
+        utc = dt.replace(tzinfo=None)
+        offsets = {observance['offset_to'] for observance in self.observances} or {timedelta(0)}
+        for offset in sorted(offsets, reverse=True):
+            if self.utcoffset(utc + offset) == offset:
+                return (utc + offset).replace(tzinfo=self)
+        return (utc + self.utcoffset(utc)).replace(tzinfo=self)
+
+def observance_key(observances):
+    """Hashable form of a VTIMEZONE definition"""
+    return tuple((observance['start'], observance['offset_to'], observance['offset_from'],
+                  tuple(sorted(observance['rule'].items()))) for observance in observances)
+
+@lru_cache(maxsize=256)
+def shared_timezone(tzid, definition):
+    """One VTimezone per distinct definition, so every fetch of a feed reuses the same
+    instance and the to_local/from_local and onset caches keep their entries"""
+    return VTimezone(tzid, [{'start': start, 'offset_to': offset_to, 'offset_from': offset_from, 'rule': dict(rule)}
+                            for start, offset_to, offset_from, rule in definition])
+
+TEXT_PROPERTIES = {'SUMMARY': 'summary', 'LOCATION': 'location', 'DESCRIPTION': 'description',
+                   'UID': 'uid', 'STATUS': 'status'}
+
+def parse_timezone_property(timezone_block, stack, name, params, value):
+    """Collect TZID and the STANDARD/DAYLIGHT observances of a VTIMEZONE"""
+    if stack[-1] == 'VTIMEZONE' and name == 'TZID':
+        timezone_block['tzid'] = value
+    elif stack[-1] in ('STANDARD', 'DAYLIGHT'):
+        observance = timezone_block.setdefault('current', {'rule': {}})
+        if name == 'DTSTART':
+            observance['start'] = parse_datetime(value)
+        elif name == 'TZOFFSETTO':
+            observance['offset_to'] = parse_offset(value)
+        elif name == 'TZOFFSETFROM':
+            observance['offset_from'] = parse_offset(value)
+        elif name == 'RRULE':
+            observance['rule'] = dict(part.split('=', 1) for part in value.upper().split(';') if '=' in part)
+
+def parse_events_from_lines(lines, zones=None):
+    """Yield one dict per VEVENT; properties of nested components (VALARM) are ignored
+
+    VTIMEZONE blocks are collected into zones as they are read, so zoned times
+    that zoneinfo does not know (Windows zone names) can still be converted.
+    Zoned events keep their zone in 'tz' for recurrence expansion.
+    """
+    zones = {} if zones is None else zones
+    stack = []
+    event = None
+    timezone_block = None
+    for line in unfold_lines(lines):
+        if not line:
+            continue
+        name, params, value = parse_content_line(line)
+        if name == 'BEGIN':
+            stack.append(value.upper())
+            if stack == ['VCALENDAR', 'VEVENT'] or stack == ['VEVENT']:
+                event = {}
+            elif stack[-1] == 'VTIMEZONE':
+                timezone_block = {'observances': []}
+            continue
+        if name == 'END':
+            if stack and stack[-1] == 'VEVENT' and event is not None and len(stack) <= 2:
+                if event.get('dtstart'):
+                    yield event
+                event = None
+            elif timezone_block is not None and stack and stack[-1] in ('STANDARD', 'DAYLIGHT'):
+                observance = timezone_block.pop('current', {})
+                if 'start' in observance and 'offset_to' in observance:
+                    observance.setdefault('offset_from', observance['offset_to'])
+                    timezone_block['observances'].append(observance)
+            elif timezone_block is not None and stack and stack[-1] == 'VTIMEZONE':
+                if timezone_block.get('tzid'):
+                    tzid = timezone_block['tzid']
+                    zones[tzid] = shared_timezone(tzid, observance_key(timezone_block['observances']))
+                timezone_block = None
+            if stack:
+                stack.pop()
+            continue
+        if timezone_block is not None:
+            parse_timezone_property(timezone_block, stack, name, params, value)
+            continue
+        if event is None or stack[-1] != 'VEVENT':
+            continue
+
+        if name in TEXT_PROPERTIES:
+            event[TEXT_PROPERTIES[name]] = unescape_text(value)
+        elif name == 'DTSTART':
+            event['dtstart'] = parse_datetime(value, params, zones)
+            event['all_day'] = params.get('VALUE') == 'DATE' or 'T' not in value
+            zone = None if event['all_day'] else value_zone(value, params, zones)
+            if zone:
+                event['tz'] = zone
+        elif name == 'DTEND':
+            event['dtend'] = parse_datetime(value, params, zones)
+        elif name == 'RRULE':
+            event['rrule'] = value
+        elif name in ('RDATE', 'EXDATE'):
+            dates = (parse_datetime(item.split('/')[0], params, zones) for item in value.split(','))
+            event.setdefault(name.lower(), []).extend(date for date in dates if date)
+        elif name == 'RECURRENCE-ID':
+            event['recurrence_id'] = parse_datetime(value, params, zones)
+
+def parse_events(ical_data):
+    """All events of an iCalendar document, sorted by start time"""
+    events = list(parse_events_from_lines(ical_data.splitlines()))
+    events.sort(key=lambda event: event['dtstart'])
+    return events
+
+def validators_from(headers):
+    """ETag and Last-Modified of a response, for the next conditional GET"""
+    return {name: headers.get(name) for name in ('ETag', 'Last-Modified') if headers.get(name)}
+
+def in_window(event, window_start, window_end):
+    """Does the event overlap the window? Recurring masters always stay"""
+    if event.get('rrule') or event.get('rdate'):
+        return True
+    if event.get('recurrence_id') and window_start <= event['recurrence_id'] <= window_end:
+        return True  # an override must stay to hide the occurrence it replaces
+    end = event.get('dtend') or event['dtstart']
+    return end >= window_start and event['dtstart'] <= window_end
+
+class ParsedCalendar:
+    """Parses a fetched document once and skips parsing while its digest is unchanged
+
+    With look_back_days/look_ahead_days only events overlapping that window
+    around now are kept; they are dropped as they are read, so a streamed
+    document never has to be held in memory as a whole.
+    """
+
+    def __init__(self, look_back_days=None, look_ahead_days=None):
+        self.look_back_days = look_back_days
+        self.look_ahead_days = look_ahead_days
+        self.digest = None
+        self.window_day = None
+        self.events = []
+        self.parses = 0
+        self.skips = 0
+        self.last_parse_seconds = 0.0
+        self.last_events_read = 0
+        self.last_skipped = False
+        self.validators = {}  # ETag/Last-Modified of the document the events came from
+
+    def window(self, now):
+        start = now - timedelta(days=self.look_back_days) if self.look_back_days is not None else datetime.min
+        end = now + timedelta(days=self.look_ahead_days) if self.look_ahead_days is not None else datetime.max
+        return start, end
+
+    def unchanged(self, digest, now):
+        # The same document still needs a new parse once the window has moved on a day
+        return digest == self.digest and now.date() == self.window_day
+
+    def parse(self, lines, now):
+        started = time.perf_counter()
+        window_start, window_end = self.window(now)
+        read = 0
+        events = []
+        for event in parse_events_from_lines(lines):
+            read += 1
+            if in_window(event, window_start, window_end):
+                events.append(event)
+        events.sort(key=lambda event: event['dtstart'])
+        self.last_parse_seconds = time.perf_counter() - started
+        self.last_events_read = read
+        self.parses += 1
+        return events
+
+    def conditional_headers(self, now=None):
+        """Request headers for a conditional GET; empty when the document must be parsed again"""
+        now = now or datetime.now()
+        if now.date() != self.window_day:
+            return {}
+        headers = {}
+        if 'ETag' in self.validators:
+            headers['If-None-Match'] = self.validators['ETag']
+        if 'Last-Modified' in self.validators:
+            headers['If-Modified-Since'] = self.validators['Last-Modified']
+        return headers
+
+    def not_modified(self):
+        """The server answered 304 - keep the events, returns (events, False)"""
+        self.skips += 1
+        self.last_skipped = True
+        return self.events, False
+
+    def update(self, ical_data, now=None, validators=None):
+        """Return (events, changed) for a freshly fetched document"""
+        now = now or datetime.now()
+        digest = hashlib.sha256(ical_data.encode('utf-8')).hexdigest()
+        self.validators = validators or {}
+        self.last_skipped = self.unchanged(digest, now)
+        if self.last_skipped:
+            self.skips += 1
+            return self.events, False
+        self.events = self.parse(ical_data.splitlines(), now)
+        self.digest = digest
+        self.window_day = now.date()
+        return self.events, True
+
+    def update_stream(self, lines, now=None, validators=None):
+        """Like update() for an iterator of lines, e.g. an HTTP response being read
+
+        The stream is parsed as it is read, so memory stays bounded whatever the
+        document's size. The digest is only known once the stream is consumed, so
+        without ETag or Last-Modified (no 304 possible) an unchanged document is
+        still parsed, but the previous events are kept.
+        """
+        now = now or datetime.now()
+        hasher = hashlib.sha256()
+
+        def hashed(lines):
+            for line in lines:
+                hasher.update(line.encode('utf-8'))
+                yield line
+
+        self.last_skipped = False
+        events = self.parse(hashed(lines), now)
+        digest = hasher.hexdigest()
+        self.validators = validators or {}  # only once the whole document has been read
+        if self.unchanged(digest, now):
+            self.skips += 1
+            return self.events, False
+        self.events = events
+        self.digest = digest
+        self.window_day = now.date()
+        return self.events, True
+
+    def report(self):
+        if self.last_skipped:
+            return f"{len(self.events)} events, parse skipped"
+        return (f"{len(self.events)} of {self.last_events_read} events in window, "
+                f"parsed in {self.last_parse_seconds * 1000:.1f} ms")
@@ -21,13 +21,16 @@ sudo apt-get install -y python3-google-auth python3-google-auth-oauthlib python3
 echo "Installing calendar connector scripts..."
 cp gcal_mqtt_connector.py ~/
 cp gcal_authenticate.py ~/
+cp ../mqtt_fanout.py ~/
+cp ical_parser.py recurrence.py event_index.py calendar_sources.py ~/
+cp gcal_caldav_connector.py ~/  # "caldav" sources in ~/.gcal_sources.json
 chmod +x ~/gcal_mqtt_connector.py
 chmod +x ~/gcal_authenticate.py
 
 # Install management commands
 echo "Installing management commands..."
-sudo cp bin/gcal_status /usr/local/bin/
-sudo chmod +x /usr/local/bin/gcal_status
+sudo cp bin/gcal_status ../bin/mqtt_snapshot /usr/local/bin/
+sudo chmod +x /usr/local/bin/gcal_status /usr/local/bin/mqtt_snapshot
 sudo ln -sf /home/admin/gcal_authenticate.py /usr/local/bin/gcal_authenticate
 
 # Install systemd service
@@ -0,0 +1,275 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Recurring event expansion (RRULE, RDATE, EXDATE, RECURRENCE-ID)
+Occurrences are generated lazily and only for the window the publishers show;
+the periods before the window are skipped arithmetically instead of iterated.
+"""
+
+import re
+import heapq
+from datetime import date, datetime, timedelta
+
+from ical_parser import parse_datetime, to_local, from_local
+
+WEEKDAYS = {'MO': 0, 'TU': 1, 'WE': 2, 'TH': 3, 'FR': 4, 'SA': 5, 'SU': 6}
+BYDAY = re.compile(r'^([+-]?\d+)?(MO|TU|WE|TH|FR|SA|SU)$')
+MAX_EMPTY_PERIODS = 1000  # e.g. BYMONTH=2;BYMONTHDAY=30 never matches
+RECURRENCE_KEYS = ('rrule', 'rdate', 'exdate')
+
+def parse_rrule(value):
+    """RRULE value as a dict; unknown parts are ignored"""
+    parts = dict(part.split('=', 1) for part in value.upper().split(';') if '=' in part)
+
+    def numbers(name):
+        return [int(item) for item in parts.get(name, '').split(',') if item.lstrip('+-').isdigit()]
+
+    byday = []
+    for item in parts.get('BYDAY', '').split(','):
+        match = BYDAY.match(item.strip())
+        if match:
+            byday.append((int(match.group(1) or 0), WEEKDAYS[match.group(2)]))
+
+    until = None
+    if parts.get('UNTIL'):
+        until = parse_datetime(parts['UNTIL'])
+        if until and 'T' not in parts['UNTIL']:
+            until += timedelta(days=1, microseconds=-1)  # a DATE includes the whole day
+
+    return {
+        'freq': parts.get('FREQ'),
+        'interval': max(1, int(parts.get('INTERVAL', '1') or 1)),
+        'count': int(parts['COUNT']) if parts.get('COUNT', '').isdigit() else None,
+        'until': until,
+        'byday': byday,
+        'bymonthday': numbers('BYMONTHDAY'),
+        'bymonth': numbers('BYMONTH'),
+        'bysetpos': numbers('BYSETPOS'),
+    }
+
+def days_in_month(year, month):
+    if month == 12:
+        return 31
+    return (date(year, month + 1, 1) - date(year, month, 1)).days
+
+def month_days(rule, year, month, dtstart):
+    """Candidate days of one month for MONTHLY and YEARLY rules"""
+    last = days_in_month(year, month)
+    weekdays = {weekday for _, weekday in rule['byday']}
+    if rule['bymonthday']:
+        days = [day if day > 0 else last + day + 1 for day in rule['bymonthday']]
+        days = [date(year, month, day) for day in days if 1 <= day <= last]
+        return [day for day in days if not weekdays or day.weekday() in weekdays]
+    if rule['byday']:
+        days = []
+        for ordinal, weekday in rule['byday']:
+            first = (weekday - date(year, month, 1).weekday()) % 7 + 1
+            matching = [date(year, month, day) for day in range(first, last + 1, 7)]
+            if ordinal == 0:
+                days.extend(matching)
+            elif -len(matching) <= (ordinal - 1 if ordinal > 0 else ordinal) < len(matching):
+                days.append(matching[ordinal - 1 if ordinal > 0 else ordinal])
+        return days
+    return [date(year, month, dtstart.day)] if dtstart.day <= last else []
+
+def period_start(rule, dtstart, index):
+    """First day of the index-th period of the rule, None past the end of the calendar"""
+    step = index * rule['interval']
+    try:
+        if rule['freq'] == 'DAILY':
+            return dtstart.date() + timedelta(days=step)
+        if rule['freq'] == 'WEEKLY':
+            return dtstart.date() - timedelta(days=dtstart.weekday()) + timedelta(weeks=step)
+        if rule['freq'] == 'MONTHLY':
+            months = dtstart.month - 1 + step
+            return date(dtstart.year + months // 12, months % 12 + 1, 1)
+        return date(dtstart.year + step, 1, 1)
+    except (ValueError, OverflowError):
+        return None
+
+def period_index(rule, dtstart, moment):
+    """Index of the period containing moment"""
+    if rule['freq'] == 'DAILY':
+        periods = (moment.date() - dtstart.date()).days
+    elif rule['freq'] == 'WEEKLY':
+        periods = (moment.date() - timedelta(days=moment.weekday())
+                   - (dtstart.date() - timedelta(days=dtstart.weekday()))).days // 7
+    elif rule['freq'] == 'MONTHLY':
+        periods = (moment.year - dtstart.year) * 12 + moment.month - dtstart.month
+    else:
+        periods = moment.year - dtstart.year
+    return max(0, periods // rule['interval'])
+
+def period_candidates(rule, period, dtstart):
+    """Occurrence starts of one period, before COUNT/UNTIL are applied"""
+    freq = rule['freq']
+    weekdays = {weekday for _, weekday in rule['byday']}
+    if freq == 'DAILY':
+        days = [period]
+        if weekdays:
+            days = [day for day in days if day.weekday() in weekdays]
+        if rule['bymonthday']:
+            last = days_in_month(period.year, period.month)
+            wanted = {day if day > 0 else last + day + 1 for day in rule['bymonthday']}
+            days = [day for day in days if day.day in wanted]
+    elif freq == 'WEEKLY':
+        days = [period + timedelta(days=weekday) for weekday in sorted(weekdays or {dtstart.weekday()})]
+    elif freq == 'MONTHLY':
+        days = month_days(rule, period.year, period.month, dtstart)
+    else:
+        days = []
+        for month in rule['bymonth'] or [dtstart.month]:
+            days.extend(month_days(rule, period.year, month, dtstart))
+
+    if rule['bymonth'] and freq != 'YEARLY':
+        days = [day for day in days if day.month in rule['bymonth']]
+    days = sorted(set(days))
+    if rule['bysetpos']:
+        positions = [position - 1 if position > 0 else position for position in rule['bysetpos']]
+        days = sorted({days[position] for position in positions if -len(days) <= position < len(days)})
+    return [datetime.combine(day, dtstart.time()) for day in days]
+
+def constant_per_period(rule, dtstart):
+    """Occurrences in every full period, or None when it varies (then COUNT rules are iterated)"""
+    if rule['bymonth'] or rule['bymonthday'] or rule['bysetpos']:
+        return None
+    if rule['freq'] == 'WEEKLY':
+        return len({weekday for _, weekday in rule['byday']}) or 1
+    if rule['freq'] == 'DAILY' and not rule['byday']:
+        return 1
+    return None
+
+def rrule_starts(dtstart, rule, after=None, zone=None):
+    """Starts of an RRULE in order; periods that end before `after` are skipped, not iterated
+
+    With a zone, dtstart and after are wall times in it; UNTIL is a local time.
+    """
+    if rule['freq'] not in ('DAILY', 'WEEKLY', 'MONTHLY', 'YEARLY'):
+        yield dtstart  # HOURLY and finer are not expanded
+        return
+
+    count, until = rule['count'], rule['until']
+    emitted = 0
+    index = 0
+    if after and after > dtstart:
+        skip = period_index(rule, dtstart, after)
+        per_period = constant_per_period(rule, dtstart)
+        if skip > 0 and count is None:
+            index = skip
+        elif skip > 0 and per_period:
+            first = sum(1 for start in period_candidates(rule, period_start(rule, dtstart, 0), dtstart)
+                        if start >= dtstart)
+            index = skip
+            emitted = first + (skip - 1) * per_period
+
+    empty = 0
+    while empty < MAX_EMPTY_PERIODS:
+        period = period_start(rule, dtstart, index)
+        if period is None:
+            return
+        starts = [start for start in period_candidates(rule, period, dtstart) if start >= dtstart]
+        empty = 0 if starts else empty + 1
+        for start in starts:
+            if until and (to_local(start, zone) if zone else start) > until:
+                return
+            emitted += 1
+            if count is not None and emitted > count:
+                return
+            yield start
+        index += 1
+
+def occurrence_starts(master, after=None, zone=None):
+    """Every start of a recurring event in order: RRULE and RDATE, minus EXDATE"""
+    dtstart = master['dtstart']
+    streams = [sorted(set(master.get('rdate', ())))]
+    if master.get('rrule'):
+        streams.append(rrule_starts(dtstart, parse_rrule(master['rrule']), after, zone))
+    else:
+        streams.append([dtstart])
+    excluded = set(master.get('exdate', ()))
+    previous = None
+    for start in heapq.merge(*streams):
+        if start != previous and start not in excluded:
+            yield start
+        previous = start
+
+def master_key(master):
+    """Changes whenever any property of the master changes"""
+    return tuple(sorted((name, tuple(value) if isinstance(value, list) else value)
+                        for name, value in master.items()))
+
+class RecurrenceExpander:
+    """Turns recurring masters into their occurrences inside a window
+
+    Each series yields the occurrences overlapping the window plus the first one
+    after it, so the next event is found even when it lies beyond the window.
+    Results are cached per master and window; a changed master has a new key and
+    masters that disappear from the calendar are dropped from the cache.
+    """
+
+    def __init__(self):
+        self.cache = {}
+        self.expansions = 0
+        self.hits = 0
+
+    def expand(self, events, window_start, window_end):
+        """Events with every recurring master replaced by its occurrences, sorted by start"""
+        overrides = {}
+        masters = []
+        result = []
+        for event in events:
+            if event.get('recurrence_id') and event.get('uid'):
+                overrides[(event['uid'], event['recurrence_id'])] = event
+            elif event.get('rrule') or event.get('rdate'):
+                masters.append(event)
+            else:
+                result.append(event)
+
+        cache = {}
+        for master in masters:
+            key = master_key(master)
+            entry = self.cache.get(key)
+            if entry is None or entry[0] != (window_start, window_end):
+                entry = ((window_start, window_end), self.occurrences(master, window_start, window_end))
+                self.expansions += 1
+            else:
+                self.hits += 1
+            cache[key] = entry
+            # Occurrences moved or cancelled by a RECURRENCE-ID override are replaced below
+            result.extend(occurrence for occurrence in entry[1]
+                          if (master.get('uid'), occurrence['dtstart']) not in overrides)
+        self.cache = cache
+
+        result.extend(override for override in overrides.values()
+                      if override.get('status', '').upper() != 'CANCELLED')
+        result.sort(key=lambda event: event['dtstart'])
+        return result
+
+    def occurrences(self, master, window_start, window_end):
+        duration = (master.get('dtend') or master['dtstart']) - master['dtstart']
+        template = {name: value for name, value in master.items() if name not in RECURRENCE_KEYS}
+        zone = master.get('tz')
+        if zone:
+            # Expand in the event's own wall time, so a 10:00 meeting stays at 10:00 in
+            # its zone across DST changes, and convert every occurrence back
+            wall = dict(master, dtstart=from_local(master['dtstart'], zone),
+                        rdate=[from_local(start, zone) for start in master.get('rdate', ())],
+                        exdate=[from_local(start, zone) for start in master.get('exdate', ())])
+            starts = (to_local(start, zone) for start in
+                      occurrence_starts(wall, from_local(window_start - duration, zone), zone))
+        else:
+            starts = occurrence_starts(master, window_start - duration)
+        occurrences = []
+        for start in starts:
+            if start + duration < window_start:
+                continue
+            occurrence = dict(template, dtstart=start)
+            if master.get('dtend'):
+                occurrence['dtend'] = start + duration
+            occurrences.append(occurrence)
+            if start > window_end:
+                break  # the first occurrence after the window is kept for the next event
+        return occurrences
+
+    def stats(self):
+        return {'masters': len(self.cache), 'expansions': self.expansions, 'hits': self.hits}
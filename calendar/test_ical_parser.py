@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+DST handling of the iCal parser: UTC and TZID times around the transitions,
+and a weekly New York series across the weeks the EU and US offsets differ
+"""
+
+from datetime import datetime
+
+import pytest
+
+import ical_parser
+from ical_parser import parse_datetime, parse_events, parse_events_from_lines
+from recurrence import RecurrenceExpander
+
+NEW_YORK_SERIES = """BEGIN:VCALENDAR
+{timezone}BEGIN:VEVENT
+UID:sync@example.com
+DTSTART;TZID={tzid}:20261013T100000
+DTEND;TZID={tzid}:20261013T103000
+RRULE:FREQ=WEEKLY
+SUMMARY:Sync with New York
+END:VEVENT
+END:VCALENDAR
+"""
+
+WINDOWS_EASTERN = """BEGIN:VTIMEZONE
+TZID:Eastern Standard Time
+BEGIN:STANDARD
+DTSTART:16011104T020000
+RRULE:FREQ=YEARLY;BYDAY=1SU;BYMONTH=11
+TZOFFSETFROM:-0400
+TZOFFSETTO:-0500
+END:STANDARD
+BEGIN:DAYLIGHT
+DTSTART:16010311T020000
+RRULE:FREQ=YEARLY;BYDAY=2SU;BYMONTH=3
+TZOFFSETFROM:-0500
+TZOFFSETTO:-0400
+END:DAYLIGHT
+END:VTIMEZONE
+"""
+
+def use_local_zone(monkeypatch, name):
+    monkeypatch.setattr(ical_parser, 'LOCAL_TIMEZONE', name)
+    for cached in (ical_parser.local_zone, ical_parser.to_local, ical_parser.from_local):
+        cached.cache_clear()
+
+@pytest.fixture
+def bratislava(monkeypatch):
+    use_local_zone(monkeypatch, 'Europe/Bratislava')
+    yield
+    use_local_zone(monkeypatch, None)
+
+@pytest.fixture
+def utc(monkeypatch):
+    use_local_zone(monkeypatch, 'UTC')
+    yield
+    use_local_zone(monkeypatch, None)
+
+def test_utc_around_eu_switch(bratislava):
+    # Summer time ends on 25 October 2026 at 01:00 UTC
+    assert parse_datetime('20261025T005900Z') == datetime(2026, 10, 25, 2, 59)
+    assert parse_datetime('20261025T010000Z') == datetime(2026, 10, 25, 2, 0)
+    assert parse_datetime('20261024T120000Z') == datetime(2026, 10, 24, 14, 0)
+    assert parse_datetime('20261026T120000Z') == datetime(2026, 10, 26, 13, 0)
+
+def test_spring_forward_gap(bratislava):
+    # 02:30 does not exist on 29 March 2026; it is read with the offset before the jump
+    params = {'TZID': 'Europe/Berlin'}
+    assert parse_datetime('20260329T023000', params) == datetime(2026, 3, 29, 3, 30)
+    assert parse_datetime('20260329T013000', params) == datetime(2026, 3, 29, 1, 30)
+
+def test_fall_back_fold(utc):
+    # 02:30 happens twice on 25 October 2026; the first (summer time) instance is meant
+    params = {'TZID': 'Europe/Berlin'}
+    assert parse_datetime('20261025T023000', params) == datetime(2026, 10, 25, 0, 30)
+    assert parse_datetime('20261025T033000', params) == datetime(2026, 10, 25, 2, 30)
+
+def expand_series(document):
+    events = parse_events(document)
+    occurrences = RecurrenceExpander().expand(events, datetime(2026, 10, 12), datetime(2026, 11, 11))
+    return [event['dtstart'] for event in occurrences]
+
+# 16:00 in Bratislava, except in the week the EU is already on winter time and the US is not
+MISMATCH_WEEK = [
+    datetime(2026, 10, 13, 16, 0),
+    datetime(2026, 10, 20, 16, 0),
+    datetime(2026, 10, 27, 15, 0),
+    datetime(2026, 11, 3, 16, 0),
+    datetime(2026, 11, 10, 16, 0),
+]
+
+def test_new_york_series_across_mismatch_week(bratislava):
+    document = NEW_YORK_SERIES.format(timezone="", tzid="America/New_York")
+    assert expand_series(document)[:5] == MISMATCH_WEEK
+
+def test_windows_vtimezone_series_across_mismatch_week(bratislava):
+    document = NEW_YORK_SERIES.format(timezone=WINDOWS_EASTERN, tzid="Eastern Standard Time")
+    assert expand_series(document)[:5] == MISMATCH_WEEK
+
+def test_vtimezone_shared_across_parses(bratislava):
+    document = NEW_YORK_SERIES.format(timezone=WINDOWS_EASTERN, tzid="Eastern Standard Time")
+    first, second = {}, {}
+    list(parse_events_from_lines(document.splitlines(), first))
+    list(parse_events_from_lines(document.splitlines(), second))
+    assert first["Eastern Standard Time"] is second["Eastern Standard Time"]
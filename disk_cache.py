@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+"""
+Size-capped on-disk cache with LRU eviction
+Shared by the image thumbnail cache and the full-text article cache
+"""
+
+import os
+import re
+import threading
+from collections import OrderedDict
+
+VALID_KEY = re.compile(r'^[A-Za-z0-9._-]+$')
+
+class DiskCache:
+    """Files in one directory, named by key; least recently used files are evicted first
+
+    With group, a callable mapping a key to its group, the entries of a group are
+    used and evicted as one.
+    """
+
+    def __init__(self, directory, max_bytes, group=None):
+        self.directory = os.path.expanduser(directory)
+        self.max_bytes = max_bytes
+        self.group = group
+        self.entries = OrderedDict()  # key -> size, oldest first
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.lock = threading.Lock()
+
+        os.makedirs(self.directory, exist_ok=True)
+
+        # Rebuild LRU order from file modification times
+        existing = []
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            if VALID_KEY.match(name) and '.tmp' not in name and os.path.isfile(path):
+                stat = os.stat(path)
+                existing.append((stat.st_mtime, name, stat.st_size))
+        for _, name, size in sorted(existing):
+            self.entries[name] = size
+            self.total_bytes += size
+
+        with self.lock:
+            self._evict()
+
+    def path(self, key):
+        """Filesystem path of a cache entry"""
+        if not VALID_KEY.match(key):
+            raise ValueError(f"Invalid cache key: {key}")
+        return os.path.join(self.directory, key)
+
+    def __contains__(self, key):
+        return key in self.entries
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get(self, key):
+        """Return cached bytes or None, marking the entry as recently used"""
+        with self.lock:
+            if key not in self.entries:
+                self.misses += 1
+                return None
+            try:
+                with open(self.path(key), 'rb') as f:
+                    data = f.read()
+            except OSError:
+                self.total_bytes -= self.entries.pop(key)
+                self.misses += 1
+                return None
+            self._touch(key)
+            self.hits += 1
+            return data
+
+    def touch(self, key):
+        """Mark an entry as recently used without reading it, returns whether it is cached"""
+        with self.lock:
+            if key not in self.entries:
+                self.misses += 1
+                return False
+            self._touch(key)
+            self.hits += 1
+            return True
+
+    def put(self, key, data):
+        """Store bytes under key and evict old entries above the size cap"""
+        path = self.path(key)
+        tmp_path = f"{path}.tmp{threading.get_ident()}"
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+        with self.lock:
+            self.total_bytes -= self.entries.pop(key, 0)
+            self.entries[key] = len(data)
+            self.total_bytes += len(data)
+            if self.group:
+                self._touch(key)
+            self._evict()
+
+    def _touch(self, key):
+        touched = [key]
+        if self.group:
+            # A group ages as one, or its oldest member would take the rest with it
+            group = self.group(key)
+            touched = [other for other in self.entries if self.group(other) == group]
+        for other in touched:
+            self.entries.move_to_end(other)
+            try:
+                os.utime(self.path(other))
+            except OSError:
+                pass
+
+    def _evict(self):
+        while self.total_bytes > self.max_bytes and len(self.entries) > 1:
+            key = next(iter(self.entries))
+            victims = [key]
+            if self.group:
+                group = self.group(key)
+                victims = [other for other in self.entries if self.group(other) == group]
+            for victim in victims:
+                self.total_bytes -= self.entries.pop(victim)
+                self.evictions += 1
+                try:
+                    os.remove(self.path(victim))
+                except OSError:
+                    pass
+
+    def stats(self):
+        """Counters for status reporting"""
+        return {
+            'entries': len(self.entries),
+            'bytes': self.total_bytes,
+            'max_bytes': self.max_bytes,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions
+        }
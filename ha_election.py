@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+"""
+Active/standby leader election over MQTT
+Instances compete for a retained lock topic; the leader's Last Will clears it
+"""
+
+import os
+import json
+import time
+import random
+import socket
+import threading
+from datetime import datetime
+
+import paho.mqtt.client as mqtt
+
+def default_log(message):
+    timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    print(f"[{timestamp}] {message}", flush=True)
+
+class LeaderElection:
+    """Retained-lock election: the instance named in the lock topic is the leader
+
+    Claims are retained QoS 1 publishes of {"id", "since"}. Every instance sees the
+    claims in the broker's order, so the last claim wins everywhere. The lock is
+    cleared by the leader's will when its connection is lost (after about 1.5x the
+    keepalive) or by a clean stop; standbys then claim after a short jittered delay.
+    """
+
+    def __init__(self, broker, lock_topic, instance_id="", keepalive=3, claim_delay=0.5, log=None):
+        self.host = broker.get('host', 'localhost')
+        self.port = broker.get('port', 1883)
+        self.lock_topic = lock_topic
+        self.id = instance_id or f"{socket.gethostname()}-{os.getpid()}"
+        self.keepalive = keepalive
+        self.claim_delay = claim_delay
+        self.log = log or default_log
+
+        self.connected = False
+        self.holder = None  # id in the lock topic, "" when free, None before it is known
+        self.leader_since = None
+        self.transitions = 0
+        self.stopping = False
+        self.lock = threading.Lock()
+
+        self.client = mqtt.Client(client_id=f"rss-mqtt-ha-{self.id}")
+        if broker.get('username'):
+            self.client.username_pw_set(broker['username'], broker.get('password'))
+        self.client.will_set(self.lock_topic, payload=None, qos=1, retain=True)
+        self.client.reconnect_delay_set(1, 10)
+        self.client.on_connect = self.on_connect
+        self.client.on_disconnect = self.on_disconnect
+        self.client.on_subscribe = self.on_subscribe
+        self.client.on_message = self.on_message
+
+    def start(self):
+        self.client.connect_async(self.host, self.port, self.keepalive)
+        self.client.loop_start()
+
+    def stop(self):
+        """Hand over cleanly - clearing the lock lets a standby take over at once"""
+        with self.lock:
+            self.stopping = True
+        if self.is_leader():
+            self.client.publish(self.lock_topic, None, qos=1, retain=True).wait_for_publish(2)
+        self.client.disconnect()
+        self.client.loop_stop()
+
+    def is_leader(self):
+        return self.connected and self.holder == self.id
+
+    def on_connect(self, client, userdata, flags, rc):
+        if rc != 0:
+            self.log(f"HA: failed to connect to {self.host}:{self.port}, return code {rc}")
+            return
+        self.connected = True
+        client.subscribe(self.lock_topic, qos=1)
+
+    def on_disconnect(self, client, userdata, rc):
+        with self.lock:
+            was_leader = self.is_leader()
+            self.connected = False
+            self.holder = None
+        if was_leader:
+            self.set_role(False)
+
+    def on_subscribe(self, client, userdata, mid, granted_qos):
+        # A retained lock arrives right after the SUBACK; if none does, the lock is free
+        self.schedule_claim()
+
+    def on_message(self, client, userdata, message):
+        holder = ""
+        if message.payload:
+            try:
+                holder = json.loads(message.payload).get('id', "")
+            except (ValueError, AttributeError):
+                holder = ""
+
+        with self.lock:
+            if self.stopping:
+                return
+            was_leader = self.is_leader()
+            if holder == "" and was_leader:
+                # Our lock was cleared (e.g. by a stale will) - keep leading and take it back
+                self.claim()
+                return
+            self.holder = holder
+            leader = self.is_leader()
+
+        if leader != was_leader:
+            self.set_role(leader)
+        if holder == "":
+            self.schedule_claim()
+
+    def schedule_claim(self):
+        delay = self.claim_delay * (1 + random.random())
+        timer = threading.Timer(delay, self.claim_if_free)
+        timer.daemon = True
+        timer.start()
+
+    def claim_if_free(self):
+        with self.lock:
+            free = self.connected and not self.holder and not self.stopping
+        if free:
+            self.claim()
+
+    def claim(self):
+        claim = json.dumps({'id': self.id, 'since': time.time()})
+        self.client.publish(self.lock_topic, claim, qos=1, retain=True)
+
+    def set_role(self, leader):
+        self.transitions += 1
+        self.leader_since = time.time() if leader else None
+        self.log(f"HA: {self.id} is now {'leader' if leader else 'standby'}")
+
+    def health(self):
+        return {
+            'id': self.id,
+            'role': 'leader' if self.is_leader() else 'standby',
+            'holder': self.holder,
+            'connected': self.connected,
+            'leader_since': self.leader_since,
+            'transitions': self.transitions
+        }
@@ -0,0 +1,164 @@
+#!/usr/bin/env python3
+"""
+Article image extraction and e-ink thumbnail cache
+Each image is downloaded once, then downscaled and dithered once per panel profile
+"""
+
+import io
+import os
+import json
+import hashlib
+import urllib.request
+
+from disk_cache import DiskCache
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+# Colours available on common e-paper panels
+PALETTES = {
+    "bw": [(0, 0, 0), (255, 255, 255)],
+    "bwr": [(0, 0, 0), (255, 255, 255), (255, 0, 0)],
+    "bwy": [(0, 0, 0), (255, 255, 255), (255, 255, 0)],
+    "gray4": [(0, 0, 0), (85, 85, 85), (170, 170, 170), (255, 255, 255)],
+}
+
+DOWNLOAD_TIMEOUT = 10
+MAX_DOWNLOAD_BYTES = 5 * 1024 * 1024
+
+def find_image_url(entry):
+    """Pick the best image URL from media:thumbnail, media:content or an enclosure"""
+    for thumbnail in entry.get('media_thumbnail', []):
+        if thumbnail.get('url'):
+            return thumbnail['url']
+
+    for media in entry.get('media_content', []):
+        medium = media.get('medium', '')
+        media_type = media.get('type', '')
+        if media.get('url') and (medium == 'image' or media_type.startswith('image/')):
+            return media['url']
+
+    for enclosure in entry.get('enclosures', []):
+        if enclosure.get('href') and enclosure.get('type', '').startswith('image/'):
+            return enclosure['href']
+
+    return None
+
+def render_for_panel(data, profile):
+    """Downscale to the panel size and dither to its palette, returns PNG bytes"""
+    image = Image.open(io.BytesIO(data))
+    image.draft('RGB', tuple(profile['size']))  # Cheap JPEG downscale while decoding
+    image = image.convert('RGB')
+    image.thumbnail(tuple(profile['size']), Image.LANCZOS)
+
+    colors = PALETTES[profile.get('palette', 'bw')]
+    palette_image = Image.new('P', (1, 1))
+    flat = [channel for color in colors for channel in color]
+    palette_image.putpalette(flat + flat[:3] * (256 - len(colors)))
+
+    dither = getattr(Image, 'Dither', Image).FLOYDSTEINBERG
+    image = image.quantize(palette=palette_image, dither=dither)
+
+    output = io.BytesIO()
+    image.save(output, format='PNG', optimize=True)
+    return output.getvalue()
+
+def image_key(name):
+    """Content key of a cached original or rendition, e.g. '<key>-epaper.png' -> '<key>'"""
+    return name.split('.')[0].split('-')[0]
+
+class ImageCache:
+    """Content-addressed cache of original images and their per-panel renditions
+
+    An image's original and renditions are used and evicted together, so a
+    missing rendition beside a cached original was never rendered. An evicted
+    image is only downloaded and rendered again for a new article that uses it.
+    """
+
+    def __init__(self, directory, max_bytes, profiles, url_base="", log=print):
+        self.cache = DiskCache(directory, max_bytes, group=image_key)
+        self.profiles = profiles
+        self.url_base = url_base.rstrip('/')
+        self.log = log
+        self.failed_urls = set()
+
+        # Source URL -> content key, kept beside the cache so restarts don't refetch
+        self.index_file = self.cache.directory.rstrip('/') + '.index.json'
+        try:
+            with open(self.index_file) as f:
+                self.url_index = json.load(f)
+        except (OSError, ValueError):
+            self.url_index = {}
+
+    def save_index(self):
+        """Persist the URL index, dropping images that were evicted"""
+        self.url_index = {url: key for url, key in self.url_index.items()
+                          if f"{key}.orig" in self.cache}
+        tmp_file = self.index_file + '.tmp'
+        with open(tmp_file, 'w') as f:
+            json.dump(self.url_index, f)
+        os.replace(tmp_file, self.index_file)
+
+    def download(self, url):
+        """Fetch image bytes, refusing anything above MAX_DOWNLOAD_BYTES"""
+        request = urllib.request.Request(url, headers={'User-Agent': 'rss-mqtt-publisher/1.0'})
+        with urllib.request.urlopen(request, timeout=DOWNLOAD_TIMEOUT) as response:
+            data = response.read(MAX_DOWNLOAD_BYTES + 1)
+        if len(data) > MAX_DOWNLOAD_BYTES:
+            raise ValueError("image too large")
+        return data
+
+    def rendition_key(self, key, profile_name):
+        return f"{key}-{profile_name}.png"
+
+    def rendition_url(self, key, profile_name):
+        """Local URL (or cache path when no URL base is configured) of a rendition"""
+        rendition = self.rendition_key(key, profile_name)
+        if self.url_base:
+            return f"{self.url_base}/{rendition}"
+        return self.cache.path(rendition)
+
+    def renditions(self, key):
+        """Profile name -> URL of every rendition still cached, '' for the missing ones"""
+        urls = {}
+        for name in self.profiles:
+            cached = key and self.cache.touch(self.rendition_key(key, name))
+            urls[name] = self.rendition_url(key, name) if cached else ''
+        return urls
+
+    def process(self, url):
+        """Make sure the image and all its renditions are cached, returns the content key"""
+        key = self.url_index.get(url)
+        original = None
+
+        if key is None:
+            if url in self.failed_urls:
+                return None
+            try:
+                original = self.download(url)
+            except Exception as e:
+                self.failed_urls.add(url)
+                self.log(f"Error downloading image {url}: {e}")
+                return None
+            key = hashlib.sha256(original).hexdigest()[:32]
+            if f"{key}.orig" not in self.cache:
+                self.cache.put(f"{key}.orig", original)
+            self.url_index[url] = key
+            self.save_index()
+
+        for name, profile in self.profiles.items():
+            rendition = self.rendition_key(key, name)
+            if self.cache.touch(rendition):
+                continue
+            if original is None:
+                original = self.cache.get(f"{key}.orig")
+                if original is None:
+                    break  # Image evicted since it was indexed - not rendered again
+            try:
+                self.cache.put(rendition, render_for_panel(original, profile))
+            except Exception as e:
+                self.log(f"Error rendering image {url} for {name}: {e}")
+
+        return key
@@ -33,14 +33,17 @@ echo ""
 # Copy publisher script
 echo "Installing RSS publisher..."
 cp rss_mqtt_publisher.py ~/rss_mqtt_publisher.py
+cp disk_cache.py image_cache.py article_text.py mqtt_fanout.py watchlist.py ha_election.py state_bridge.py runtime.py ~/
+cp calendar/gcal_caldav_simple.py calendar/ical_parser.py calendar/recurrence.py calendar/event_index.py calendar/calendar_sources.py ~/  # calendar source hosted by runtime.py
+cp calendar/gcal_caldav_connector.py calendar/gcal_mqtt_connector.py ~/  # "caldav" and "google" kinds in ~/.gcal_sources.json
 chmod +x ~/rss_mqtt_publisher.py
 echo "✓ Publisher installed to ~/rss_mqtt_publisher.py"
 echo ""
 
 # Install management commands
 echo "Installing management commands..."
-sudo cp bin/rss_* /usr/local/bin/
-sudo chmod +x /usr/local/bin/rss_*
+sudo cp bin/rss_* bin/mqtt_snapshot /usr/local/bin/
+sudo chmod +x /usr/local/bin/rss_* /usr/local/bin/mqtt_snapshot
 echo "✓ Commands installed to /usr/local/bin/"
 echo ""
 
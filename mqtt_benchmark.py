@@ -0,0 +1,374 @@
+#!/usr/bin/env python3
+"""
+Broker throughput and latency benchmark for the RSS publisher
+Runs the real publish path against a local mosquitto or an in-process MQTT broker
+stand-in, with N subscribing displays, across QoS / payload / dedup configurations
+"""
+
+import sys
+import time
+import asyncio
+import argparse
+import itertools
+import threading
+
+import paho.mqtt.client as mqtt
+
+import rss_mqtt_publisher as publisher
+from mqtt_fanout import MQTTFanout
+
+DISPLAY_TOPICS = ["news/#", "today/#"]
+
+# MQTT 3.1.1 packet types
+CONNECT, CONNACK, PUBLISH, PUBACK = 1, 2, 3, 4
+SUBSCRIBE, SUBACK, UNSUBSCRIBE, UNSUBACK = 8, 9, 10, 11
+PINGREQ, PINGRESP, DISCONNECT = 12, 13, 14
+
+def encode_length(length):
+    """MQTT variable length integer"""
+    encoded = bytearray()
+    while True:
+        byte = length % 128
+        length //= 128
+        if length:
+            byte |= 0x80
+        encoded.append(byte)
+        if not length:
+            return bytes(encoded)
+
+def topic_matches(topic_filter, topic):
+    """MQTT wildcard matching for + and #"""
+    filter_levels = topic_filter.split('/')
+    topic_levels = topic.split('/')
+    for index, level in enumerate(filter_levels):
+        if level == '#':
+            return True
+        if index >= len(topic_levels):
+            return False
+        if level != '+' and level != topic_levels[index]:
+            return False
+    return len(filter_levels) == len(topic_levels)
+
+class BrokerStandIn:
+    """Minimal in-process MQTT 3.1.1 broker: QoS 0/1, retained messages and wildcards
+
+    Good enough to measure the publisher and its displays without a real broker;
+    it does not implement sessions, QoS 2, wills or MQTT 5.
+    """
+
+    def __init__(self, host="127.0.0.1", port=0):
+        self.host = host
+        self.port = port
+        self.retained = {}
+        self.sessions = {}  # writer -> {topic_filter: qos}
+        self.received = 0
+        self.delivered = 0
+        self.packet_ids = itertools.count(1)
+        self.loop = None
+        self.ready = threading.Event()
+
+    def start(self):
+        thread = threading.Thread(target=self.run, name="broker-stand-in", daemon=True)
+        thread.start()
+        self.ready.wait()
+
+    def run(self):
+        self.loop = asyncio.new_event_loop()
+        server = self.loop.run_until_complete(asyncio.start_server(self.handle, self.host, self.port))
+        self.port = server.sockets[0].getsockname()[1]
+        self.ready.set()
+        self.loop.run_forever()
+
+    async def read_packet(self, reader):
+        header = (await reader.readexactly(1))[0]
+        length, multiplier = 0, 1
+        while True:
+            byte = (await reader.readexactly(1))[0]
+            length += (byte & 0x7F) * multiplier
+            multiplier *= 128
+            if not byte & 0x80:
+                break
+        body = await reader.readexactly(length) if length else b''
+        return header >> 4, header & 0x0F, body
+
+    async def handle(self, reader, writer):
+        try:
+            while True:
+                packet_type, flags, body = await self.read_packet(reader)
+                if packet_type == CONNECT:
+                    protocol_level = body[6] if len(body) > 6 else 0
+                    if protocol_level != 4:
+                        writer.write(bytes([CONNACK << 4, 2, 0, 1]))  # unacceptable protocol version
+                        break
+                    self.sessions[writer] = {}
+                    writer.write(bytes([CONNACK << 4, 2, 0, 0]))
+                elif packet_type == PUBLISH:
+                    self.on_publish(writer, flags, body)
+                elif packet_type == SUBSCRIBE:
+                    self.on_subscribe(writer, body)
+                elif packet_type == UNSUBSCRIBE:
+                    writer.write(bytes([UNSUBACK << 4, 2]) + body[:2])
+                elif packet_type == PINGREQ:
+                    writer.write(bytes([PINGRESP << 4, 0]))
+                elif packet_type == DISCONNECT:
+                    break
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            self.sessions.pop(writer, None)
+            writer.close()
+
+    def on_publish(self, writer, flags, body):
+        qos = (flags >> 1) & 0x03
+        retain = flags & 0x01
+        topic_length = int.from_bytes(body[:2], 'big')
+        topic = body[2:2 + topic_length].decode('utf-8')
+        offset = 2 + topic_length
+        if qos:
+            writer.write(bytes([PUBACK << 4, 2]) + body[offset:offset + 2])
+            offset += 2
+        payload = body[offset:]
+        self.received += 1
+
+        if retain:
+            if payload:
+                self.retained[topic] = (payload, qos)
+            else:
+                self.retained.pop(topic, None)
+
+        for subscriber, subscriptions in list(self.sessions.items()):
+            granted = [sub_qos for topic_filter, sub_qos in subscriptions.items()
+                       if topic_matches(topic_filter, topic)]
+            if granted:
+                self.deliver(subscriber, topic, payload, min(qos, max(granted)), False)
+
+    def on_subscribe(self, writer, body):
+        packet_id = body[:2]
+        offset = 2
+        granted = []
+        subscriptions = self.sessions.setdefault(writer, {})
+        while offset < len(body):
+            length = int.from_bytes(body[offset:offset + 2], 'big')
+            topic_filter = body[offset + 2:offset + 2 + length].decode('utf-8')
+            qos = min(body[offset + 2 + length], 1)
+            offset += 3 + length
+            subscriptions[topic_filter] = qos
+            granted.append(qos)
+        writer.write(bytes([SUBACK << 4]) + encode_length(2 + len(granted)) + packet_id + bytes(granted))
+
+        for topic, (payload, qos) in list(self.retained.items()):
+            for topic_filter in subscriptions:
+                if topic_matches(topic_filter, topic):
+                    self.deliver(writer, topic, payload, min(qos, subscriptions[topic_filter]), True)
+                    break
+
+    def deliver(self, writer, topic, payload, qos, retain):
+        topic_bytes = topic.encode('utf-8')
+        variable = len(topic_bytes).to_bytes(2, 'big') + topic_bytes
+        if qos:
+            variable += (next(self.packet_ids) % 65535 + 1).to_bytes(2, 'big')
+        header = (PUBLISH << 4) | (qos << 1) | (1 if retain else 0)
+        writer.write(bytes([header]) + encode_length(len(variable) + len(payload)) + variable + payload)
+        self.delivered += 1
+
+class DedupPublisher:
+    """Skips retained publishes whose payload equals what the topic already holds"""
+
+    def __init__(self, client):
+        self.client = client
+        self.values = {}
+        self.skipped = 0
+
+    def publish(self, topic, payload=None, qos=0, retain=False, expiry=None):
+        if retain and self.values.get(topic) == payload:
+            self.skipped += 1
+            return
+        if retain:
+            self.values[topic] = payload
+        self.client.publish(topic, payload, qos=qos, retain=retain, expiry=expiry)
+
+class Display:
+    """Subscribing display that records end-to-end latency of unique payloads"""
+
+    def __init__(self, host, port, qos, sent_times):
+        self.sent_times = sent_times
+        self.qos = qos
+        self.latencies = []
+        self.received = 0
+        self.retained_received = 0
+        self.subscribed = threading.Event()
+        self.client = mqtt.Client()
+        self.client.on_connect = self.on_connect
+        self.client.on_subscribe = lambda client, userdata, mid, granted: self.subscribed.set()
+        self.client.on_message = self.on_message
+        self.client.connect(host, port, 60)
+        self.client.loop_start()
+
+    def on_connect(self, client, userdata, flags, rc):
+        client.subscribe([(topic, self.qos) for topic in DISPLAY_TOPICS])
+
+    def on_message(self, client, userdata, message):
+        now = time.perf_counter()
+        self.received += 1
+        if message.retain:
+            self.retained_received += 1
+        sent = self.sent_times.get((message.topic, message.payload))
+        if sent is not None and not message.retain:
+            self.latencies.append(now - sent)
+
+    def stop(self):
+        self.client.loop_stop()
+        self.client.disconnect()
+
+def make_articles(count):
+    """Synthetic articles normalized through the publisher's own code path"""
+    feeds = publisher.RSS_FEEDS
+    articles = []
+    for index in range(count):
+        feed = feeds[index % len(feeds)]
+        entry = {
+            'title': f"Benchmark story {index} from {feed['name']}",
+            'link': f"{feed['url']}#bench-{index}",
+            'description': f"Benchmark article body {index}. " * 20,
+            'published': "Mon, 19 Oct 2026 08:00:00 GMT"
+        }
+        articles.append(publisher.normalize_entry(feed, entry, f"bench-{index}"))
+    return articles
+
+def percentile(values, fraction):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(int(len(ordered) * fraction), len(ordered) - 1)]
+
+def wait_until(condition, timeout):
+    deadline = time.perf_counter() + timeout
+    while not condition():
+        if time.perf_counter() > deadline:
+            return False
+        time.sleep(0.001)
+    return True
+
+def run_config(host, port, displays, articles, qos, compound, dedup, timeout):
+    """Publish a burst of articles and clock ticks, return the measurements"""
+    publisher.PUBLISH_COMPOUND_ARTICLE = compound
+    publisher.PUBLISH_SPLIT_TOPICS = not compound
+    publisher.MQTT_QOS = qos
+
+    sent_times = {}
+    fanout = MQTTFanout([{"host": host, "port": port}], log=lambda message: None)
+    fanout.start()
+    wait_until(fanout.is_connected, timeout)
+    client = DedupPublisher(fanout) if dedup else fanout
+
+    screens = [Display(host, port, qos, sent_times) for _ in range(displays)]
+    for screen in screens:
+        screen.subscribed.wait(timeout)
+    for screen in screens:
+        screen.received = screen.retained_received = 0
+        screen.latencies.clear()
+
+    # Record send times only for the payloads that are unique per article
+    unique_topics = {publisher.MQTT_TOPIC_HEADLINE, publisher.MQTT_TOPIC_ARTICLE, publisher.MQTT_TOPIC_SECONDS}
+
+    class Recorder:
+        def publish(self, topic, payload=None, qos=0, retain=False, expiry=None):
+            if topic in unique_topics:
+                data = payload.encode('utf-8') if isinstance(payload, str) else payload
+                sent_times[(topic, data)] = time.perf_counter()
+            client.publish(topic, payload, qos=qos, retain=retain, expiry=expiry)
+
+    recorder = Recorder()
+    connection = fanout.connections[0]
+    before = connection.published
+    cpu_start = time.process_time()
+    wall_start = time.perf_counter()
+
+    for index, article in enumerate(articles):
+        publisher.publish_article(recorder, article)
+        recorder.publish(publisher.MQTT_TOPIC_SECONDS, f"{index % 60:02d}-{index}", qos=qos)
+
+    wait_until(lambda: connection.queue.qsize() == 0, timeout)
+    published = connection.published - before
+    expected = published * displays
+    wait_until(lambda: sum(screen.received for screen in screens) >= expected, timeout)
+    wall_seconds = time.perf_counter() - wall_start
+    cpu_seconds = time.process_time() - cpu_start
+
+    latencies = [latency for screen in screens for latency in screen.latencies]
+
+    # Retained-state convergence: a display reconnects and needs every retained topic back
+    retained_count = len([topic for topic in fanout.retained_snapshot()
+                          if any(topic_matches(pattern, topic) for pattern in DISPLAY_TOPICS)])
+    screens[0].stop()
+    reconnect_start = time.perf_counter()
+    returning = Display(host, port, qos, sent_times)
+    converged = wait_until(lambda: returning.retained_received >= retained_count, timeout)
+    convergence = time.perf_counter() - reconnect_start if converged else float('nan')
+    returning.stop()
+
+    for screen in screens[1:]:
+        screen.stop()
+    fanout.stop()
+
+    return {
+        'qos': qos,
+        'payload': 'compound' if compound else 'split',
+        'dedup': 'on' if dedup else 'off',
+        'messages': published,
+        'rate': published / wall_seconds if wall_seconds else 0.0,
+        'p50': percentile(latencies, 0.50) * 1000,
+        'p95': percentile(latencies, 0.95) * 1000,
+        'p99': percentile(latencies, 0.99) * 1000,
+        'convergence': convergence * 1000,
+        'cpu_per_message': cpu_seconds * 1e6 / published if published else 0.0
+    }
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="MQTT throughput and latency benchmark")
+    parser.add_argument("--broker", metavar="HOST:PORT",
+                        help="use a running broker (e.g. localhost:1883) instead of the in-process stand-in")
+    parser.add_argument("--displays", type=int, default=5, help="subscribing displays (default 5)")
+    parser.add_argument("--articles", type=int, default=200, help="articles per configuration (default 200)")
+    parser.add_argument("--qos", type=int, nargs="+", default=[0, 1], choices=[0, 1])
+    parser.add_argument("--timeout", type=float, default=30, help="seconds to wait for delivery")
+    return parser.parse_args()
+
+def main():
+    args = parse_args()
+    publisher.logging_enabled = False
+
+    if args.broker:
+        host, _, port = args.broker.partition(':')
+        port = int(port or 1883)
+        broker = None
+        print(f"Benchmarking against {host}:{port}")
+    else:
+        broker = BrokerStandIn()
+        broker.start()
+        host, port = broker.host, broker.port
+        print(f"Benchmarking against in-process broker stand-in on port {port} "
+              "(CPU figures include the broker and the displays)")
+
+    articles = make_articles(args.articles)
+    print(f"{args.displays} displays, {args.articles} articles per configuration\n")
+    print(f"{'qos':>3} {'payload':>8} {'dedup':>5} {'msgs':>6} {'msg/s':>8} "
+          f"{'p50 ms':>7} {'p95 ms':>7} {'p99 ms':>7} {'conv ms':>8} {'cpu us/msg':>10}")
+
+    results = []
+    for qos, compound, dedup in itertools.product(args.qos, [False, True], [False, True]):
+        result = run_config(host, port, args.displays, articles, qos, compound, dedup, args.timeout)
+        results.append(result)
+        print(f"{result['qos']:>3} {result['payload']:>8} {result['dedup']:>5} {result['messages']:>6} "
+              f"{result['rate']:>8.0f} {result['p50']:>7.2f} {result['p95']:>7.2f} {result['p99']:>7.2f} "
+              f"{result['convergence']:>8.1f} {result['cpu_per_message']:>10.1f}")
+
+    if broker:
+        print(f"\nBroker stand-in received {broker.received} and delivered {broker.delivered} messages")
+    best = max(results, key=lambda result: result['rate'])
+    print(f"Highest rate: qos {best['qos']}, {best['payload']} payload, dedup {best['dedup']} "
+          f"({best['rate']:.0f} msg/s, median latency {best['p50']:.2f} ms)")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,226 @@
+#!/usr/bin/env python3
+"""
+MQTT fan-out to several brokers from one process
+Every broker gets its own connection, outbound queue, worker thread and health state
+
+With protocol=5 messages can carry an expiry interval and user properties, and
+the topics listed in alias_topics are sent as MQTT 5 topic aliases.
+"""
+
+import queue
+import threading
+import time
+from datetime import datetime
+
+import paho.mqtt.client as mqtt
+from paho.mqtt.properties import Properties
+from paho.mqtt.packettypes import PacketTypes
+
+OUTBOUND_QUEUE_SIZE = 1000  # messages waiting per broker before the oldest are dropped
+RECONNECT_MIN_DELAY = 1
+RECONNECT_MAX_DELAY = 60
+
+def default_log(message):
+    timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    print(f"[{timestamp}] {message}", flush=True)
+
+class BrokerConnection:
+    """One broker: paho client, bounded outbound queue and a worker draining it
+
+    A slow or unreachable broker only ever fills its own queue. Non-retained
+    messages are dropped while it is down; the fan-out replays the latest retained
+    value of every topic when it connects again.
+    """
+
+    def __init__(self, config, fanout):
+        self.host = config.get('host', 'localhost')
+        self.port = config.get('port', 1883)
+        self.keepalive = config.get('keepalive', 60)
+        self.name = config.get('name', f"{self.host}:{self.port}")
+        self.fanout = fanout
+        self.queue = queue.Queue(maxsize=config.get('queue_size', OUTBOUND_QUEUE_SIZE))
+
+        self.connected = False
+        self.published = 0
+        self.dropped = 0
+        self.errors = 0
+        self.last_connected = None
+        self.last_error = ""
+
+        self.protocol = config.get('protocol', fanout.protocol)
+        self.aliases = {}  # topic -> alias, valid for the current connection only
+        self.alias_maximum = 0
+        self.alias_lock = threading.Lock()
+
+        if self.protocol == 5:
+            self.client = mqtt.Client(protocol=mqtt.MQTTv5)
+        else:
+            self.client = mqtt.Client()
+        if config.get('username'):
+            self.client.username_pw_set(config['username'], config.get('password'))
+        self.client.reconnect_delay_set(RECONNECT_MIN_DELAY, RECONNECT_MAX_DELAY)
+        self.client.on_connect = self.on_connect
+        self.client.on_disconnect = self.on_disconnect
+
+        self.worker = threading.Thread(target=self.run, name=f"mqtt-{self.name}", daemon=True)
+        self.running = False
+
+    def start(self):
+        self.running = True
+        self.worker.start()
+        self.client.connect_async(self.host, self.port, self.keepalive)
+        self.client.loop_start()
+
+    def stop(self):
+        self.running = False
+        self.enqueue(None)
+        self.client.loop_stop()
+        self.client.disconnect()
+
+    def on_connect(self, client, userdata, flags, rc, properties=None):
+        if rc == 0:
+            with self.alias_lock:
+                self.aliases = {}
+                self.alias_maximum = getattr(properties, 'TopicAliasMaximum', 0) if properties else 0
+            self.connected = True
+            self.last_connected = time.time()
+            self.fanout.log(f"Connected to MQTT Broker {self.name}"
+                            + (f" (MQTT 5, {self.alias_maximum} topic aliases)" if self.protocol == 5 else ""))
+            # Bring this broker's retained state up to date
+            for topic, (payload, qos, expiry) in self.fanout.retained_snapshot().items():
+                self.enqueue((topic, payload, qos, True, expiry))
+        else:
+            self.last_error = str(rc) if self.protocol == 5 else mqtt.connack_string(rc)
+            self.fanout.log(f"Failed to connect to {self.name}, return code {rc}")
+
+    def on_disconnect(self, client, userdata, rc, properties=None):
+        self.connected = False
+        if rc != 0:
+            self.last_error = str(rc) if self.protocol == 5 else mqtt.error_string(rc)
+            self.fanout.log(f"Lost connection to MQTT Broker {self.name}: {self.last_error}")
+
+    def enqueue(self, message):
+        """Queue without ever blocking the caller - the oldest message gives way"""
+        while True:
+            try:
+                self.queue.put_nowait(message)
+                return
+            except queue.Full:
+                try:
+                    self.queue.get_nowait()
+                    self.dropped += 1
+                except queue.Empty:
+                    pass
+
+    def run(self):
+        while self.running:
+            message = self.queue.get()
+            if message is None:
+                continue
+            if not self.connected:
+                self.dropped += 1
+                continue
+            topic, payload, qos, retain, expiry = message
+            properties = None
+            if self.protocol == 5:
+                topic, properties = self.v5_properties(topic, qos, expiry)
+            info = self.client.publish(topic, payload, qos=qos, retain=retain, properties=properties)
+            if info.rc == mqtt.MQTT_ERR_SUCCESS:
+                self.published += 1
+            else:
+                self.errors += 1
+                self.last_error = mqtt.error_string(info.rc)
+
+    def v5_properties(self, topic, qos, expiry):
+        """PUBLISH properties for MQTT 5; returns the topic to send (empty once aliased)
+
+        Only QoS 0 messages are aliased: paho resends unacknowledged QoS 1/2
+        messages after a reconnect as they were, and the new session never
+        defined their alias.
+        """
+        properties = Properties(PacketTypes.PUBLISH)
+        if expiry:
+            properties.MessageExpiryInterval = int(expiry)
+        if self.fanout.user_properties:
+            properties.UserProperty = list(self.fanout.user_properties)
+
+        if qos == 0 and topic in self.fanout.alias_topics:
+            with self.alias_lock:
+                alias = self.aliases.get(topic)
+                if alias is not None:
+                    properties.TopicAlias = alias
+                    return "", properties
+                if len(self.aliases) < self.alias_maximum:
+                    # First use on this connection sends topic and alias together
+                    alias = len(self.aliases) + 1
+                    self.aliases[topic] = alias
+                    properties.TopicAlias = alias
+
+        return topic, properties
+
+    def health(self):
+        return {
+            'broker': self.name,
+            'protocol': self.protocol,
+            'connected': self.connected,
+            'queued': self.queue.qsize(),
+            'published': self.published,
+            'dropped': self.dropped,
+            'errors': self.errors,
+            'last_connected': self.last_connected,
+            'last_error': self.last_error
+        }
+
+class MQTTFanout:
+    """Drop-in publisher that sends every message to all configured brokers"""
+
+    def __init__(self, brokers, log=None, protocol=4, user_properties=None, alias_topics=(), gate=None):
+        self.log = log or default_log
+        self.gate = gate  # publishing is suppressed while gate() is false, e.g. on an HA standby
+        self.protocol = protocol
+        self.user_properties = user_properties or []
+        self.alias_topics = set(alias_topics)
+        self.retained = {}  # topic -> (payload, qos, expiry), replayed to brokers on (re)connect
+        self.retained_lock = threading.Lock()
+        self.listeners = []  # listener(topic, payload, retain) sees every message, e.g. the state bridge
+        self.connections = [BrokerConnection(config, self) for config in brokers]
+
+    def start(self):
+        for connection in self.connections:
+            self.log(f"Connecting to MQTT Broker at {connection.name}")
+            connection.start()
+
+    def stop(self):
+        for connection in self.connections:
+            connection.stop()
+
+    def retained_snapshot(self):
+        with self.retained_lock:
+            return dict(self.retained)
+
+    def add_listener(self, listener):
+        self.listeners.append(listener)
+
+    def clear_retained(self):
+        """Forget the retained state so a reconnect does not replay it"""
+        with self.retained_lock:
+            self.retained.clear()
+
+    def publish(self, topic, payload=None, qos=0, retain=False, expiry=None):
+        """Queue a message for every broker; expiry (seconds) is only sent over MQTT 5"""
+        if self.gate and not self.gate():
+            return
+        if retain:
+            with self.retained_lock:
+                self.retained[topic] = (payload, qos, expiry)
+        message = (topic, payload, qos, retain, expiry)
+        for connection in self.connections:
+            connection.enqueue(message)
+        for listener in self.listeners:
+            listener(topic, payload, retain)
+
+    def is_connected(self):
+        return any(connection.connected for connection in self.connections)
+
+    def health(self):
+        return [connection.health() for connection in self.connections]
@@ -1,11 +1,24 @@
 #!/usr/bin/env python3
 import feedparser
-import paho.mqtt.client as mqtt
 import time
 import hashlib
 import unicodedata
 import sys
-from datetime import datetime
+import argparse
+import urllib.request
+import heapq
+import itertools
+import calendar
+import html
+import json
+from collections import deque
+from datetime import datetime, timedelta
+from image_cache import ImageCache, Image, find_image_url
+from article_text import ArticleTextCache
+from mqtt_fanout import MQTTFanout
+from watchlist import Watchlists
+from ha_election import LeaderElection
+from state_bridge import StateBridge
 
 # Force unbuffered output
 sys.stdout.reconfigure(line_buffering=True)
@@ -14,11 +27,20 @@ sys.stderr.reconfigure(line_buffering=True)
 # MQTT Configuration
 MQTT_BROKER = "localhost"
 MQTT_PORT = 1883
+# Every broker gets the same messages through its own connection and queue
+MQTT_BROKERS = [
+    {"host": MQTT_BROKER, "port": MQTT_PORT},
+    # {"host": "office-pi.local", "port": 1883},
+]
 MQTT_TOPIC_HEADLINE = "news/headline"
 MQTT_TOPIC_CONTENT = "news/content"
 MQTT_TOPIC_SOURCE = "news/source"
 MQTT_TOPIC_LINK = "news/link"
 MQTT_TOPIC_PUBLISH = "news/published"
+MQTT_TOPIC_IMAGE = "news/image"
+MQTT_TOPIC_ARTICLE = "news/article"
+MQTT_TOPIC_ALERT = "news/alert"
+MQTT_TOPIC_STATS = "rss-mqtt/stats"  # retained JSON: feed health, caches, loop latency, brokers
 MQTT_TOPIC_TIME = "today/time"
 MQTT_TOPIC_SECONDS = "today/seconds"
 MQTT_TOPIC_DOW = "today/dow"
@@ -27,6 +49,22 @@ MQTT_TOPIC_LDATE = "today/ldate"
 MQTT_TOPIC_YEAR = "today/year"
 MQTT_TOPIC_NAMEDAY = "today/nameday"
 
+# MQTT 5 mode: topic aliases for the high-frequency topics, message expiry and user properties
+MQTT_PROTOCOL = 4  # 5 enables MQTT v5
+MQTT_USER_PROPERTIES = [("publisher", "rss-mqtt")]
+MQTT_SECONDS_EXPIRY = 2  # today/seconds is stale after this many seconds
+MQTT_QOS = 0  # QoS of the retained article topics
+
+# Publish each article as one JSON snapshot on news/article and/or as separate topics
+PUBLISH_COMPOUND_ARTICLE = False
+PUBLISH_SPLIT_TOPICS = True
+
+# Sent as topic aliases in MQTT 5 mode (up to the broker's alias maximum)
+MQTT_ALIAS_TOPICS = [
+    MQTT_TOPIC_SECONDS, MQTT_TOPIC_TIME, MQTT_TOPIC_ARTICLE, MQTT_TOPIC_HEADLINE,
+    MQTT_TOPIC_CONTENT, MQTT_TOPIC_SOURCE, MQTT_TOPIC_LINK, MQTT_TOPIC_PUBLISH
+]
+
 # Slovak day names (without diacritics)
 SLOVAK_DAYS = ["pondelok", "utorok", "streda", "stvrtok", "piatok", "sobota", "nedela"]
 
@@ -148,26 +186,140 @@ RSS_FEEDS = [
     {"url": "https://www.aljazeera.com/xml/rss/all.xml", "name": "Al Jazeera", "category": "News"}
 ]
 
+# Feed fetching
+FETCH_INTERVAL = 60  # seconds between feed checks - stats are published after each check
+FETCH_TIMEOUT = 30
+FETCH_USER_AGENT = "rss-mqtt-publisher/1.0 (+https://github.com/petermartis/rss-mqtt-project)"
+ENTRIES_PER_FEED = 5  # Only the top entries of each feed are ingested
+
+# Rotation scheduling - the article with the lowest score gets the next display slot
+ROTATION_INTERVAL = 6  # default seconds per display slot
+ROTATION_UNSEEN_BONUS = 5.0  # never-shown articles jump ahead of the rotation
+ROTATION_SHOWN_WEIGHT = 1.0  # per previous display
+ROTATION_FRESHNESS_WEIGHT = 0.1  # per hour of article age
+ROTATION_FAIRNESS_WEIGHT = 0.5  # per slot the same source had among the recent ones
+ROTATION_FAIRNESS_WINDOW = 8  # how many recent slots count for fairness
+
+# Output profiles - how article text is rendered for one kind of display. Every
+# profile is rendered once per article at ingest and cached on the article.
+# Channels pick profiles by name; topic_prefix is prepended to the channel topics.
+OUTPUT_PROFILES = {
+    "ascii": {"charset": "ascii", "max_length": 500, "word_boundary": False, "topic_prefix": ""},
+    # "unicode": {"charset": "unicode", "max_length": 700, "word_boundary": True, "topic_prefix": "unicode/"},
+    # "short": {"charset": "ascii", "max_length": 120, "headline_length": 60,
+    #           "word_boundary": True, "topic_prefix": "short/"},
+}
+DEFAULT_OUTPUT_PROFILES = ["ascii"]
+
+# Rotation channels - every channel has its own topics, filter, interval and queue,
+# but all of them share one fetch and one normalized article store.
+# An empty name publishes to news/*, any other name to news/<name>/*.
+ROTATION_CHANNELS = [
+    {"name": "", "interval": ROTATION_INTERVAL},
+    # {"name": "tech", "categories": ["Tech"], "interval": 10},
+    # {"name": "world", "sources": ["BBC World", "Al Jazeera"], "interval": 30},
+    # {"name": "lobby", "interval": 10, "profiles": ["unicode", "short"]},
+]
+
+# Article images for e-ink panels (optional, needs Pillow)
+IMAGES_ENABLED = False
+IMAGE_CACHE_DIR = "~/.cache/rss-mqtt/images"
+IMAGE_CACHE_MAX_BYTES = 50 * 1024 * 1024
+IMAGE_URL_BASE = ""  # e.g. "http://raspberrypi.local/news-images" if IMAGE_CACHE_DIR is served over HTTP
+PANEL_PROFILES = {
+    "bw_400x300": {"size": (400, 300), "palette": "bw"},
+    "bwr_296x128": {"size": (296, 128), "palette": "bwr"},
+}
+
+# Full article text for teaser-only feeds - fetched when an article is about to be shown
+FULLTEXT_ENABLED = False
+FULLTEXT_CACHE_DIR = "~/.cache/rss-mqtt/articles"
+FULLTEXT_CACHE_MAX_BYTES = 20 * 1024 * 1024
+FULLTEXT_MIN_CONTENT = 200  # feed content shorter than this counts as a teaser
+FULLTEXT_WORKERS = 4
+FULLTEXT_PER_HOST = 2  # concurrent page downloads per site
+
+# Watchlist alerts - '[name]' sections with one term per line, reloaded when the file changes.
+# Matches are whole-word, case and diacritic insensitive, published to news/alert and news/alert/<name>
+WATCHLIST_FILE = "~/.config/rss-mqtt/watchlists.txt"
+
+# Active/standby pair - only the instance holding the lock on the first broker publishes
+HA_ENABLED = False
+HA_LOCK_TOPIC = "rss-mqtt/leader"
+HA_INSTANCE_ID = ""  # defaults to hostname-pid
+HA_KEEPALIVE = 3  # the leader's will fires about 1.5x this many seconds after it disappears
+HA_STANDBY_FETCH_INTERVAL = 300  # the standby keeps its article cache warm at this rate
+
+# HTTP state bridge for browser dashboards: JSON snapshot on /state, Server-Sent Events on /events
+BRIDGE_ENABLED = False
+BRIDGE_HOST = "0.0.0.0"
+BRIDGE_PORT = 8080
+
 # Store seen articles using hash
 seen_articles = set()
+article_store = {}  # Normalized articles by hash, reused across fetches
 feed_entries_cache = {}
-current_feed_index = 0
+image_cache = None
+watchlists = None
+article_text = None
+election = None
+publishing_active = True
+started_at = None
+feed_health = {}  # feed name -> fetch outcome, for rss-mqtt/stats
+loop_stats = {'ticks': 0, 'seconds': 0.0, 'max': 0.0}  # since the last stats publish
+rotation_channels = []
 last_time_minute = -1
 last_time_second = -1
 last_date = None
 last_year = None
+last_check_time = 0
+logging_enabled = True
+
+class Clock:
+    """Wall clock - every scheduler and formatter reads the time through this"""
+
+    def now(self):
+        return datetime.now()
+
+    def time(self):
+        return time.time()
+
+    def sleep(self, seconds):
+        time.sleep(seconds)
+
+class SimulatedClock(Clock):
+    """Virtual clock for simulation mode, sleeping just advances virtual time"""
+
+    def __init__(self, start):
+        self.current = start
+
+    def now(self):
+        return self.current
+
+    def time(self):
+        return self.current.timestamp()
+
+    def sleep(self, seconds):
+        self.current += timedelta(seconds=seconds)
+
+clock = Clock()
 
 def log(message):
     """Log message with timestamp"""
-    print(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] {message}", flush=True)
+    if logging_enabled:
+        print(f"[{clock.now().strftime('%Y-%m-%d %H:%M:%S')}] {message}", flush=True)
 
 def remove_diacritics(text):
     """Remove diacritics/accents from text"""
     nfkd_form = unicodedata.normalize('NFKD', text)
     return ''.join([c for c in nfkd_form if not unicodedata.combining(c)])
 
-def clean_text(text):
-    """Remove HTML tags, special characters, and clean text to plain ASCII"""
+def clean_text(text, charset="ascii"):
+    """Remove HTML tags and special characters, reducing text to the given charset
+
+    "ascii" strips diacritics, "unicode" keeps everything, any other codec name
+    (e.g. "iso-8859-2") drops the characters it cannot encode.
+    """
     if not text:
         return ""
 
@@ -186,45 +338,63 @@ def clean_text(text):
     text = text.replace('&rsquo;', "'").replace('&lsquo;', "'")
     text = text.replace('&rdquo;', '"').replace('&ldquo;', '"')
     text = text.replace('&ndash;', '-').replace('&mdash;', '-')
+    text = html.unescape(text)
 
-    # Remove diacritics
-    text = remove_diacritics(text)
+    if charset == "ascii":
+        # Remove diacritics
+        text = remove_diacritics(text)
 
-    # Remove any remaining non-ASCII characters
-    text = text.encode('ascii', 'ignore').decode('ascii')
+        # Remove any remaining non-ASCII characters
+        text = text.encode('ascii', 'ignore').decode('ascii')
+    elif charset not in ("unicode", "utf-8"):
+        text = text.encode(charset, 'ignore').decode(charset)
 
     # Clean up whitespace
     text = ' '.join(text.split())
 
     return text.strip()
 
+def truncate_text(text, max_length, word_boundary=False):
+    """Limit text to max_length characters including the trailing ellipsis"""
+    if not max_length or len(text) <= max_length:
+        return text
+    cut = text[:max_length - 3]
+    if word_boundary and ' ' in cut:
+        cut = cut.rsplit(' ', 1)[0].rstrip(',;:-')
+    return cut + "..."
+
+def render_profiles(title, content):
+    """Render headline and content once for every output profile"""
+    renderings = {}
+    for name, profile in OUTPUT_PROFILES.items():
+        charset = profile.get('charset', 'ascii')
+        word_boundary = profile.get('word_boundary', False)
+        renderings[name] = {
+            'headline': truncate_text(clean_text(title, charset), profile.get('headline_length'), word_boundary),
+            'content': truncate_text(clean_text(content, charset), profile.get('max_length'), word_boundary)
+        }
+    return renderings
+
 def get_article_hash(entry):
     """Create unique hash for article"""
     title = entry.get('title', '')
     link = entry.get('link', '')
     return hashlib.md5(f"{title}{link}".encode()).hexdigest()
 
-def on_connect(client, userdata, flags, rc):
-    """MQTT connection callback"""
-    if rc == 0:
-        log("Connected to MQTT Broker")
-    else:
-        log(f"Failed to connect, return code {rc}")
-
 def publish_time(client):
     """Publish current time to MQTT"""
-    current_time = datetime.now().strftime("%H:%M")
+    current_time = clock.now().strftime("%H:%M")
     client.publish(MQTT_TOPIC_TIME, current_time, retain=True)
     log(f"Published time: {current_time}")
 
 def publish_seconds(client):
     """Publish current seconds to MQTT (not retained)"""
-    current_seconds = datetime.now().strftime("%S")
-    client.publish(MQTT_TOPIC_SECONDS, current_seconds, retain=False)
+    current_seconds = clock.now().strftime("%S")
+    client.publish(MQTT_TOPIC_SECONDS, current_seconds, retain=False, expiry=MQTT_SECONDS_EXPIRY)
 
 def publish_date_info(client):
     """Publish all date-related information"""
-    now = datetime.now()
+    now = clock.now()
 
     # Day of week (Slovak)
     dow_index = now.weekday()
@@ -260,7 +430,7 @@ def check_and_publish_time(client):
     """Check if minute changed and publish time"""
     global last_time_minute
 
-    current_minute = datetime.now().minute
+    current_minute = clock.now().minute
 
     if current_minute != last_time_minute:
         last_time_minute = current_minute
@@ -273,7 +443,7 @@ def check_and_publish_seconds(client):
     """Check if second changed and publish seconds"""
     global last_time_second
 
-    current_second = datetime.now().second
+    current_second = clock.now().second
 
     if current_second != last_time_second:
         last_time_second = current_second
@@ -286,7 +456,7 @@ def check_and_publish_date(client):
     """Check if date changed and publish date information"""
     global last_date
 
-    current_date = datetime.now().date()
+    current_date = clock.now().date()
 
     if current_date != last_date:
         last_date = current_date
@@ -299,11 +469,11 @@ def check_and_publish_year(client):
     """Check if year changed and publish year"""
     global last_year
 
-    current_year = datetime.now().year
+    current_year = clock.now().year
 
     if current_year != last_year:
         last_year = current_year
-        year = datetime.now().strftime("%Y")
+        year = clock.now().strftime("%Y")
         client.publish(MQTT_TOPIC_YEAR, year, retain=True)
         log(f"Published year: {year}")
         return True
@@ -329,155 +499,736 @@ def clear_old_topics(client):
     for topic in old_topics:
         client.publish(topic, "", retain=True)
 
-def publish_article(client, feed_name, category, entry):
-    """Publish article to MQTT as plain text across multiple topics with retain flag"""
-    # Clean and prepare data
-    headline = clean_text(entry.get('title', 'No title'))
-    content = clean_text(entry.get('description', entry.get('summary', 'No content available')))
-    link = entry.get('link', '')
-    published = entry.get('published', '')
-
-    # Limit content length
-    if len(content) > 500:
-        content = content[:497] + "..."
-
-    # Publish to separate topics as plain text with retain flag
-    # Note: Just publish feed_name without (Tech) or (News) suffix
-    client.publish(MQTT_TOPIC_HEADLINE, headline, retain=True)
-    client.publish(MQTT_TOPIC_CONTENT, content, retain=True)
-    client.publish(MQTT_TOPIC_SOURCE, feed_name, retain=True)
-    client.publish(MQTT_TOPIC_LINK, link, retain=True)
-    client.publish(MQTT_TOPIC_PUBLISH, published, retain=True)
+def channel_topic(topic, channel_name):
+    """Move a news/* topic into a channel's news/<name>/* namespace"""
+    if not channel_name:
+        return topic
+    return topic.replace("news/", f"news/{channel_name}/", 1)
 
-    log(f"Published from {feed_name}: {headline[:60]}...")
+def publish_article(client, article, channel_name="", profile_names=None):
+    """Publish article to MQTT as plain text across multiple topics with retain flag"""
+    # Only renditions still in the cache are published, with the key if any is left
+    renditions = image_cache.renditions(article.get('image')) if image_cache else {}
+    image = article.get('image') if any(renditions.values()) else ''
+
+    for profile_name in profile_names or DEFAULT_OUTPUT_PROFILES:
+        rendering = article['renderings'][profile_name]
+        prefix = OUTPUT_PROFILES[profile_name].get('topic_prefix', '')
+
+        if PUBLISH_COMPOUND_ARTICLE:
+            # One consistent snapshot instead of five messages that can interleave
+            compound = {
+                'headline': rendering['headline'],
+                'content': rendering['content'],
+                'source': article['source'],
+                'category': article['category'],
+                'link': article['link'],
+                'published': article['published'],
+                'image': image
+            }
+            client.publish(prefix + channel_topic(MQTT_TOPIC_ARTICLE, channel_name),
+                           json.dumps(compound, ensure_ascii=False), qos=MQTT_QOS, retain=True)
+
+        if PUBLISH_SPLIT_TOPICS:
+            # Publish to separate topics as plain text with retain flag
+            # Note: Just publish feed_name without (Tech) or (News) suffix
+            client.publish(prefix + channel_topic(MQTT_TOPIC_HEADLINE, channel_name), rendering['headline'], qos=MQTT_QOS, retain=True)
+            client.publish(prefix + channel_topic(MQTT_TOPIC_CONTENT, channel_name), rendering['content'], qos=MQTT_QOS, retain=True)
+            client.publish(prefix + channel_topic(MQTT_TOPIC_SOURCE, channel_name), article['source'], qos=MQTT_QOS, retain=True)
+            client.publish(prefix + channel_topic(MQTT_TOPIC_LINK, channel_name), article['link'], qos=MQTT_QOS, retain=True)
+            client.publish(prefix + channel_topic(MQTT_TOPIC_PUBLISH, channel_name), article['published'], qos=MQTT_QOS, retain=True)
+
+    if image_cache:
+        image_topic = channel_topic(MQTT_TOPIC_IMAGE, channel_name)
+        client.publish(image_topic, image, qos=MQTT_QOS, retain=True)
+        for profile_name, url in renditions.items():
+            client.publish(f"{image_topic}/{profile_name}", url, qos=MQTT_QOS, retain=True)
+
+    channel_label = f"[{channel_name}] " if channel_name else ""
+    log(f"{channel_label}Published from {article['source']}: {article['headline'][:60]}...")
 
 def fetch_feed(feed):
-    """Fetch and parse RSS feed"""
+    """Download raw RSS document"""
     try:
-        parsed = feedparser.parse(feed['url'])
-        if parsed.entries:
-            return parsed.entries
-        return []
+        request = urllib.request.Request(feed['url'], headers={'User-Agent': FETCH_USER_AGENT})
+        with urllib.request.urlopen(request, timeout=FETCH_TIMEOUT) as response:
+            return response.read()
     except Exception as e:
         log(f"Error fetching {feed['name']}: {e}")
-        return []
+        return None
+
+def fetch_simulated_feed(feed):
+    """Generate a synthetic RSS document for simulation mode - one new story per virtual hour"""
+    now = clock.now()
+    items = []
+    for age in range(10):
+        stamp = (now - timedelta(hours=age)).strftime("%Y-%m-%d %H:00")
+        items.append(
+            f"<item><title>{feed['name']} story {stamp}</title>"
+            f"<link>{feed['url']}#{stamp}</link>"
+            f"<description>Simulated article published by {feed['name']} at {stamp}</description>"
+            f"<pubDate>{stamp}</pubDate></item>"
+        )
+    return f"<rss version=\"2.0\"><channel><title>{feed['name']}</title>{''.join(items)}</channel></rss>"
+
+# Swapped for fetch_simulated_feed in simulation mode
+feed_fetcher = fetch_feed
+
+# Ingest pipeline
+#
+# A stage is a generator function stage(ctx, stream) that consumes items from the
+# upstream iterator and yields items downstream. Entries stream through one at a
+# time; nothing is collected into lists between stages.
+
+def stage_fetch(ctx, feeds):
+    """feed -> (feed, raw document)"""
+    for feed in feeds:
+        started = time.perf_counter()
+        document = feed_fetcher(feed)
+        record_fetch(feed, document is not None and len(document) > 0, time.perf_counter() - started)
+        if document:
+            yield feed, document
+
+def stage_parse(ctx, documents):
+    """(feed, raw document) -> (feed, entry)"""
+    for feed, document in documents:
+        parsed = feedparser.parse(document)
+        if parsed.bozo and not parsed.entries:
+            log(f"Error parsing {feed['name']}: {parsed.get('bozo_exception')}")
+            continue
+        feed_entries_cache[feed['name']] = []
+        for entry in parsed.entries[:ENTRIES_PER_FEED]:
+            yield feed, entry
+
+def get_article_timestamp(entry):
+    """Publication time of an entry as a Unix timestamp, falling back to now"""
+    published = entry.get('published_parsed') or entry.get('updated_parsed')
+    if published:
+        return min(calendar.timegm(published), clock.time())
+    return clock.time()
+
+def normalize_entry(feed, entry, article_hash):
+    """Build the normalized article record for a feed entry"""
+    title = entry.get('title', 'No title')
+    content = entry.get('description', entry.get('summary', 'No content available'))
+
+    return {
+        'hash': article_hash,
+        'source': feed['name'],
+        'category': feed['category'],
+        'headline': clean_text(title, "unicode"),
+        'content': clean_text(content, "unicode"),
+        'renderings': render_profiles(title, content),
+        'link': entry.get('link', ''),
+        'published': entry.get('published', ''),
+        'timestamp': get_article_timestamp(entry),
+        'entry': entry
+    }
+
+def stage_normalize(ctx, entries):
+    """(feed, entry) -> article, cached for rotation"""
+    for feed, entry in entries:
+        article_hash = get_article_hash(entry)
+        article = article_store.get(article_hash)
+        if article is None:
+            article = normalize_entry(feed, entry, article_hash)
+            article_store[article_hash] = article
+        feed_entries_cache[feed['name']].append(article)
+        yield article
+
+def stage_dedupe(ctx, articles):
+    """Drop articles that were already published"""
+    for article in articles:
+        if article['hash'] in seen_articles:
+            continue
+        seen_articles.add(article['hash'])
+        yield article
+
+def stage_enrich(ctx, articles):
+    """Run every registered enricher over each new article"""
+    for article in articles:
+        for enricher in ENRICHERS:
+            enricher(ctx, article)
+        yield article
+
+def stage_route(ctx, articles):
+    """article -> (sink, article) for every sink accepting the article"""
+    for article in articles:
+        for sink in SINKS:
+            accepts = sink.get('accepts')
+            if accepts is None or accepts(article):
+                yield sink, article
+
+def stage_publish(ctx, routed):
+    """Hand each routed article to its sink"""
+    for sink, article in routed:
+        sink['send'](ctx, article)
+        yield article
+
+def enrich_image(ctx, article):
+    """Attach the cache key of the article's thumbnail, downloading and rendering it once"""
+    url = find_image_url(article['entry'])
+    article['image'] = image_cache.process(url) if url else None
+
+def setup_images():
+    """Enable the image enricher if configured and Pillow is available"""
+    global image_cache
+
+    if not IMAGES_ENABLED:
+        return
+    if Image is None:
+        log("IMAGES_ENABLED is set but Pillow is not installed - images disabled")
+        return
 
-def check_for_new_articles(client):
-    """Check all feeds for new articles"""
-    new_articles_found = False
+    image_cache = ImageCache(IMAGE_CACHE_DIR, IMAGE_CACHE_MAX_BYTES, PANEL_PROFILES,
+                             url_base=IMAGE_URL_BASE, log=log)
+    ENRICHERS.append(enrich_image)
+    log(f"Image cache enabled: {len(image_cache.cache)} files in {image_cache.cache.directory}")
 
-    for feed in RSS_FEEDS:
-        entries = fetch_feed(feed)
+def setup_fulltext():
+    """Enable full article text extraction if configured"""
+    global article_text
+
+    if not FULLTEXT_ENABLED:
+        return
+    article_text = ArticleTextCache(FULLTEXT_CACHE_DIR, FULLTEXT_CACHE_MAX_BYTES,
+                                    workers=FULLTEXT_WORKERS, per_host=FULLTEXT_PER_HOST, log=log)
+    log(f"Full-text cache enabled: {len(article_text.cache)} articles in {article_text.cache.directory}")
 
-        # Store entries in cache for rotation
-        feed_entries_cache[feed['name']] = entries
+def expand_article(article):
+    """Swap a teaser for the extracted article text once it is cached, else request it"""
+    if 'full_text' in article or len(article['content']) >= FULLTEXT_MIN_CONTENT:
+        return
+    text = article_text.get(article['link'])
+    if text is None:
+        article_text.request(article['link'])
+        return
 
-        # Check for new articles
-        for entry in entries[:5]:  # Check top 5 entries only
-            article_hash = get_article_hash(entry)
+    article['full_text'] = text
+    if len(text) > len(article['content']):
+        article['content'] = clean_text(text, "unicode")
+        article['renderings'] = render_profiles(article['entry'].get('title', 'No title'), text)
+
+def enrich_watchlist(ctx, article):
+    """Attach the watchlist terms mentioned in the headline or content"""
+    article['alerts'] = watchlists.match(article['headline'], article['content'])
+
+def alert_sink(ctx, article):
+    """Publish an alert for every watchlist the article matched"""
+    client = ctx['client']
+    for name, terms in article['alerts'].items():
+        alert = json.dumps({
+            'watchlist': name,
+            'terms': terms,
+            'headline': article['headline'],
+            'source': article['source'],
+            'link': article['link'],
+            'published': article['published']
+        }, ensure_ascii=False)
+        # Not retained: an alert is an event, it must not replay to every new subscriber
+        client.publish(MQTT_TOPIC_ALERT, alert, qos=MQTT_QOS, retain=False)
+        client.publish(f"{MQTT_TOPIC_ALERT}/{name}", alert, qos=MQTT_QOS, retain=False)
+        log(f"Alert [{name}] {', '.join(terms)}: {article['headline'][:60]}")
+
+def setup_watchlists():
+    """Enable watchlist alerts if a watchlist file is configured"""
+    global watchlists
+
+    if not WATCHLIST_FILE:
+        return
+    watchlists = Watchlists(WATCHLIST_FILE, log=log)
+    watchlists.refresh()
+    ENRICHERS.append(enrich_watchlist)
+    SINKS.append({"name": "alerts", "send": alert_sink, "accepts": lambda article: article.get('alerts')})
+
+def mqtt_sink(ctx, article):
+    """Default sink - queue the article for a display slot in every channel that wants it"""
+    for channel in rotation_channels:
+        if channel.accepts(article):
+            channel.queue.push(article)
+
+INGEST_STAGES = [
+    ("fetch", stage_fetch),
+    ("parse", stage_parse),
+    ("normalize", stage_normalize),
+    ("dedupe", stage_dedupe),
+    ("enrich", stage_enrich),
+    ("route", stage_route),
+    ("publish", stage_publish),
+]
 
-            if article_hash not in seen_articles:
-                seen_articles.add(article_hash)
-                publish_article(client, feed['name'], feed['category'], entry)
-                new_articles_found = True
+# enricher(ctx, article) callables run by the enrich stage
+ENRICHERS = []
 
-    return new_articles_found
+# Output sinks: {'name', 'send': send(ctx, article), 'accepts': optional predicate}
+SINKS = [
+    {"name": "mqtt", "send": mqtt_sink},
+]
 
-def rotate_feeds(client):
-    """Rotate through cached feed entries every 6 seconds"""
-    global current_feed_index
+# Per-stage instrumentation of the last run and since start
+stage_stats = {}
 
-    if not feed_entries_cache:
-        return
+def add_stage(name, stage, after):
+    """Insert a custom stage (e.g. a filter) after an existing one"""
+    names = [stage_name for stage_name, _ in INGEST_STAGES]
+    INGEST_STAGES.insert(names.index(after) + 1, (name, stage))
 
-    # Get current feed
-    feed = RSS_FEEDS[current_feed_index]
-    feed_name = feed['name']
+def timed_stage(name, stream, timings):
+    """Wrap a stage iterator and accumulate the time spent pulling items from it"""
+    items = 0
+    elapsed = 0.0
+    try:
+        while True:
+            started = time.perf_counter()
+            try:
+                item = next(stream)
+            except StopIteration:
+                return
+            finally:
+                elapsed += time.perf_counter() - started
+            items += 1
+            yield item
+    finally:
+        timings[name] = (elapsed, items)
+
+def run_pipeline(ctx, source):
+    """Drive the source through all stages and record per-stage cost"""
+    timings = {}
+    stream = iter(source)
+    for name, stage in INGEST_STAGES:
+        stream = timed_stage(name, stage(ctx, stream), timings)
+
+    published = 0
+    for _ in stream:
+        published += 1
+
+    # Each wrapper's time includes everything upstream of it - subtract to get per-stage cost
+    upstream = 0.0
+    report = []
+    for name, _ in INGEST_STAGES:
+        inclusive, items = timings.get(name, (0.0, 0))
+        own = max(inclusive - upstream, 0.0)
+        upstream = inclusive
+        totals = stage_stats.setdefault(name, {'runs': 0, 'items': 0, 'seconds': 0.0})
+        totals['runs'] += 1
+        totals['items'] += items
+        totals['seconds'] += own
+        totals['last_items'] = items
+        totals['last_seconds'] = own
+        report.append(f"{name} {own * 1000:.1f}ms/{items}")
+
+    log(f"Pipeline: {', '.join(report)}")
+    return published
+
+def record_fetch(feed, ok, seconds):
+    health = feed_health.setdefault(feed['name'], {'ok': False, 'failures': 0, 'last_ok': None})
+    health['ok'] = ok
+    health['failures'] = 0 if ok else health['failures'] + 1
+    health['last_attempt'] = clock.time()
+    health['duration_ms'] = round(seconds * 1000, 1)
+    if ok:
+        health['last_ok'] = clock.time()
+
+def record_tick(seconds):
+    """Account the time one main loop iteration kept the loop busy"""
+    loop_stats['ticks'] += 1
+    loop_stats['seconds'] += seconds
+    loop_stats['max'] = max(loop_stats['max'], seconds)
+
+def publish_stats(client):
+    """Publish the retained rss-mqtt/stats snapshot read by the status tools"""
+    for name, health in feed_health.items():
+        health['entries'] = len(feed_entries_cache.get(name, []))
+
+    caches = {'articles': len(article_store), 'seen': len(seen_articles)}
+    if image_cache:
+        caches['images'] = image_cache.cache.stats()
+    if article_text:
+        caches['fulltext'] = article_text.stats()
+
+    ticks = loop_stats['ticks']
+    stats = {
+        'time': clock.time(),
+        'uptime': int(clock.time() - started_at) if started_at else 0,
+        'feeds': feed_health,
+        'caches': caches,
+        'loop': {
+            'ticks': ticks,
+            'avg_ms': round(loop_stats['seconds'] * 1000 / ticks, 2) if ticks else 0.0,
+            'max_ms': round(loop_stats['max'] * 1000, 2)
+        },
+        'stages': stage_stats,
+        'brokers': client.health() if hasattr(client, 'health') else [],
+        'ha': election.health() if election else None
+    }
+    client.publish(MQTT_TOPIC_STATS, json.dumps(stats), retain=True)
+    loop_stats.update(ticks=0, seconds=0.0, max=0.0)
 
-    # Get entries from cache
-    entries = feed_entries_cache.get(feed_name, [])
+def check_for_new_articles(client):
+    """Check all feeds for new articles"""
+    if watchlists:
+        watchlists.refresh()
+
+    published = run_pipeline({'client': client}, RSS_FEEDS)
+
+    # Forget normalized articles that dropped out of every feed
+    current = {article['hash'] for articles in feed_entries_cache.values() for article in articles}
+    for article_hash in list(article_store):
+        if article_hash not in current:
+            del article_store[article_hash]
+
+    publish_stats(client)
+    return published > 0
+
+class RotationQueue:
+    """Priority queue deciding which cached article gets the next display slot
+
+    Lower scores are shown first. Unseen articles get a bonus, every display and
+    every hour of age adds a penalty, and so does each recent slot taken by the
+    same source. Scores are recomputed lazily when an entry reaches the top of the
+    heap; only when that entry's fresh score is worse than the next stored one is
+    the heap rebuilt with current scores, at most once per pop.
+    """
+
+    def __init__(self):
+        self.heap = []
+        self.counter = itertools.count()
+        self.shown_counts = {}
+        self.recent_sources = deque(maxlen=ROTATION_FAIRNESS_WINDOW)
+        self.last_shown = None
+
+    def __len__(self):
+        return len(self.heap)
+
+    def score(self, article):
+        shown = self.shown_counts.get(article['hash'], 0)
+        age_hours = max(clock.time() - article['timestamp'], 0) / 3600
+        score = (shown * ROTATION_SHOWN_WEIGHT
+                 + age_hours * ROTATION_FRESHNESS_WEIGHT
+                 + self.recent_sources.count(article['source']) * ROTATION_FAIRNESS_WEIGHT)
+        if shown == 0:
+            score -= ROTATION_UNSEEN_BONUS
+        return score
+
+    def push(self, article):
+        heapq.heappush(self.heap, (self.score(article), next(self.counter), article['hash']))
+
+    def pop(self):
+        """Remove and return the article that should be displayed next"""
+        rescored = False
+        while self.heap:
+            _, order, article_hash = heapq.heappop(self.heap)
+            article = article_store.get(article_hash)
+            if article is None:
+                # Dropped out of its feed since it was queued
+                self.shown_counts.pop(article_hash, None)
+                continue
+            score = self.score(article)
+            if not rescored and self.heap and score > self.heap[0][0]:
+                # Stale priorities - once everything has aged, every stored score is;
+                # refresh them all once, after which the head is the real best entry
+                self.heap.append((score, order, article_hash))
+                self.rescore()
+                rescored = True
+                continue
+            return article
+        return None
+
+    def rescore(self):
+        """Recompute every score and rebuild the heap, dropping articles no longer stored"""
+        entries = []
+        for _, order, article_hash in self.heap:
+            article = article_store.get(article_hash)
+            if article is None:
+                self.shown_counts.pop(article_hash, None)
+                continue
+            entries.append((self.score(article), order, article_hash))
+        heapq.heapify(entries)
+        self.heap = entries
+
+    def peek(self):
+        """Article at the head of the queue, probably the next one shown"""
+        if self.heap:
+            return article_store.get(self.heap[0][2])
+        return None
+
+    def shown(self, article):
+        """Record a display and put the article back into the rotation"""
+        self.shown_counts[article['hash']] = self.shown_counts.get(article['hash'], 0) + 1
+        self.recent_sources.append(article['source'])
+        self.last_shown = article['hash']
+        self.push(article)
+
+class RotationChannel:
+    """One display channel - a filtered view of the shared article store with its own pace"""
+
+    def __init__(self, config):
+        self.name = config.get('name', '')
+        self.categories = set(config.get('categories') or [])
+        self.sources = set(config.get('sources') or [])
+        self.interval = config.get('interval', ROTATION_INTERVAL)
+        self.profiles = config.get('profiles') or DEFAULT_OUTPUT_PROFILES
+        self.queue = RotationQueue()
+        self.last_rotation = 0
+
+    def accepts(self, article):
+        if self.categories and article['category'] not in self.categories:
+            return False
+        if self.sources and article['source'] not in self.sources:
+            return False
+        return True
 
-    if entries:
-        publish_article(client, feed_name, feed['category'], entries[0])
+def setup_channels():
+    """Create the rotation channels and seed them from the shared article store"""
+    global rotation_channels
+
+    rotation_channels = [RotationChannel(config) for config in ROTATION_CHANNELS]
+    for channel in rotation_channels:
+        label = f"news/{channel.name + '/' if channel.name else ''}*"
+        unknown = [name for name in channel.profiles if name not in OUTPUT_PROFILES]
+        if unknown:
+            # Checked once here - publish_article would fail on every article
+            channel.profiles = [name for name in channel.profiles if name in OUTPUT_PROFILES] or DEFAULT_OUTPUT_PROFILES
+            log(f"Rotation channel {label}: unknown output profiles {', '.join(unknown)}, "
+                f"using {', '.join(channel.profiles)}")
+        for article in article_store.values():
+            if channel.accepts(article):
+                channel.queue.push(article)
+        log(f"Rotation channel {label}: every {channel.interval}s")
+
+def rotate_feeds(client, channel):
+    """Give the channel's next display slot to its highest priority article"""
+    article = channel.queue.pop()
+    if article is None:
+        return
 
-    # Move to next feed
-    current_feed_index = (current_feed_index + 1) % len(RSS_FEEDS)
+    if article_text:
+        expand_article(article)
+        # Start extracting the next article while this one is on screen
+        upcoming = channel.queue.peek()
+        if upcoming:
+            expand_article(upcoming)
 
-def main():
-    """Main application loop"""
-    global last_date, last_year
+    # Republishing what is already retained on the topics would be wasted
+    if article['hash'] != channel.queue.last_shown:
+        publish_article(client, article, channel.name, channel.profiles)
 
-    # Setup MQTT client
-    client = mqtt.Client()
-    client.on_connect = on_connect
+    channel.queue.shown(article)
 
-    log("Starting RSS to MQTT Publisher...")
-    log(f"Connecting to MQTT Broker at {MQTT_BROKER}:{MQTT_PORT}")
+def start_publishing(client):
+    """Publish initial state and fetch all feeds"""
+    global last_date, last_year, last_check_time, started_at
 
-    try:
-        client.connect(MQTT_BROKER, MQTT_PORT, 60)
-        client.loop_start()
-        time.sleep(2)  # Give time to connect
-    except Exception as e:
-        log(f"Error connecting to MQTT: {e}")
-        return
+    started_at = clock.time()
+    setup_channels()
 
     # Clear old retained messages
     clear_old_topics(client)
-    time.sleep(1)
+    clock.sleep(1)
 
     # Publish initial time and date information
     publish_time(client)
-    last_date = datetime.now().date()
-    last_year = datetime.now().year
+    last_date = clock.now().date()
+    last_year = clock.now().year
     publish_date_info(client)
 
+    setup_images()
+    setup_fulltext()
+    setup_watchlists()
+
     # Initial fetch of all feeds
     log("Performing initial feed fetch...")
     check_for_new_articles(client)
 
-    last_check_time = time.time()
-    last_rotation_time = time.time()
+    last_check_time = clock.time()
+    for channel in rotation_channels:
+        rotate_feeds(client, channel)
+        channel.last_rotation = last_check_time
 
-    log("Starting main loop...")
+def take_over(client):
+    """Publish the complete state right after becoming leader"""
+    global last_time_minute, last_time_second, last_date, last_year
 
-    try:
-        while True:
-            current_time = time.time()
+    log("HA: taking over publishing")
+    now = clock.now()
+    publish_seconds(client)
+    publish_time(client)
+    publish_date_info(client)
+    last_time_second = now.second
+    last_time_minute = now.minute
+    last_date = now.date()
+    last_year = now.year
+
+    for channel in rotation_channels:
+        channel.queue.last_shown = None  # the old leader's article is on the topics
+        rotate_feeds(client, channel)
+        channel.last_rotation = clock.time()
+
+def check_role(client):
+    """Follow leadership changes, returns True while this instance publishes"""
+    global publishing_active
+
+    leader = election.is_leader()
+    if leader and not publishing_active:
+        take_over(client)
+    elif not leader and publishing_active:
+        log("HA: standing by")
+        client.clear_retained()
+    publishing_active = leader
+    return leader
+
+def tick(client):
+    """One iteration of the main loop"""
+    global last_check_time
+
+    current_time = clock.time()
+
+    if election and not check_role(client):
+        # Standby - only keep the article cache warm
+        if current_time - last_check_time >= HA_STANDBY_FETCH_INTERVAL:
+            check_for_new_articles(client)
+            last_check_time = current_time
+        return
+
+    tick_clock(client)
+
+    # Check for new articles every FETCH_INTERVAL seconds
+    if current_time - last_check_time >= FETCH_INTERVAL:
+        check_for_new_articles(client)
+        last_check_time = current_time
+
+    tick_rotation(client, current_time)
+
+def tick_clock(client):
+    """Clock and calendar topics - each publishes only when its value changes"""
+    check_and_publish_seconds(client)
+    check_and_publish_time(client)
+    check_and_publish_date(client)
+    check_and_publish_year(client)
+
+def tick_rotation(client, current_time):
+    """Give every channel its next display slot once its interval has passed"""
+    for channel in rotation_channels:
+        if current_time - channel.last_rotation >= channel.interval:
+            rotate_feeds(client, channel)
+            channel.last_rotation = current_time
+
+class SimulatedBroker:
+    """Broker stand-in for simulation mode, counts publishes instead of sending them"""
+
+    def __init__(self):
+        self.message_count = 0
+        self.topic_counts = {}
+        self.retained = {}
+
+    def publish(self, topic, payload=None, qos=0, retain=False, expiry=None):
+        self.message_count += 1
+        self.topic_counts[topic] = self.topic_counts.get(topic, 0) + 1
+        if retain:
+            self.retained[topic] = payload
+
+def simulate(days, start=None, verbose=False):
+    """Replay virtual time as fast as possible against a broker stand-in"""
+    global clock, feed_fetcher, logging_enabled
+
+    clock = SimulatedClock(start or datetime.now().replace(microsecond=0))
+    feed_fetcher = fetch_simulated_feed
+    logging_enabled = verbose
+    broker = SimulatedBroker()
+
+    virtual_start = clock.now()
+    virtual_end = virtual_start + timedelta(days=days)
+    cpu_start = time.process_time()
+    wall_start = time.perf_counter()
+
+    start_publishing(broker)
+    while clock.now() < virtual_end:
+        tick(broker)
+        clock.sleep(1)
+
+    cpu_seconds = time.process_time() - cpu_start
+    wall_seconds = time.perf_counter() - wall_start
+    virtual_hours = (clock.now() - virtual_start).total_seconds() / 3600
+
+    logging_enabled = True
+    log(f"Simulated {virtual_hours:.0f} virtual hours "
+        f"({virtual_start:%Y-%m-%d %H:%M} - {clock.now():%Y-%m-%d %H:%M}) in {wall_seconds:.1f}s")
+    log(f"Messages that would be published: {broker.message_count} "
+        f"({broker.message_count / virtual_hours:.0f} per virtual hour)")
+    for topic, count in sorted(broker.topic_counts.items(), key=lambda item: -item[1]):
+        log(f"  {topic}: {count}")
+    log(f"Compute cost: {cpu_seconds * 1000 / virtual_hours:.2f} ms CPU per virtual hour")
+    for name, totals in stage_stats.items():
+        log(f"  stage {name}: {totals['seconds'] * 1000 / virtual_hours:.2f} ms per virtual hour, "
+            f"{totals['items']} items")
+
+    return broker
+
+def main():
+    """Main application loop"""
+    global election, publishing_active
 
-            # Check and publish seconds every iteration
-            check_and_publish_seconds(client)
+    log("Starting RSS to MQTT Publisher...")
 
-            # Check and publish time every second (publishes only when minute changes)
-            check_and_publish_time(client)
+    if HA_ENABLED:
+        election = LeaderElection(MQTT_BROKERS[0], HA_LOCK_TOPIC, HA_INSTANCE_ID,
+                                  keepalive=HA_KEEPALIVE, log=log)
+        election.start()
 
-            # Check and publish date (publishes only when date changes)
-            check_and_publish_date(client)
+    # One connection per broker - fetching and parsing still happen once
+    client = MQTTFanout(MQTT_BROKERS, log=log, protocol=MQTT_PROTOCOL,
+                        user_properties=MQTT_USER_PROPERTIES, alias_topics=MQTT_ALIAS_TOPICS,
+                        gate=election.is_leader if election else None)
+    if BRIDGE_ENABLED:
+        bridge = StateBridge(BRIDGE_HOST, BRIDGE_PORT, log=log)
+        client.add_listener(bridge.update)
+        bridge.start()
 
-            # Check and publish year (publishes only when year changes)
-            check_and_publish_year(client)
+    client.start()
+    time.sleep(2)  # Give time to connect
 
-            # Check for new articles every 60 seconds
-            if current_time - last_check_time >= 60:
-                check_for_new_articles(client)
-                last_check_time = current_time
+    if election:
+        publishing_active = election.is_leader()
+        log(f"HA: starting as {'leader' if publishing_active else 'standby'}")
 
-            # Rotate feeds every 6 seconds
-            if current_time - last_rotation_time >= 6:
-                rotate_feeds(client)
-                last_rotation_time = current_time
+    start_publishing(client)
 
-            time.sleep(1)
+    log("Starting main loop...")
+
+    try:
+        while True:
+            started = time.perf_counter()
+            tick(client)
+            record_tick(time.perf_counter() - started)
+            clock.sleep(1)
 
     except KeyboardInterrupt:
         log("Shutting down...")
-        client.loop_stop()
-        client.disconnect()
+        if election:
+            election.stop()
+        client.stop()
     except Exception as e:
         log(f"Error in main loop: {e}")
-        client.loop_stop()
-        client.disconnect()
+        if election:
+            election.stop()
+        client.stop()
         raise
 
+def parse_args():
+    """Parse command line arguments"""
+    parser = argparse.ArgumentParser(description="RSS to MQTT Publisher")
+    parser.add_argument("--simulate", type=float, metavar="DAYS",
+                        help="fast-forward DAYS of virtual time against a broker stand-in and report")
+    parser.add_argument("--start", metavar="'YYYY-MM-DD HH:MM:SS'",
+                        help="virtual start time for --simulate (default: now)")
+    parser.add_argument("--verbose", action="store_true",
+                        help="log every simulated publish")
+    return parser.parse_args()
+
 if __name__ == "__main__":
-    main()
+    args = parse_args()
+    if args.simulate:
+        start = datetime.strptime(args.start, "%Y-%m-%d %H:%M:%S") if args.start else None
+        simulate(args.simulate, start, args.verbose)
+    else:
+        main()
@@ -0,0 +1,213 @@
+#!/usr/bin/env python3
+"""
+Single-process runtime for the news, clock/date and calendar publishers
+One MQTT fan-out, one HTTP session and one asyncio scheduler instead of two services
+"""
+
+import os
+import sys
+import time
+import asyncio
+import argparse
+import threading
+
+import requests
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "calendar"))
+
+import rss_mqtt_publisher as news
+import gcal_caldav_simple as calendar_source
+from mqtt_fanout import MQTTFanout
+from state_bridge import StateBridge
+
+MQTT_BROKERS = news.MQTT_BROKERS
+STATS_INTERVAL = 600  # seconds between resource usage log lines
+
+log = news.log
+
+def process_stats(pid="self"):
+    """Resident memory (kB) and context switches of a process, summed over its threads"""
+    rss_kb = 0
+    switches = 0
+    with open(f"/proc/{pid}/status") as f:
+        for line in f:
+            if line.startswith("VmRSS:"):
+                rss_kb = int(line.split()[1])
+    for task in os.listdir(f"/proc/{pid}/task"):
+        try:
+            with open(f"/proc/{pid}/task/{task}/status") as f:
+                for line in f:
+                    if line.startswith(("voluntary_ctxt_switches:", "nonvoluntary_ctxt_switches:")):
+                        switches += int(line.split()[1])
+        except OSError:
+            pass  # thread exited
+    return rss_kb, switches
+
+class Runtime:
+    """Hosts the sources as modules on one event loop
+
+    Every wakeup is aligned to the start of a second and serves the clock topics,
+    the news rotation and any due calendar update together. Network I/O runs in
+    the default executor through the shared session, and so does the news check
+    (parsing, images, full text), so a slow feed never delays the clock. A failed
+    iteration is logged and retried; it never stops the other loops.
+    """
+
+    def __init__(self, client, session):
+        self.client = client
+        self.session = session
+        self.calendar_state = calendar_source.CalendarState(calendar_source.load_calendar_sources())
+        self.documents = {}
+        self.calendar_update = None
+        self.news_lock = threading.Lock()  # article store and rotation queues, shared with the news check
+        self.wakeups = 0
+
+    def fetch_document(self, feed):
+        """Fetch a feed through the shared session, returns raw bytes or None"""
+        try:
+            response = self.session.get(feed['url'], timeout=news.FETCH_TIMEOUT)
+            response.raise_for_status()
+            return response.content
+        except Exception as e:
+            log(f"Error fetching {feed['name']}: {e}")
+            return None
+
+    async def fetch_feeds(self):
+        """Fetch all feeds concurrently; the pipeline then reads them from memory"""
+        loop = asyncio.get_running_loop()
+        documents = await asyncio.gather(*(loop.run_in_executor(None, self.fetch_document, feed)
+                                           for feed in news.RSS_FEEDS))
+        self.documents = {feed['name']: document for feed, document in zip(news.RSS_FEEDS, documents)}
+
+    def prefetched(self, feed):
+        return self.documents.pop(feed['name'], None)
+
+    async def clock_loop(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            await asyncio.sleep(1.0 - time.time() % 1.0)
+            self.wakeups += 1
+            started = time.perf_counter()
+            news.tick_clock(self.client)
+            if self.news_lock.acquire(blocking=False):
+                # While a news check holds the queues the slot is simply taken a second later
+                try:
+                    news.tick_rotation(self.client, news.clock.time())
+                finally:
+                    self.news_lock.release()
+            next_change = self.calendar_state.next_change
+            change_due = next_change and calendar_source.clock.now() >= next_change
+            if change_due and (self.calendar_update is None or self.calendar_update.done()):
+                # Pushes to Živý obraz over HTTP, so it runs beside the loop
+                self.calendar_update = loop.run_in_executor(None, calendar_source.check_changes,
+                                                            self.client, self.calendar_state)
+            news.record_tick(time.perf_counter() - started)
+
+    def check_news(self):
+        with self.news_lock:
+            news.check_for_new_articles(self.client)
+
+    async def news_loop(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            await asyncio.sleep(news.FETCH_INTERVAL)
+            try:
+                await self.fetch_feeds()
+                await loop.run_in_executor(None, self.check_news)
+            except Exception as e:
+                log(f"Error checking news: {e}")
+            news.last_check_time = news.clock.time()
+
+    async def calendar_loop(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            try:
+                # Calendars are parsed while they download, so both stay off the loop
+                await loop.run_in_executor(None, calendar_source.fetch_calendar, self.client, self.calendar_state)
+                due = (self.calendar_state.next_fetch - calendar_source.clock.now()).total_seconds()
+            except Exception as e:
+                log(f"Error updating calendar: {e}")
+                with self.calendar_state.lock:
+                    calendar_source.publish_changed(self.client, self.calendar_state,
+                                                    calendar_source.MQTT_TOPIC_STATUS, f"error: {e}")
+                due = calendar_source.FETCH_RETRY_INTERVAL
+            await asyncio.sleep(max(1.0, due))
+
+    async def stats_loop(self):
+        _, last_switches = process_stats()
+        last_wakeups = self.wakeups
+        while True:
+            await asyncio.sleep(STATS_INTERVAL)
+            rss_kb, switches = process_stats()
+            log(f"Runtime: RSS {rss_kb / 1024:.1f} MB, "
+                f"{(switches - last_switches) / STATS_INTERVAL:.1f} thread wakeups/s, "
+                f"{(self.wakeups - last_wakeups) / STATS_INTERVAL:.1f} scheduler wakeups/s")
+            last_switches, last_wakeups = switches, self.wakeups
+
+    async def run(self):
+        news.feed_fetcher = self.prefetched
+        await self.fetch_feeds()
+        news.start_publishing(self.client)
+        self.client.publish(calendar_source.MQTT_TOPIC_STATUS, "running", retain=True)
+
+        await asyncio.gather(self.clock_loop(), self.news_loop(), self.calendar_loop(), self.stats_loop())
+
+def measure(pids, seconds):
+    """Print resident memory and wakeups per second of running processes"""
+    before = {pid: process_stats(pid) for pid in pids}
+    time.sleep(seconds)
+    total_kb = 0
+    total_rate = 0.0
+    for pid in pids:
+        rss_kb, switches = process_stats(pid)
+        rate = (switches - before[pid][1]) / seconds
+        with open(f"/proc/{pid}/cmdline") as f:
+            command = f.read().replace('\0', ' ').strip()
+        print(f"{pid:>7}  {rss_kb / 1024:6.1f} MB  {rate:6.1f} wakeups/s  {command[:60]}")
+        total_kb += rss_kb
+        total_rate += rate
+    if len(pids) > 1:
+        print(f"{'total':>7}  {total_kb / 1024:6.1f} MB  {total_rate:6.1f} wakeups/s")
+
+def main():
+    # One log for every module
+    calendar_source.log = news.log
+
+    session = requests.Session()
+    session.headers['User-Agent'] = news.FETCH_USER_AGENT
+    calendar_source.http = session
+
+    log("Starting unified runtime (news, clock, calendar)...")
+    if news.HA_ENABLED:
+        log("HA_ENABLED is not supported by the unified runtime - running as the only publisher")
+
+    client = MQTTFanout(MQTT_BROKERS, log=log, protocol=news.MQTT_PROTOCOL,
+                        user_properties=news.MQTT_USER_PROPERTIES,
+                        alias_topics=news.MQTT_ALIAS_TOPICS + calendar_source.MQTT_ALIAS_TOPICS)
+    if news.BRIDGE_ENABLED:
+        bridge = StateBridge(news.BRIDGE_HOST, news.BRIDGE_PORT, log=log)
+        client.add_listener(bridge.update)
+        bridge.start()
+    client.start()
+    time.sleep(2)  # Give time to connect
+
+    try:
+        asyncio.run(Runtime(client, session).run())
+    except KeyboardInterrupt:
+        log("Shutting down...")
+    finally:
+        client.stop()
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="News, clock and calendar publishers in one process")
+    parser.add_argument("--measure", type=float, metavar="SECONDS",
+                        help="report memory and wakeups/s of the given PIDs over SECONDS and exit")
+    parser.add_argument("pids", nargs="*", help="processes to measure, e.g. $(pgrep -f rss_mqtt_publisher)")
+    return parser.parse_args()
+
+if __name__ == "__main__":
+    args = parse_args()
+    if args.measure:
+        measure(args.pids or [str(os.getpid())], args.measure)
+    else:
+        main()
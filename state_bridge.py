@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+"""
+HTTP state bridge for browser dashboards
+Serves the current topic values as JSON and streams changes as Server-Sent Events,
+straight from the publisher's memory - no broker WebSocket listener needed
+"""
+
+import json
+import asyncio
+import threading
+from datetime import datetime
+
+DEFAULT_PREFIXES = ("news/", "today/", "calendar/")
+CLIENT_QUEUE_SIZE = 64  # frames buffered per client before it is resynced with a snapshot
+HEARTBEAT_INTERVAL = 15
+
+def default_log(message):
+    timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    print(f"[{timestamp}] {message}", flush=True)
+
+class StateBridge:
+    """Embedded asyncio HTTP server: GET /state for a snapshot, GET /events for SSE
+
+    Every update is serialized once into a shared frame that all clients get. A
+    client whose queue is full has its backlog replaced by one snapshot frame, so
+    slow dashboards cost bounded memory and never hold up the others.
+    """
+
+    def __init__(self, host="0.0.0.0", port=8080, prefixes=DEFAULT_PREFIXES,
+                 queue_size=CLIENT_QUEUE_SIZE, log=None):
+        self.host = host
+        self.port = port
+        self.prefixes = tuple(prefixes)
+        self.queue_size = queue_size
+        self.log = log or default_log
+
+        self.state = {}
+        self.version = 0
+        self.snapshot_cache = None  # (version, json bytes)
+        self.clients = set()
+        self.frames = 0
+        self.resyncs = 0
+        self.loop = None
+
+    def start(self):
+        thread = threading.Thread(target=self.run, name="state-bridge", daemon=True)
+        thread.start()
+
+    def run(self):
+        self.loop = asyncio.new_event_loop()
+        try:
+            server = self.loop.run_until_complete(asyncio.start_server(self.handle, self.host, self.port))
+        except OSError as e:
+            self.log(f"State bridge could not listen on {self.host}:{self.port}: {e}")
+            # update() checks the loop, so no callbacks pile up on one that never runs
+            loop, self.loop = self.loop, None
+            loop.close()
+            return
+        self.log(f"State bridge listening on http://{self.host}:{self.port}/state and /events")
+        self.loop.run_until_complete(server.serve_forever())
+
+    def update(self, topic, payload, retain=False):
+        """Publish hook, called from any thread"""
+        if self.loop is None or not topic.startswith(self.prefixes):
+            return
+        if isinstance(payload, bytes):
+            payload = payload.decode('utf-8', 'replace')
+        self.loop.call_soon_threadsafe(self.apply, topic, payload)
+
+    def apply(self, topic, payload):
+        if payload in (None, ""):
+            if self.state.pop(topic, None) is None:
+                return
+            payload = None
+        elif self.state.get(topic) == payload:
+            return
+        else:
+            self.state[topic] = payload
+        self.version += 1
+
+        if not self.clients:
+            return
+        data = json.dumps({'topic': topic, 'value': payload}, ensure_ascii=False)
+        frame = f"event: update\ndata: {data}\n\n".encode('utf-8')
+        self.frames += 1
+        for queue in self.clients:
+            try:
+                queue.put_nowait(frame)
+            except asyncio.QueueFull:
+                self.resync(queue)
+
+    def resync(self, queue):
+        """Drop a slow client's backlog in favour of the full current state"""
+        while not queue.empty():
+            queue.get_nowait()
+        queue.put_nowait(b"event: snapshot\ndata: " + self.snapshot() + b"\n\n")
+        self.resyncs += 1
+
+    def snapshot(self):
+        """Current state as JSON, encoded once per state version"""
+        if self.snapshot_cache is None or self.snapshot_cache[0] != self.version:
+            data = json.dumps(self.state, ensure_ascii=False, sort_keys=True).encode('utf-8')
+            self.snapshot_cache = (self.version, data)
+        return self.snapshot_cache[1]
+
+    async def handle(self, reader, writer):
+        try:
+            request_line = await asyncio.wait_for(reader.readline(), 10)
+            while (await asyncio.wait_for(reader.readline(), 10)).strip():
+                pass  # headers are not needed
+            parts = request_line.decode('latin-1').split()
+            method, path = (parts[0], parts[1].split('?')[0]) if len(parts) >= 2 else ("", "")
+
+            if method != "GET":
+                await self.respond(writer, "405 Method Not Allowed", "text/plain", b"GET only\n")
+            elif path == "/state":
+                await self.respond(writer, "200 OK", "application/json", self.snapshot())
+            elif path == "/events":
+                await self.stream(writer)
+            elif path == "/health":
+                await self.respond(writer, "200 OK", "application/json", json.dumps(self.health()).encode())
+            else:
+                await self.respond(writer, "404 Not Found", "text/plain", b"Not found\n")
+        except (asyncio.TimeoutError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    async def respond(self, writer, status, content_type, body):
+        writer.write(
+            f"HTTP/1.1 {status}\r\nContent-Type: {content_type}; charset=utf-8\r\n"
+            f"Content-Length: {len(body)}\r\nAccess-Control-Allow-Origin: *\r\n"
+            f"Cache-Control: no-cache\r\nConnection: close\r\n\r\n".encode('latin-1') + body)
+        await writer.drain()
+
+    async def stream(self, writer):
+        writer.write(b"HTTP/1.1 200 OK\r\nContent-Type: text/event-stream; charset=utf-8\r\n"
+                     b"Cache-Control: no-cache\r\nAccess-Control-Allow-Origin: *\r\n"
+                     b"Connection: keep-alive\r\n\r\n")
+        writer.write(b"event: snapshot\ndata: " + self.snapshot() + b"\n\n")
+        await writer.drain()
+
+        queue = asyncio.Queue(maxsize=self.queue_size)
+        self.clients.add(queue)
+        try:
+            while True:
+                try:
+                    frame = await asyncio.wait_for(queue.get(), HEARTBEAT_INTERVAL)
+                except asyncio.TimeoutError:
+                    frame = b": keepalive\n\n"
+                writer.write(frame)
+                await writer.drain()
+        finally:
+            self.clients.discard(queue)
+
+    def health(self):
+        return {
+            'clients': len(self.clients),
+            'topics': len(self.state),
+            'frames': self.frames,
+            'resyncs': self.resyncs
+        }
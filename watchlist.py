@@ -0,0 +1,184 @@
+#!/usr/bin/env python3
+"""
+Watchlist matching for article alerts
+All watchlist terms share one Aho-Corasick automaton, so an article is scanned once
+no matter how many terms are watched
+"""
+
+import os
+import unicodedata
+from collections import deque
+
+def normalize_for_match(text):
+    """Casefold and strip diacritics so 'Šimečka' matches 'simecka'"""
+    decomposed = unicodedata.normalize('NFKD', text.casefold())
+    return ''.join(c for c in decomposed if not unicodedata.combining(c))
+
+class AhoCorasick:
+    """Multi-pattern matcher that supports adding and removing patterns in place
+
+    Patterns live in a trie of dict nodes. Removing a pattern only clears its
+    output; adding one extends the trie and marks the failure links for a rebuild,
+    which happens lazily before the next search.
+    """
+
+    def __init__(self):
+        self.goto = [{}]        # node -> {char: node}
+        self.fail = [0]         # node -> longest proper suffix node
+        self.output = [None]    # node -> pattern ending here
+        self.dict_link = [0]    # node -> nearest suffix node with an output (0 = none)
+        self.terminals = {}     # pattern -> node
+        self.dirty = False
+
+    def __len__(self):
+        return len(self.terminals)
+
+    def __contains__(self, pattern):
+        return pattern in self.terminals
+
+    def add(self, pattern):
+        if not pattern or pattern in self.terminals:
+            return
+        node = 0
+        for char in pattern:
+            child = self.goto[node].get(char)
+            if child is None:
+                child = len(self.goto)
+                self.goto.append({})
+                self.fail.append(0)
+                self.output.append(None)
+                self.dict_link.append(0)
+                self.goto[node][char] = child
+                self.dirty = True
+            node = child
+        self.output[node] = pattern
+        self.terminals[pattern] = node
+        self.dirty = True
+
+    def remove(self, pattern):
+        node = self.terminals.pop(pattern, None)
+        if node is not None:
+            self.output[node] = None
+            self.dirty = True
+
+    def build(self):
+        """Recompute failure and dictionary links breadth-first"""
+        pending = deque()
+        for child in self.goto[0].values():
+            self.fail[child] = 0
+            self.dict_link[child] = 0
+            pending.append(child)
+
+        while pending:
+            node = pending.popleft()
+            for char, child in self.goto[node].items():
+                suffix = self.fail[node]
+                while suffix and char not in self.goto[suffix]:
+                    suffix = self.fail[suffix]
+                target = self.goto[suffix].get(char, 0)
+                self.fail[child] = target if target != child else 0
+                fail = self.fail[child]
+                self.dict_link[child] = fail if self.output[fail] is not None else self.dict_link[fail]
+                pending.append(child)
+
+        self.dirty = False
+
+    def search(self, text):
+        """Yield (end_index, pattern) for every occurrence in text"""
+        if self.dirty:
+            self.build()
+        goto, fail, output, dict_link = self.goto, self.fail, self.output, self.dict_link
+        node = 0
+        for index, char in enumerate(text):
+            while node and char not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(char, 0)
+            match = node if output[node] is not None else dict_link[node]
+            while match:
+                yield index, output[match]
+                match = dict_link[match]
+
+def parse_watchlists(text):
+    """Watchlist file: '[name]' section headers, one term per line, '#' comments"""
+    watchlists = {}
+    current = "default"
+    for line in text.splitlines():
+        line = line.split('#', 1)[0].strip()
+        if not line:
+            continue
+        if line.startswith('[') and line.endswith(']'):
+            current = line[1:-1].strip() or "default"
+            watchlists.setdefault(current, set())
+        else:
+            watchlists.setdefault(current, set()).add(line)
+    return watchlists
+
+class Watchlists:
+    """Watchlist file compiled into one automaton, updated when the file changes"""
+
+    def __init__(self, path, log=print):
+        self.path = os.path.expanduser(path)
+        self.log = log
+        self.matcher = AhoCorasick()
+        self.terms = {}  # normalized term -> {watchlist: original term}
+        self.mtime = None
+
+    def __len__(self):
+        return len(self.terms)
+
+    def refresh(self):
+        """Apply added and removed terms if the file was modified since the last load"""
+        try:
+            mtime = os.stat(self.path).st_mtime
+        except OSError:
+            mtime = None
+        if mtime == self.mtime:
+            return False
+        self.mtime = mtime
+
+        watchlists = {}
+        if mtime is not None:
+            try:
+                with open(self.path, encoding='utf-8') as f:
+                    watchlists = parse_watchlists(f.read())
+            except OSError as e:
+                self.log(f"Error reading watchlists {self.path}: {e}")
+                return False
+
+        terms = {}
+        for name, entries in watchlists.items():
+            for term in entries:
+                key = normalize_for_match(term)
+                if key:
+                    terms.setdefault(key, {})[name] = term
+
+        added = terms.keys() - self.terms.keys()
+        removed = self.terms.keys() - terms.keys()
+        for key in removed:
+            self.matcher.remove(key)
+        for key in added:
+            self.matcher.add(key)
+        self.terms = terms
+
+        self.log(f"Watchlists: {len(terms)} terms in {len(watchlists)} lists "
+                 f"(+{len(added)}/-{len(removed)})")
+        return True
+
+    def match(self, *texts):
+        """Whole-word matches in the texts as {watchlist: [terms]}"""
+        found = {}
+        if not self.terms:
+            return found
+        for text in texts:
+            normalized = normalize_for_match(text)
+            for end, key in self.matcher.search(normalized):
+                start = end - len(key) + 1
+                if start > 0 and normalized[start - 1].isalnum():
+                    continue
+                if end + 1 < len(normalized) and normalized[end + 1].isalnum():
+                    continue
+                for name, term in self.terms[key].items():
+                    matched = found.setdefault(name, [])
+                    if term not in matched:
+                        matched.append(term)
+        return found